@@ -0,0 +1,136 @@
+"""
+Biomass within a radius of each unit
+
+Every region is reduced to weighted points:
+	"centroid": one point per region, the area-weighted centroid, with weight 1
+	"area": the points of a regular lon/lat grid that fall inside the region (found with the spatial index),
+	        each with weight 1 / (number of grid points of the region), so a region cut by the circle
+	        contributes the fraction of its area inside it
+The distances of every unit to every point are computed at once with the haversine formula.
+When the unit x point matrix would have more than max_cells elements it is computed in chunks of units.
+"""
+import numpy as np
+import pandas as pd
+from matplotlib.patches import Ellipse
+from matplotlib.collections import PatchCollection
+
+from spatial_index import get_spatial_index
+
+earth_radius_km = 6371.0088
+max_cells = 2**24
+
+# {(region_type, sample_step): (store, lon, lat, positions)} grid points of the "area" mode and the region of each one
+grid_samples = dict()
+
+
+def haversine_matrix(lat1, lon1, lat2, lon2):
+	"""
+	Distance (km) between every point 1 (rows) and every point 2 (columns)
+	"""
+	lat1, lon1 = np.radians(np.asarray(lat1, dtype=float))[:, None], np.radians(np.asarray(lon1, dtype=float))[:, None]
+	lat2, lon2 = np.radians(np.asarray(lat2, dtype=float))[None, :], np.radians(np.asarray(lon2, dtype=float))[None, :]
+
+	a = np.sin((lat2 - lat1) / 2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2)**2
+	return 2 * earth_radius_km * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+def sample_grid(store, sample_step):
+	"""
+	Regular lon/lat grid over the regions of store and the position in store of the region holding each point
+	The lookup is done once per region type and step
+	"""
+	key = (store.region_type, sample_step)
+	cached = grid_samples.get(key)
+	if cached is None or cached[0] is not store:
+		index = get_spatial_index(store.region_type)
+		x_min, y_min, x_max, y_max = index.grid_bounds
+		lon, lat = np.meshgrid(np.arange(x_min, x_max, sample_step), np.arange(y_min, y_max, sample_step))
+		lon, lat = lon.ravel(), lat.ravel()
+		positions = index.query(lon, lat)
+		inside = positions >= 0
+		cached = (store, lon[inside], lat[inside], positions[inside])
+		grid_samples[key] = cached
+	return cached[1:]
+
+def region_points(store, region_idx, mode="centroid", sample_step=0.05):
+	"""
+	store: geometry_store.GeometryStore
+	region_idx: array with positions in store
+
+	Returns (lon, lat, owner, weight): owner[i] is the position in region_idx the point i represents
+	"""
+	region_idx = np.asarray(region_idx, dtype=int)
+	centroids = store.centroids()[region_idx]
+	if mode == "centroid":
+		return centroids[:, 0], centroids[:, 1], np.arange(len(region_idx)), np.ones(len(region_idx))
+
+	if mode != "area":
+		raise ValueError(f"Unknown mode: {mode}")
+
+	lon, lat, positions = sample_grid(store, sample_step)
+
+	# position in the store -> position in region_idx
+	owner_of = np.full(len(store), -1)
+	owner_of[region_idx] = np.arange(len(region_idx))
+	owner = np.where(positions >= 0, owner_of[positions], -1)
+	inside = owner >= 0
+	lon, lat, owner = lon[inside], lat[inside], owner[inside]
+
+	# regions too small to hold a grid point are represented by their centroid
+	missing = np.setdiff1d(np.arange(len(region_idx)), owner)
+	lon = np.concatenate([lon, centroids[missing, 0]])
+	lat = np.concatenate([lat, centroids[missing, 1]])
+	owner = np.concatenate([owner, missing])
+
+	weight = 1 / np.bincount(owner, minlength=len(region_idx))[owner]
+	return lon, lat, owner, weight
+
+def biomass_within_radius(units_df, biomass_obj, radius_km, mode="centroid", sample_step=0.05, chunk_size=None):
+	"""
+	units_df: DataFrame with nome, uf, lat and lon columns (StaticUnits.df or DynamicUnits.df)
+	biomass_obj: biomass.BiomassMap
+	radius_km: float
+	mode: "centroid" or "area", see the module docstring
+	chunk_size: int or None
+		units per chunk, None picks the largest chunk that keeps the matrix under max_cells elements
+
+	Returns a copy of units_df[nome, uf] with the biomass (qnt_produzida) within radius_km and the number of regions reached
+	"""
+	lon, lat, owner, weight = region_points(biomass_obj.geometry, biomass_obj.biomass_df.geometry_idx, mode, sample_step)
+	point_value = biomass_obj.region_values[owner] * weight
+
+	unit_lat = pd.to_numeric(units_df["lat"]).to_numpy()
+	unit_lon = pd.to_numeric(units_df["lon"]).to_numpy()
+	if chunk_size is None:
+		chunk_size = max(1, max_cells // max(1, len(lon)))
+
+	biomass = np.zeros(len(units_df))
+	n_regions = np.zeros(len(units_df), dtype=int)
+	for start in range(0, len(units_df), chunk_size):
+		chunk = slice(start, start + chunk_size)
+		within = haversine_matrix(unit_lat[chunk], unit_lon[chunk], lat, lon) <= radius_km
+		biomass[chunk] = within @ point_value
+		reached = np.zeros((within.shape[0], len(biomass_obj.region_values)), dtype=bool)
+		rows, cols = np.nonzero(within)
+		reached[rows, owner[cols]] = True
+		n_regions[chunk] = reached.sum(axis=1)
+
+	result = units_df[["nome", "uf"]].copy()
+	result[f"Biomassa em {radius_km:g} km ({biomass_obj.unit})"] = biomass
+	result["Regiões alcançadas"] = n_regions
+	return result
+
+def draw_radius_overlay(ax, units_df, radius_km, color="black", zorder=4):
+	"""
+	Draws a circle of radius_km around every unit as a single PatchCollection and returns it
+	The circles are ellipses in lon/lat, wider at higher latitudes
+	"""
+	lat = pd.to_numeric(units_df["lat"]).to_numpy()
+	lon = pd.to_numeric(units_df["lon"]).to_numpy()
+	km_per_degree = np.pi * earth_radius_km / 180
+	heights = 2 * radius_km / km_per_degree
+	widths = heights / np.cos(np.radians(lat))
+
+	circles = [Ellipse((x, y), width, heights) for x, y, width in zip(lon, lat, widths)]
+	overlay = PatchCollection(circles, facecolors="none", edgecolors=color, linewidths=0.8, linestyles="--", zorder=zorder)
+	ax.add_collection(overlay)
+	return overlay
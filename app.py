@@ -1,5 +1,6 @@
 import biomass
 import static_units
+from dataset_catalog import dataset_catalog
 import os
 import pandas as pd
 import json
@@ -123,26 +124,17 @@ class MainPage(tk.Frame):
 
 
 	def get_biomass_file_prefix_list(self):
-		file_prefix_list = list()
-		
-		# get all the file prefixes to a list
-		for filename in os.listdir(self.biomass_path):
-			if filename.endswith(".csv"):
-				file_prefix_list.append(filename.removesuffix(".csv"))
-		return file_prefix_list
+		# every dataset of the catalog
+		return dataset_catalog.get_table().index.tolist()
 
 	def create_menu_df(self, file_prefix_list):
 		# creates a dataframe with the file_prefix, biomass_type and biomass_name information
-		menu_df = {"file_prefix": [], "biomass_type":[], "biomass_name":[]}
-		for file_prefix in file_prefix_list:
-			with open(f"{self.biomass_path}/{file_prefix}.json", "r", encoding="utf-8") as file:
-				json_dict = json.load(file)
-
-			menu_df["file_prefix"].append(file_prefix)
-			menu_df["biomass_type"].append(json_dict["tipo_biomassa"])
-			menu_df["biomass_name"].append(json_dict["nome_biomassa"])
-
-		menu_df = pd.DataFrame(menu_df)
+		table = dataset_catalog.get_table().loc[file_prefix_list]
+		menu_df = pd.DataFrame({
+			"file_prefix": table.index,
+			"biomass_type": table.tipo_biomassa.to_numpy(),
+			"biomass_name": table.nome_biomassa.to_numpy(),
+		})
 		menu_df = menu_df.loc[menu_df.file_prefix != "mapa_vazio"]
 		self.menu_df = menu_df
 		return menu_df
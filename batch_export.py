@@ -0,0 +1,235 @@
+"""
+Renders the map of every biomass dataset for every uf to files, without Streamlit
+
+Each dataset is one task of a process pool: the worker builds its BiomassMap (and the static unit layers)
+once and goes through the ufs with change_uf, so only colors, limits and the colorbar change between maps.
+The geometry stores are built (when missing) before the pool starts and memory-mapped once per worker by
+the pool initializer.
+
+Output: {out}/{prefix}/{uf}.{format}, plus {out}/manifest.json with every map written (and every failure).
+Maps already in the manifest whose file still exists and that were rendered with the same settings (dpi and
+static unit layers) are skipped, so an interrupted or failed run is resumed by running the same command again,
+and a run with another --dpi or --static-units renders them again.
+
+Usage:
+	python batch_export.py                                   every dataset, every uf, png
+	python batch_export.py --formats png pdf --ufs Brasil SP --datasets cana soja
+	python batch_export.py --static-units capitais filiais --workers 4
+"""
+import os
+import json
+import time
+import argparse
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import matplotlib
+matplotlib.use("Agg")
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+import pandas as pd
+
+from biomass import BiomassMap, render_dpi
+from static_units import StaticUnits
+from geometry_store import load_geometry, available_region_types
+from dataset_catalog import dataset_catalog
+from spatial_index import assign_uf
+
+static_units_path = "./static_units_files"
+uf_list = ['RO', 'AC', 'AM', 'RR', 'PA', 'AP', 'TO', 'MA', 'PI', 'CE', 'RN', 'PB', 'PE', 'AL', 'SE', 'BA', 'MG', 'ES', 'RJ', 'SP', 'PR', 'SC', 'RS', 'MS', 'MT', 'GO', 'DF']
+
+
+def drawable_datasets():
+	# datasets whose region type has a geometry file
+	table = dataset_catalog.get_table()
+	return table.index[table.tipo_regiao.isin(available_region_types())].tolist()
+
+def map_id(prefix, uf, file_format):
+	return f"{prefix}/{uf}.{file_format}"
+
+def init_worker(region_types):
+	# every map of the worker reads the same memory-mapped stores
+	for region_type in region_types:
+		load_geometry(region_type)
+
+def read_static_units(prefix):
+	df = pd.read_csv(f"{static_units_path}/{prefix}.csv", dtype=str)
+	with open(f"{static_units_path}/{prefix}.json", "r", encoding="utf-8") as file:
+		specs_dict = json.load(file)
+	return assign_uf(df, name=prefix), specs_dict
+
+def create_export_fig(prefix, static_units):
+	"""
+	Returns (biomass_obj, unit_objs, cax): the map on the left of the figure and an axes for its colorbar on the right
+	"""
+	fig = Figure(figsize=(8, 6))
+	FigureCanvasAgg(fig)
+	biomass_obj = BiomassMap(fig, prefix)
+	biomass_obj.ax.set_position([0.02, 0.04, 0.8, 0.88])
+	cax = fig.add_axes([0.85, 0.15, 0.03, 0.7])
+
+	unit_objs = list()
+	for unit_prefix in static_units:
+		df, specs_dict = read_static_units(unit_prefix)
+		unit_objs.append(StaticUnits(fig=fig, ax=biomass_obj.ax, df=df, specs_dict=specs_dict))
+	return biomass_obj, unit_objs, cax
+
+def export_dataset(prefix, ufs, formats, out, dpi, static_units, skip):
+	"""
+	Runs in a worker, renders the maps of one dataset
+	skip: set of the map ids already written
+	Returns a list of (map_id, file path or None, seconds, error or None)
+	"""
+	results = list()
+	try:
+		biomass_obj, unit_objs, cax = create_export_fig(prefix, static_units)
+	except Exception:
+		error = traceback.format_exc(limit=3)
+		return [(map_id(prefix, uf, file_format), None, 0.0, error) for uf in ufs for file_format in formats]
+
+	os.makedirs(f"{out}/{prefix}", exist_ok=True)
+	for uf in ufs:
+		pending = [file_format for file_format in formats if map_id(prefix, uf, file_format) not in skip]
+		if not pending:
+			continue
+
+		start = time.perf_counter()
+		try:
+			biomass_obj.change_uf(uf)
+			for unit_obj in unit_objs:
+				unit_obj.change_visibility(visible=True, uf=uf)
+			cax.clear()
+			biomass_obj.fig.colorbar(biomass_obj.mappable, cax=cax).set_label(
+				label=f"Produção de {biomass_obj.biomass_name} ({biomass_obj.unit})", labelpad=5
+			)
+		except Exception:
+			error = traceback.format_exc(limit=3)
+			results.extend((map_id(prefix, uf, file_format), None, 0.0, error) for file_format in pending)
+			continue
+
+		for file_format in pending:
+			path = f"{out}/{prefix}/{uf}.{file_format}"
+			try:
+				biomass_obj.fig.savefig(f"{path}.tmp", format=file_format, dpi=dpi)
+				os.replace(f"{path}.tmp", path)
+				results.append((map_id(prefix, uf, file_format), path, time.perf_counter() - start, None))
+			except Exception:
+				results.append((map_id(prefix, uf, file_format), None, 0.0, traceback.format_exc(limit=3)))
+			start = time.perf_counter()
+	return results
+
+
+class Manifest:
+	"""
+	{out}/manifest.json: {"done": {map_id: {"file", "seconds", "settings"}}, "failed": {map_id: error}}
+
+	All attributes:
+		self.path
+		self.settings: {"dpi", "static_units"} of this run
+		self.done
+		self.failed
+	"""
+
+	def __init__(self, out, settings):
+		self.path = f"{out}/manifest.json"
+		self.settings = settings
+		try:
+			with open(self.path, "r", encoding="utf-8") as file:
+				manifest = json.load(file)
+		except FileNotFoundError:
+			manifest = {"done": {}, "failed": {}}
+		# a map is only skipped if its file is still there and was rendered with the settings of this run
+		self.done = {
+			key: value for key, value in manifest["done"].items()
+			if os.path.exists(value["file"]) and value.get("settings") == settings
+		}
+		self.failed = manifest["failed"]
+
+	def record(self, results):
+		for key, path, seconds, error in results:
+			if error is None:
+				self.done[key] = {"file": path, "seconds": round(seconds, 4), "settings": self.settings}
+				self.failed.pop(key, None)
+			else:
+				self.failed[key] = error
+
+	def save(self):
+		with open(f"{self.path}.tmp", "w", encoding="utf-8") as file:
+			json.dump({"done": self.done, "failed": self.failed}, file, ensure_ascii=False, indent=1)
+		os.replace(f"{self.path}.tmp", self.path)
+
+
+def export_all(datasets, ufs, formats, out, dpi=render_dpi, static_units=(), workers=None):
+	"""
+	Returns the Manifest after rendering every map that is not in it yet
+	"""
+	os.makedirs(out, exist_ok=True)
+	# the order of the layers is the order they are drawn in
+	manifest = Manifest(out, {"dpi": dpi, "static_units": list(static_units)})
+	skip = set(manifest.done)
+	tasks = [
+		prefix for prefix in datasets
+		if any(map_id(prefix, uf, file_format) not in skip for uf in ufs for file_format in formats)
+	]
+	requested = [map_id(prefix, uf, file_format) for prefix in datasets for uf in ufs for file_format in formats]
+	n_maps = sum(key not in skip for key in requested)
+	print(f"{len(requested)} maps, {len(requested) - n_maps} already in the manifest, {n_maps} to render")
+	if not tasks:
+		return manifest
+
+	region_types = sorted({"uf"} | set(dataset_catalog.get_table().loc[tasks, "tipo_regiao"]))
+	# built here, once, when missing or stale: the workers only memory-map them
+	for region_type in region_types:
+		load_geometry(region_type)
+	start = time.perf_counter()
+	n_done = 0
+	with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(region_types,)) as executor:
+		futures = {
+			executor.submit(export_dataset, prefix, ufs, formats, out, dpi, tuple(static_units), skip): prefix
+			for prefix in tasks
+		}
+		for idx, future in enumerate(as_completed(futures)):
+			results = future.result()
+			manifest.record(results)
+			manifest.save()
+
+			n_done += sum(error is None for key, path, seconds, error in results)
+			n_failed = sum(error is not None for key, path, seconds, error in results)
+			elapsed = time.perf_counter() - start
+			print(
+				f"[{idx + 1}/{len(tasks)}] {futures[future]}: {len(results) - n_failed} maps"
+				+ (f", {n_failed} failed" if n_failed else "")
+				+ f" | {n_done}/{n_maps} in {elapsed:.1f} s ({n_done / elapsed:.2f} maps/s)"
+			)
+
+	elapsed = time.perf_counter() - start
+	print(f"{n_done} maps in {elapsed:.1f} s: {n_done / elapsed:.2f} maps/s, {len(manifest.failed)} failed")
+	return manifest
+
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Renders every biomass dataset for every uf to image files")
+	parser.add_argument("--out", default="./export", help="output folder (default: ./export)")
+	parser.add_argument("--formats", nargs="+", default=["png"], choices=["png", "svg", "pdf"])
+	parser.add_argument("--datasets", nargs="+", help="dataset prefixes (default: every drawable dataset)")
+	parser.add_argument("--ufs", nargs="+", default=["Brasil"] + uf_list, help="Brasil and / or uf abbreviations (default: all)")
+	parser.add_argument("--static-units", nargs="*", default=[], help=f"unit layers from {static_units_path}, e.g. capitais filiais")
+	parser.add_argument("--workers", type=int, default=None, help="processes (default: one per cpu)")
+	parser.add_argument("--dpi", type=int, default=render_dpi)
+	args = parser.parse_args()
+
+	manifest = export_all(
+		datasets=args.datasets or drawable_datasets(),
+		ufs=args.ufs,
+		formats=args.formats,
+		out=args.out,
+		dpi=args.dpi,
+		static_units=args.static_units,
+		workers=args.workers
+	)
+	for key, error in sorted(manifest.failed.items()):
+		print(f"FAILED {key}\n{error}")
+	if manifest.failed:
+		raise SystemExit(1)
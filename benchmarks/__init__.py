@@ -0,0 +1,4 @@
+"""
+Benchmarks for the map rendering hot paths
+Run them from the repository root, e.g.: python -m benchmarks.bench_render
+"""
@@ -0,0 +1,26 @@
+"""
+The st.secrets of the benchmarks that run streamlit_app (AppTest): the static layers of static_units_files
+and a dynamic layer of the capitals with a demand for each one
+Only reads csv and json, so it can be imported before the app without importing anything heavy
+"""
+import csv
+import json
+
+static_units_path = "./static_units_files"
+
+
+def app_secrets():
+	# the static layers of static_units_files and a dynamic layer of the capitals, as st.secrets holds them
+	secrets = {"static_units": {}, "dynamic_units": {}}
+	for prefix in ["capitais", "filiais"]:
+		with open(f"{static_units_path}/{prefix}.csv", "r", encoding="utf-8") as file:
+			rows = list(csv.reader(file))
+		with open(f"{static_units_path}/{prefix}.json", "r", encoding="utf-8") as file:
+			secrets["static_units"][prefix] = {"df": rows, "specs_dict": json.load(file)}
+
+	rows = secrets["static_units"]["capitais"]["df"]
+	secrets["dynamic_units"]["centros_consumo"] = {
+		"df": [rows[0] + ["coef"]] + [row + [str(1000 * (idx + 1))] for idx, row in enumerate(rows[1:])],
+		"specs_dict": {"tipo_unidade": "Centros de consumo", "unidade": "ton/mês", "marker": "o", "cmap": "GnBu"},
+	}
+	return secrets
@@ -0,0 +1,79 @@
+"""
+Time to the first map of a fresh session, each case in a new Python process
+	cold: the session is the first thing the process runs (streamlit run streamlit_app.py, first visitor)
+	warm: startup.warm_up() ran first (python startup.py, a visitor after the warm-up)
+The first paint is what mark_first_paint() records: from the start of the first run of the session to the
+map sent, the imports of streamlit_app included in the cold case. "process" adds the import of streamlit itself.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import warnings
+
+process_start = time.perf_counter()
+
+
+def run_case(case):
+	# in the child process
+	warnings.simplefilter("ignore")
+	from streamlit.testing.v1 import AppTest
+	from benchmarks.app_secrets import app_secrets
+	import startup
+
+	secrets = app_secrets()
+	if case == "warm":
+		startup.warm_up(secrets)
+
+	at = AppTest.from_file(os.path.abspath("streamlit_app.py"), default_timeout=300)
+	for section, value in secrets.items():
+		at.secrets[section] = value
+	session_start = time.perf_counter()
+	at.run()
+	if at.exception:
+		raise RuntimeError(at.exception[0].message)
+	first_paint = at.session_state["first_paint"]
+	for renderer in ["frame_renderer", "uf_renderer"]:
+		at.session_state[renderer].cancel()
+
+	return {
+		"first_paint": first_paint,
+		# the session starts after the warm-up, the process time only counts for the cold case
+		"process": session_start - process_start + first_paint if case == "cold" else first_paint,
+		"first_run": time.perf_counter() - session_start,
+		"stages_run": sum(ran for name, ran, seconds in at.session_state["stage_log"]),
+		"startup": startup.startup_report(),
+	}
+
+def measure(case):
+	output = subprocess.run(
+		[sys.executable, "-m", "benchmarks.bench_cold_start", "--child", case],
+		capture_output=True, text=True, check=True
+	).stdout
+	return json.loads(output.strip().splitlines()[-1])
+
+def main(repeat=3):
+	print(f"{'case':<8}{'first paint (s)':>18}{'process (s)':>14}{'first run (s)':>16}{'stages run':>12}")
+	results = dict()
+	for case in ["cold", "warm"]:
+		runs = [measure(case) for _ in range(repeat)]
+		best = min(runs, key=lambda run: run["first_paint"])
+		results[case] = best
+		print(f"{case:<8}{best['first_paint']:>18.3f}{best['process']:>14.3f}{best['first_run']:>16.3f}{best['stages_run']:>12}")
+	print("\nWarm-up (python startup.py):")
+	for step, seconds in results["warm"]["startup"].items():
+		print(f"\t{step:<30}{seconds:>8.3f} s")
+	return results
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser()
+	parser.add_argument("--child", choices=["cold", "warm"], help="runs one case and prints it as json")
+	parser.add_argument("--repeat", type=int, default=3)
+	args = parser.parse_args()
+	if args.child:
+		print(json.dumps(run_case(args.child)))
+	else:
+		main(args.repeat)
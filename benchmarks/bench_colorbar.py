@@ -0,0 +1,90 @@
+"""
+Switches the uf of a BiomassMap 1000 times, then checks that the colorbar rendering leaves nothing behind
+	- the off-screen figure of colorbar has no axes or artists left after a render
+	- rendering the same colorbars and legends again and again, bypassing the lru caches, does not grow
+	  the number of live objects, of live Figures, or the memory traced by tracemalloc
+The run fails (exit code 1) if one of them does
+"""
+import gc
+import time
+import tracemalloc
+from itertools import cycle, islice
+
+import matplotlib
+matplotlib.use("Agg")
+from matplotlib.figure import Figure
+
+from biomass import BiomassMap
+from colorbar import render_colorbar, render_legend, offscreen_fig
+from perf import live_figures
+
+# growth allowed between two rounds of the same renders (caches of matplotlib and numpy settling)
+max_object_growth = 200
+max_memory_growth = 256 * 1024
+
+
+def offscreen_leftovers():
+	"""
+	Returns a list with what is left on the off-screen figure, empty when it is clear
+	"""
+	leftovers = [f"axes: {ax}" for ax in offscreen_fig.axes]
+	for name in ["artists", "lines", "patches", "texts", "images", "legends"]:
+		leftovers += [f"{name}: {artist}" for artist in getattr(offscreen_fig, name)]
+	# the background patch is the only child of a clear figure
+	leftovers += [f"child: {child}" for child in offscreen_fig.get_children() if child is not offscreen_fig.patch]
+	return leftovers
+
+def render_round(cases):
+	# the undecorated functions, so every call draws
+	for args in cases:
+		render_colorbar.__wrapped__(*args)
+	render_legend.__wrapped__((("o", "Usinas", "tab:blue"), ("*", "Capitais", "tab:red")))
+
+def live_state():
+	gc.collect()
+	return len(gc.get_objects()), live_figures(), tracemalloc.get_traced_memory()[0]
+
+def main(file_prefix="cana", n_switches=1000, n_rounds=20):
+	biomass_obj = BiomassMap(Figure(), file_prefix)
+	ufs = ["Brasil"] + biomass_obj.uf_list
+
+	start = time.perf_counter()
+	for uf in islice(cycle(ufs), n_switches):
+		biomass_obj.change_uf(uf)
+	elapsed = time.perf_counter() - start
+	print(f"{n_switches} uf switches in {elapsed:.2f} s ({elapsed / n_switches * 1000:.2f} ms each)")
+	print(f"colorbar cache: {render_colorbar.cache_info()}")
+
+	errors = offscreen_leftovers()
+
+	cases = [("viridis", "linear", 0.0, vmax, "ton/ano") for vmax in (10.0, 1e3, 1e5)]
+	cases += [("YlOrBr", "log", 1.0, 1e6, "m³/ano"), ("Reds", "boundary", None, None, "", (0, 1, 10, 100))]
+	tracemalloc.start()
+	render_round(cases)
+	objects_before, figures_before, memory_before = live_state()
+	for _ in range(n_rounds):
+		render_round(cases)
+	objects_after, figures_after, memory_after = live_state()
+	tracemalloc.stop()
+	errors += offscreen_leftovers()
+
+	print(f"{n_rounds} rounds of {len(cases) + 1} renders:")
+	print(f"\tlive objects: {objects_before} before, {objects_after} after")
+	print(f"\tlive figures: {figures_before} before, {figures_after} after")
+	print(f"\ttraced memory: {memory_before / 1024:.0f} kB before, {memory_after / 1024:.0f} kB after")
+	if objects_after - objects_before > max_object_growth:
+		errors.append(f"{objects_after - objects_before} objects leaked")
+	if figures_after != figures_before:
+		errors.append(f"{figures_after - figures_before} figures leaked")
+	if memory_after - memory_before > max_memory_growth:
+		errors.append(f"{(memory_after - memory_before) / 1024:.0f} kB leaked")
+
+	for error in errors:
+		print(error)
+	print("OK" if not errors else "FAILED")
+	if errors:
+		raise SystemExit(1)
+
+
+if __name__ == "__main__":
+	main()
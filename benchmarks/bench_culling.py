@@ -0,0 +1,64 @@
+"""
+Draw time of one BiomassMap zoomed from Brasil to a uf, a mesoregion and a microregion
+With the viewport culling the collections only hold the polygons in view, so the draw time follows the number
+of polygons drawn instead of the size of the dataset
+Checks that every polygon drawn intersects the view and that none of the view is left out
+"""
+import time
+import numpy as np
+import matplotlib
+matplotlib.use("Agg")
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+from biomass import BiomassMap
+from dataset_catalog import dataset_catalog
+from geometry_store import load_geometry, intersecting
+
+
+def check_culling(biomass_obj):
+	in_view = np.flatnonzero(
+		np.isin(biomass_obj.region_uf, list(biomass_obj.visible_ufs))
+		& intersecting(biomass_obj.region_bounds, biomass_obj.view_bbox)
+	)
+	assert np.array_equal(in_view, biomass_obj.drawn_regions), "the regions drawn are not the ones in view"
+	assert len(biomass_obj.regionmap.get_paths()) == len(biomass_obj.drawn_regions), "the regionmap holds other polygons"
+
+def time_draw(biomass_obj, repeat=3):
+	draw_times = list()
+	for _ in range(repeat):
+		start = time.perf_counter()
+		biomass_obj.fig.canvas.draw()
+		draw_times.append(time.perf_counter() - start)
+	return min(draw_times)
+
+def main(region_type="micro", uf="PR"):
+	table = dataset_catalog.get_table()
+	datasets = table.loc[table.tipo_regiao == region_type]
+	prefix = datasets.stop.sub(datasets.start).idxmax()  # the dataset with most rows
+	fig = Figure()
+	FigureCanvasAgg(fig)
+	biomass_obj = BiomassMap(fig, prefix)
+
+	meso_df = load_geometry("meso").to_frame()
+	micro_df = load_geometry("micro").to_frame()
+	views = [
+		("Brasil", "Brasil", None),
+		(uf, uf, None),
+		("mesorregião", uf, ("meso", meso_df.loc[meso_df.uf == uf].cod_ibge.iloc[0])),
+		("microrregião", uf, ("micro", micro_df.loc[micro_df.uf == uf].cod_ibge.iloc[0])),
+	]
+
+	print(f"{prefix} ({region_type}, {len(biomass_obj.biomass_df)} regions)")
+	print(f"{'view':<15}{'regions drawn':>15}{'level':>8}{'change (s)':>12}{'draw (s)':>12}")
+	for name, view_uf, zoom in views:
+		start = time.perf_counter()
+		biomass_obj.change_uf(view_uf, zoom=zoom)
+		change_time = time.perf_counter() - start
+		check_culling(biomass_obj)
+		draw_time = time_draw(biomass_obj)
+		print(f"{name:<15}{len(biomass_obj.drawn_regions):>15}{biomass_obj.lod_level:>8}{change_time:>12.3f}{draw_time:>12.3f}")
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,54 @@
+"""
+Times the construction of BiomassMap and a full draw of its figure
+for every dataset drawn over micro.json and meso.json
+"""
+import json
+import time
+from os import listdir
+
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+
+from biomass import BiomassMap
+
+
+def datasets_by_region_type(region_types=("meso", "micro")):
+	biomass_path = "./biomass"
+	datasets = {region_type: [] for region_type in region_types}
+	for file in sorted(listdir(biomass_path)):
+		if not file.endswith(".json"):
+			continue
+		with open(f"{biomass_path}/{file}", "r", encoding="utf-8") as f:
+			region_type = json.load(f)["tipo_regiao"]
+		if region_type in datasets:
+			datasets[region_type].append(file.split(".")[0])
+	return datasets
+
+
+def time_map(file_prefix, repeat=3):
+	build_times = list()
+	draw_times = list()
+	for _ in range(repeat):
+		fig = plt.figure()
+		start = time.perf_counter()
+		biomass_obj = BiomassMap(fig, file_prefix)
+		build_times.append(time.perf_counter() - start)
+
+		start = time.perf_counter()
+		fig.canvas.draw()
+		draw_times.append(time.perf_counter() - start)
+		plt.close("all")
+	return min(build_times), min(draw_times), len(biomass_obj.biomass_df)
+
+
+def main():
+	print(f"{'dataset':<25}{'region':>8}{'rows':>8}{'build (s)':>12}{'draw (s)':>12}")
+	for region_type, prefixes in datasets_by_region_type().items():
+		for file_prefix in prefixes:
+			build_time, draw_time, n_rows = time_map(file_prefix)
+			print(f"{file_prefix:<25}{region_type:>8}{n_rows:>8}{build_time:>12.3f}{draw_time:>12.3f}")
+
+
+if __name__ == "__main__":
+	main()
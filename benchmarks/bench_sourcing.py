@@ -0,0 +1,39 @@
+"""
+Time of sourcing.solve_transport at the municipal scale: ~5570 synthetic regions spread over Brazil against a few hundred units
+Checks that no region sends more than its supply and no unit gets more than its demand
+"""
+import time
+import numpy as np
+
+from sourcing import solve_transport
+
+
+def main(n_regions=5570, n_units=300, radius_km=150, seed=0):
+	rng = np.random.default_rng(seed)
+	region_lon = rng.uniform(-60.0, -36.0, n_regions)
+	region_lat = rng.uniform(-32.0, -3.0, n_regions)
+	supply = rng.lognormal(8, 2, n_regions) * (rng.random(n_regions) < 0.8)
+	unit_lon = rng.uniform(-60.0, -36.0, n_units)
+	unit_lat = rng.uniform(-32.0, -3.0, n_units)
+	demand = rng.uniform(0, 2 * supply.sum() / n_units, n_units)
+
+	start = time.perf_counter()
+	unit, region, distance, flow, unmet = solve_transport(unit_lon, unit_lat, demand, region_lon, region_lat, supply, radius_km)
+	solve_time = time.perf_counter() - start
+
+	sent = np.bincount(region, weights=flow, minlength=n_regions)
+	received = np.bincount(unit, weights=flow, minlength=n_units)
+	tolerance = 1e-6 * demand.max()
+	assert np.all(sent <= supply + tolerance), "a region sends more than its supply"
+	assert np.allclose(received + unmet, demand, atol=tolerance), "flows and unmet demand do not add up to the demand"
+	assert np.all(distance[flow > tolerance] <= radius_km), "a flow goes over the radius"
+
+	print(
+		f"{n_regions} regions x {n_units} units, radius {radius_km} km: {len(unit)} candidate edges, "
+		f"solved in {solve_time:.3f} s, {received.sum() / demand.sum():.1%} of the demand served"
+	)
+
+
+if __name__ == "__main__":
+	main()
+	main(n_units=600, radius_km=300)
@@ -0,0 +1,39 @@
+"""
+Throughput of SpatialIndex.query for random points over Brazil, checked against matplotlib's Path.contains_points
+"""
+import time
+import numpy as np
+from matplotlib.path import Path
+
+from spatial_index import get_spatial_index
+
+
+def main(n_points=100_000, n_checked=2_000, seed=0):
+	rng = np.random.default_rng(seed)
+	lon = rng.uniform(-74.0, -34.0, n_points)
+	lat = rng.uniform(-34.0, 5.5, n_points)
+
+	for region_type in ["uf", "meso", "micro"]:
+		start = time.perf_counter()
+		index = get_spatial_index(region_type)
+		build_time = time.perf_counter() - start
+
+		start = time.perf_counter()
+		positions = index.query(lon, lat)
+		query_time = time.perf_counter() - start
+
+		points = np.column_stack([lon[:n_checked], lat[:n_checked]])
+		expected = np.full(n_checked, -1)
+		for idx, ring in enumerate(index.store.rings()):
+			contained = Path(np.asarray(ring)).contains_points(points)
+			expected[contained & (expected == -1)] = idx
+		mismatches = np.sum(expected != positions[:n_checked])
+
+		print(
+			f"{region_type:>6}: build {build_time:.3f} s, {n_points} points in {query_time:.3f} s "
+			f"({n_points / query_time:,.0f} points/s), {mismatches} mismatches in {n_checked} checked"
+		)
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,61 @@
+"""
+Time of the hover lookups of map_tooltips on the finest region type available (micro, there is no municipal geometry):
+building the TooltipTable of a view, rendering its picking image, and (lon, lat) -> row on the server
+Checks that every row found in the picking image is a region of a visible uf
+"""
+import io
+import time
+import numpy as np
+import matplotlib.image
+from matplotlib.figure import Figure
+
+from biomass import BiomassMap
+from dataset_catalog import dataset_catalog
+from map_tooltips import TooltipTable, no_row
+from spatial_index import get_spatial_index
+
+
+def render(fig):
+	io_buf = io.BytesIO()
+	fig.savefig(io_buf, format="png", bbox_inches="tight", dpi=200)
+	return io_buf.getvalue()
+
+def main(region_type="micro", uf="SP", n_points=1000, seed=0):
+	table = dataset_catalog.get_table()
+	prefix = table.index[table.tipo_regiao == region_type][0]
+	biomass_obj = BiomassMap(Figure(), prefix)
+	biomass_obj.change_uf(uf)
+
+	start = time.perf_counter()
+	tooltip_table = TooltipTable(biomass_obj, [], uf)
+	table_time = time.perf_counter() - start
+
+	start = time.perf_counter()
+	picking = matplotlib.image.imread(io.BytesIO(tooltip_table.render_picking(biomass_obj, render)))
+	picking_time = time.perf_counter() - start
+	picking = np.round(picking * 255).astype(int)
+	rows = (picking[..., 0] << 16) | (picking[..., 1] << 8) | picking[..., 2]
+	found = np.unique(rows[rows != no_row])
+	assert np.all(found < tooltip_table.n_regions), "the picking image has a color that is no row"
+	assert np.all(np.isin(tooltip_table.uf[found], list(biomass_obj.visible_ufs))), "the picking image has a region of a hidden uf"
+
+	get_spatial_index(region_type)
+	rng = np.random.default_rng(seed)
+	lon = rng.uniform(-74.0, -34.0, n_points)
+	lat = rng.uniform(-34.0, 5.0, n_points)
+	lookup_times = list()
+	for x, y in zip(lon, lat):
+		start = time.perf_counter()
+		tooltip_table.region_rows(x, y)
+		lookup_times.append(time.perf_counter() - start)
+
+	print(
+		f"{prefix} ({region_type}, {uf}): table of {len(tooltip_table)} rows in {1e3 * table_time:.2f} ms, "
+		f"picking image in {1e3 * picking_time:.0f} ms ({len(found)} regions), "
+		f"server lookup p50 {1e3 * np.percentile(lookup_times, 50):.3f} ms, p99 {1e3 * np.percentile(lookup_times, 99):.3f} ms"
+	)
+
+
+if __name__ == "__main__":
+	main()
+	main(uf="Brasil")
@@ -0,0 +1,87 @@
+"""
+Compares image_utils.remove_white_spaces with the row by row implementation it replaced
+on a real colorbar image
+"""
+import time
+import numpy as np
+
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+
+from image_utils import fig_to_array, remove_white_spaces
+
+
+def legacy_fix_list(lst):
+	lst = sorted(lst)
+	for i in range(len(lst)):
+		if lst[i] + 1 != lst[i+1]:
+			fim_comeco = i
+			break
+	lst = lst[::-1]
+	for i in range(len(lst)):
+		if lst[i] - 1 != lst[i+1]:
+			comeco_fim = len(lst) - i
+			break
+	lst = lst[::-1]
+	return lst[:fim_comeco+1] + lst[comeco_fim:]
+
+def legacy_white_line(line):
+	line = np.array(line)
+	if np.array_equal( line , np.array([[255, 255, 255, 255] for _ in range(len(line))]) ):
+		return True
+	elif np.array_equal(line[:, 3] , [0 for _ in range(len(line))]):
+		return True
+	else:
+		return False
+
+def legacy_remove_white_spaces(img_arr):
+	hor_indexes = [idx for idx, line in enumerate(img_arr) if legacy_white_line(line)]
+	img_arr = np.delete(img_arr, legacy_fix_list(hor_indexes), 0)
+
+	img_arr = np.transpose( img_arr, (1,0,2) )
+	ver_indexes = [idx for idx, line in enumerate(img_arr) if legacy_white_line(line)]
+	img_arr = np.delete(img_arr, legacy_fix_list(ver_indexes), 0)
+	return np.transpose( img_arr, (1,0,2) )
+
+
+def colorbar_image():
+	fig, ax = plt.subplots()
+	mappable = matplotlib.cm.ScalarMappable(norm=matplotlib.colors.Normalize(0, 100), cmap="Oranges")
+	fig.colorbar(mappable, ax=ax, orientation="vertical").set_label("Produção (ton/ano)", labelpad=5)
+	ax.remove()
+	img_arr = fig_to_array(fig)
+	plt.close(fig)
+	return img_arr
+
+def best_time(func, img_arr, repeat=20):
+	times = list()
+	for _ in range(repeat):
+		start = time.perf_counter()
+		func(img_arr)
+		times.append(time.perf_counter() - start)
+	return min(times)
+
+
+def main():
+	img_arr = colorbar_image()
+	legacy = legacy_remove_white_spaces(img_arr)
+	current = remove_white_spaces(img_arr)
+	# legacy_fix_list keeps the first blank row and column after the content
+	same_content = np.array_equal(legacy[:-1, :-1], current)
+	print(f"image {img_arr.shape} -> {current.shape} (legacy {legacy.shape}), same content: {same_content}")
+
+	legacy_time = best_time(legacy_remove_white_spaces, img_arr)
+	current_time = best_time(remove_white_spaces, img_arr)
+	print(f"legacy:  {legacy_time * 1000:8.3f} ms")
+	print(f"current: {current_time * 1000:8.3f} ms ({legacy_time / current_time:.0f}x faster)")
+
+	# Images that made legacy_fix_list raise IndexError
+	blank = np.full((50, 40, 4), 255, dtype=np.uint8)
+	no_border = np.full((50, 40, 4), 128, dtype=np.uint8)
+	for name, edge_case in [("blank", blank), ("no border", no_border)]:
+		print(f"{name}: {edge_case.shape} -> {remove_white_spaces(edge_case).shape}")
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,75 @@
+"""
+Times StaticUnits and DynamicUnits with a large synthetic layer (one point per fuel distributor scale)
+"""
+import time
+import numpy as np
+import pandas as pd
+
+import matplotlib
+matplotlib.use("Agg")
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+from biomass import BiomassMap
+from static_units import StaticUnits
+from dynamic_units import DynamicUnits
+
+
+def synthetic_units(biomass_obj, n_points, seed=0):
+	# Random points inside the bbox of a random uf, enough to exercise the per-uf masks
+	rng = np.random.default_rng(seed)
+	ufs = rng.choice(biomass_obj.uf_list, size=n_points)
+	lon = np.empty(n_points)
+	lat = np.empty(n_points)
+	for uf in biomass_obj.uf_list:
+		mask = ufs == uf
+		(x_min, y_min), (x_max, y_max) = biomass_obj.bbox_dict[uf]
+		lon[mask] = rng.uniform(x_min, x_max, mask.sum())
+		lat[mask] = rng.uniform(y_min, y_max, mask.sum())
+
+	return pd.DataFrame({
+		"nome": [f"unidade {i}" for i in range(n_points)],
+		"uf": ufs,
+		"lat": lat,
+		"lon": lon,
+		"coef": rng.lognormal(5, 1, n_points),
+	})
+
+def timed(func):
+	start = time.perf_counter()
+	func()
+	return time.perf_counter() - start
+
+
+def main(n_points=50_000):
+	biomass_obj = BiomassMap(Figure(), "cana")
+	df = synthetic_units(biomass_obj, n_points)
+	ufs = ["Brasil"] + biomass_obj.uf_list
+	layers = dict()
+
+	build_static = timed(lambda: layers.update(static=StaticUnits(
+		biomass_obj.fig, biomass_obj.ax, df.drop(columns="coef"),
+		{"tipo_unidade": "Distribuidoras", "marker": "o", "color": "#0044FF"}
+	)))
+	legend_fig = Figure()
+	build_dynamic = timed(lambda: layers.update(dynamic=DynamicUnits(
+		biomass_obj.fig, biomass_obj.ax, legend_fig, legend_fig.add_subplot(111), df.copy(),
+		{"tipo_unidade": "Distribuidoras", "unidade": "m³/mês", "marker": "o", "cmap": "GnBu"}
+	)))
+	# first pass renders the colorbars of every uf, the second one reads them from the cache
+	for uf in ufs:
+		layers["dynamic"].change_visibility(uf, True)
+	switch_static = timed(lambda: [layers["static"].change_visibility(True, uf) for uf in ufs]) / len(ufs)
+	switch_dynamic = timed(lambda: [layers["dynamic"].change_visibility(uf, True) for uf in ufs]) / len(ufs)
+	layers["static"].change_visibility(True, "Brasil")
+	layers["dynamic"].change_visibility("Brasil", True)
+	draw = timed(FigureCanvasAgg(biomass_obj.fig).draw)
+
+	print(f"{n_points} points per layer")
+	print(f"build:  static {build_static:.3f} s, dynamic {build_dynamic:.3f} s")
+	print(f"change_visibility per uf: static {switch_static * 1000:.2f} ms, dynamic {switch_dynamic * 1000:.2f} ms")
+	print(f"draw of the whole map with both layers: {draw:.3f} s")
+
+
+if __name__ == "__main__":
+	main()
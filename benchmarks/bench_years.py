@@ -0,0 +1,77 @@
+"""
+Time of loading a dataset with several years into the ValueMatrix of its region type, and of a PotentialMap of it
+The dataset is a copy of biomass/{prefix} in a temporary folder with an ano column, the values of each year
+are the original ones times (1, 2, 3, ...). Checks that the matrix and the PotentialMap hold the last year only,
+the values BiomassMap opens on, and not the sum of the years.
+The run fails (exit code 1) if they do not
+"""
+import os
+import json
+import time
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+from matplotlib.figure import Figure
+
+import dataset_catalog as catalog_module
+from dataset_catalog import dataset_catalog
+from biomass import BiomassMap
+from potential import PotentialMap, get_value_matrix
+
+
+def write_year_dataset(folder, prefix, years):
+	# biomass/{prefix} with one copy of its rows per year, scaled by the position of the year
+	dataset_df = pd.read_csv(f"{catalog_module.biomass_path}/{prefix}.csv")
+	year_df = pd.concat([dataset_df.assign(ano=year, qnt_produzida=dataset_df.qnt_produzida * (idx + 1)) for idx, year in enumerate(years)])
+	year_df.to_csv(f"{folder}/{prefix}.csv", index=False)
+	shutil.copy(f"{catalog_module.biomass_path}/{prefix}.json", f"{folder}/{prefix}.json")
+
+def main(prefix="cana", years=(2019, 2020, 2021)):
+	folder = tempfile.mkdtemp(prefix="bench_years.")
+	try:
+		os.makedirs(f"{folder}/biomass")
+		write_year_dataset(f"{folder}/biomass", prefix, years)
+		catalog_module.biomass_path = f"{folder}/biomass"
+		catalog_module.catalog_path = f"{folder}/store"
+		dataset_catalog.refresh(force=True)
+
+		biomass_obj = BiomassMap(Figure(), prefix)
+		expected = pd.Series(biomass_obj.biomass_df.qnt_produzida.to_numpy(), index=biomass_obj.biomass_df.cod_ibge)
+
+		value_matrix = get_value_matrix(biomass_obj.region_type)
+		start = time.perf_counter()
+		value_matrix.load([prefix])
+		load_time = time.perf_counter() - start
+		matrix_values = value_matrix.matrix[prefix]
+		matrix_values = matrix_values.loc[matrix_values > 0]
+
+		start = time.perf_counter()
+		potential_obj = PotentialMap(Figure(), [prefix], potential="bruto")
+		potential_time = time.perf_counter() - start
+		potential_values = pd.Series(potential_obj.biomass_df.qnt_produzida.to_numpy(), index=potential_obj.biomass_df.cod_ibge)
+	finally:
+		shutil.rmtree(folder)
+
+	print(f"{prefix} with years {list(years)}: BiomassMap opens on {biomass_obj.year}")
+	print(f"ValueMatrix.load in {load_time:.3f} s, PotentialMap in {potential_time:.3f} s")
+	print(f"total of the last year: {expected.sum():.4g}, ValueMatrix: {matrix_values.sum():.4g}, PotentialMap: {potential_values.sum():.4g}")
+
+	errors = list()
+	if biomass_obj.year != years[-1]:
+		errors.append(f"BiomassMap opens on {biomass_obj.year}")
+	for name, values in [("ValueMatrix", matrix_values), ("PotentialMap", potential_values)]:
+		aligned = values.reindex(expected.index)
+		if set(values.index) != set(expected.index) or not np.allclose(aligned.to_numpy(), expected.to_numpy()):
+			errors.append(f"{name} does not hold the last year")
+
+	for error in errors:
+		print(error)
+	print("OK" if not errors else "FAILED")
+	if errors:
+		raise SystemExit(1)
+
+
+if __name__ == "__main__":
+	main()
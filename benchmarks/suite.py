@@ -0,0 +1,320 @@
+"""
+Benchmark suite of the hot paths, results stored as json and compared with a baseline
+
+Sections (every time is the best of --repeat runs, in seconds):
+	init/{step}/{prefix}          the steps of BiomassMap.__init__ (create_dfs, create_basemap, create_map, ...)
+	change_uf/{prefix}/{uf}       BiomassMap.change_uf for Brasil and every uf
+	units/{layer}/{step}          StaticUnits / DynamicUnits construction and change_visibility for every uf
+	rerun/{case}                  a headless streamlit_app run (AppTest): first run, same view, new uf, new biomass
+	cold_start/{case}             first paint of a fresh session in a new process, with and without startup.warm_up()
+
+The geometry stores and the dataset catalog are loaded before the timings, so the numbers are the ones of a
+warm process, like every rerun after the first one in production. The colorbar and legend images are cleared
+before every timed call instead, so a view is timed as the first time it is shown, whatever --repeat is.
+
+Usage:
+	python -m benchmarks.suite                                  every dataset, writes benchmarks/results/{commit}.json
+	python -m benchmarks.suite --datasets cana soja --repeat 1
+	python -m benchmarks.suite --baseline benchmarks/results/abc1234.json
+	python -m benchmarks.suite --compare old.json new.json      only compares two result files
+A metric is a regression when it is more than --threshold slower (relative) and --min-delta slower (absolute)
+than the baseline, the command then exits with status 1.
+"""
+import os
+import json
+import time
+import logging
+import platform
+import argparse
+import subprocess
+import warnings
+
+import matplotlib
+matplotlib.use("Agg")
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+import pandas as pd
+
+from biomass import BiomassMap
+from static_units import StaticUnits
+from dynamic_units import DynamicUnits
+from dataset_catalog import dataset_catalog
+from geometry_store import load_geometry, available_region_types
+from spatial_index import assign_uf
+from render_cache import render_cache
+from benchmarks.app_secrets import app_secrets
+from benchmarks.bench_cold_start import measure
+from colorbar import render_colorbar, render_legend
+
+results_path = "./benchmarks/results"
+static_units_path = "./static_units_files"
+init_steps = ["read_json_file", "create_dfs", "create_bounds", "create_basemap", "create_baseoutline", "create_map", "create_colorbar"]
+uf_list = ["Brasil", 'RO', 'AC', 'AM', 'RR', 'PA', 'AP', 'TO', 'MA', 'PI', 'CE', 'RN', 'PB', 'PE', 'AL', 'SE', 'BA', 'MG', 'ES', 'RJ', 'SP', 'PR', 'SC', 'RS', 'MS', 'MT', 'GO', 'DF']
+
+
+class TimedBiomassMap(BiomassMap):
+	"""
+	BiomassMap that adds the time of each step of __init__ to self.step_times
+	"""
+
+	def __init__(self, fig, file_prefix):
+		self.step_times = dict()
+		super().__init__(fig, file_prefix)
+
+def timed_step(name):
+	def step(self, *args, **kwargs):
+		start = time.perf_counter()
+		result = getattr(BiomassMap, name)(self, *args, **kwargs)
+		self.step_times[name] = self.step_times.get(name, 0.0) + time.perf_counter() - start
+		return result
+	return step
+
+for step_name in init_steps:
+	setattr(TimedBiomassMap, step_name, timed_step(step_name))
+
+
+def new_fig():
+	fig = Figure()
+	FigureCanvasAgg(fig)
+	return fig
+
+def clear_image_caches():
+	render_colorbar.cache_clear()
+	render_legend.cache_clear()
+
+def best_of(repeat, run):
+	# min over repeat calls of run(), which returns seconds
+	return min(run() for _ in range(repeat))
+
+def drawable_datasets():
+	table = dataset_catalog.get_table()
+	return table.index[table.tipo_regiao.isin(available_region_types())].tolist()
+
+
+def bench_init(prefix, repeat):
+	times = {step: list() for step in init_steps + ["total"]}
+	for _ in range(repeat):
+		clear_image_caches()
+		start = time.perf_counter()
+		biomass_obj = TimedBiomassMap(new_fig(), prefix)
+		times["total"].append(time.perf_counter() - start)
+		for step in init_steps:
+			times[step].append(biomass_obj.step_times.get(step, 0.0))
+	return {f"init/{step}/{prefix}": min(values) for step, values in times.items()}
+
+def bench_change_uf(prefix, repeat):
+	biomass_obj = BiomassMap(new_fig(), prefix)
+	results = dict()
+	for uf in uf_list:
+		def run():
+			# from Brasil every time, so each uf pays its own change of level of detail and culling
+			biomass_obj.change_uf("Brasil")
+			clear_image_caches()
+			start = time.perf_counter()
+			biomass_obj.change_uf(uf)
+			return time.perf_counter() - start
+		results[f"change_uf/{prefix}/{uf}"] = best_of(repeat, run)
+	return results
+
+
+def read_units(prefix):
+	units_df = pd.read_csv(f"{static_units_path}/{prefix}.csv", dtype=str)
+	with open(f"{static_units_path}/{prefix}.json", "r", encoding="utf-8") as file:
+		specs_dict = json.load(file)
+	return assign_uf(units_df, name=prefix), specs_dict
+
+def dynamic_units_df(units_df):
+	# a demand for each unit, the same on every run
+	units_df = units_df.copy()
+	units_df["coef"] = [str(1000 * (idx + 1)) for idx in range(len(units_df))]
+	return units_df
+
+def bench_units(prefix, repeat):
+	biomass_obj = BiomassMap(new_fig(), prefix)
+	units_df, specs_dict = read_units("capitais")
+	dynamic_specs = {"tipo_unidade": "Centros de consumo", "unidade": "ton/mês", "marker": "o", "cmap": "GnBu"}
+
+	def make_static():
+		return StaticUnits(fig=biomass_obj.fig, ax=biomass_obj.ax, df=units_df, specs_dict=specs_dict)
+
+	def make_dynamic():
+		legend_fig = Figure()
+		return DynamicUnits(
+			fig=biomass_obj.fig, ax=biomass_obj.ax, legend_fig=legend_fig, legend_ax=legend_fig.add_subplot(111),
+			df=dynamic_units_df(units_df), specs_dict=dynamic_specs
+		)
+
+	results = dict()
+	for layer, make in [("static", make_static), ("dynamic", make_dynamic)]:
+		def run_build():
+			clear_image_caches()
+			start = time.perf_counter()
+			make()
+			return time.perf_counter() - start
+		results[f"units/{layer}/build"] = best_of(repeat, run_build)
+
+		unit_obj = make()
+		def run_visibility():
+			clear_image_caches()
+			start = time.perf_counter()
+			for uf in uf_list:
+				unit_obj.change_visibility(visible=True, uf=uf)
+			return (time.perf_counter() - start) / len(uf_list)
+		results[f"units/{layer}/change_visibility"] = best_of(repeat, run_visibility)
+	return results
+
+
+def bench_rerun(prefixes):
+	"""
+	Times of headless runs of streamlit_app, render_cache is cleared before the runs that must draw
+	The background renderers are cancelled after every run, so they do not compete with the next one
+	"""
+	from streamlit.testing.v1 import AppTest
+
+	at = AppTest.from_file(os.path.abspath("streamlit_app.py"), default_timeout=300)
+	for section, value in app_secrets().items():
+		at.secrets[section] = value
+
+	def timed_run(clear_cache=False):
+		if clear_cache:
+			render_cache.clear()
+		start = time.perf_counter()
+		at.run()
+		elapsed = time.perf_counter() - start
+		if at.exception:
+			raise RuntimeError(at.exception[0].message)
+		for renderer in ["frame_renderer", "uf_renderer"]:
+			if renderer in at.session_state:
+				at.session_state[renderer].cancel()
+		time.sleep(1)
+		return elapsed
+
+	results = {"rerun/first": timed_run(clear_cache=True)}
+	results["rerun/same_view"] = timed_run()
+	at.selectbox(key="selected_uf").set_value("São Paulo")
+	results["rerun/new_uf"] = timed_run(clear_cache=True)
+	at.selectbox(key="selected_uf").set_value("Brasil")
+	results["rerun/cached_uf"] = timed_run()
+
+	names = dict(zip(dataset_catalog.get_table().index, dataset_catalog.get_table().nome_biomassa))
+	current = at.session_state["selected_biomass_prefix"]
+	other = next((prefix for prefix in prefixes if prefix != current and names[prefix] in at.selectbox(key="selected_biomass_name").options), None)
+	if other is not None:
+		at.selectbox(key="selected_biomass_name").set_value(names[other])
+		results["rerun/new_biomass"] = timed_run(clear_cache=True)
+	return results
+
+
+def bench_cold_start(repeat):
+	results = dict()
+	for case in ["cold", "warm"]:
+		runs = [measure(case) for _ in range(repeat)]
+		results[f"cold_start/first_paint_{case}"] = min(run["first_paint"] for run in runs)
+		if case == "cold":
+			# with the import of streamlit, the warm process imported everything before the session
+			results["cold_start/process_cold"] = min(run["process"] for run in runs)
+	return results
+
+def environment():
+	try:
+		commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+	except (OSError, subprocess.CalledProcessError):
+		commit = None
+	return {
+		"commit": commit,
+		"date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+		"python": platform.python_version(),
+		"matplotlib": matplotlib.__version__,
+		"platform": platform.platform(),
+		"cpu_count": os.cpu_count(),
+	}
+
+def run_suite(prefixes, repeat, sections):
+	for region_type in ["uf"] + sorted(set(dataset_catalog.get_table().loc[prefixes, "tipo_regiao"])):
+		load_geometry(region_type)
+
+	metrics = dict()
+	for idx, prefix in enumerate(prefixes):
+		start = time.perf_counter()
+		if "init" in sections:
+			metrics.update(bench_init(prefix, repeat))
+		if "change_uf" in sections:
+			metrics.update(bench_change_uf(prefix, repeat))
+		print(f"[{idx + 1}/{len(prefixes)}] {prefix}: {time.perf_counter() - start:.1f} s")
+	if "units" in sections and prefixes:
+		metrics.update(bench_units(prefixes[0], repeat))
+	if "rerun" in sections:
+		with warnings.catch_warnings():
+			warnings.simplefilter("ignore")
+			metrics.update(bench_rerun(prefixes))
+	if "cold_start" in sections:
+		metrics.update(bench_cold_start(repeat))
+	return {"environment": environment(), "repeat": repeat, "metrics": metrics}
+
+
+def compare(baseline, current, threshold, min_delta):
+	"""
+	Returns a DataFrame with the metrics of both runs, their ratio and whether each one is a regression
+	"""
+	compared = pd.DataFrame({"baseline": pd.Series(baseline["metrics"]), "current": pd.Series(current["metrics"])}).dropna()
+	compared["ratio"] = compared.current / compared.baseline
+	compared["regression"] = (compared.ratio > 1 + threshold) & (compared.current - compared.baseline > min_delta)
+	return compared
+
+def summary(compared):
+	# one line per section: the total time of its metrics in both runs
+	sections = compared.index.str.split("/").str[0]
+	totals = compared.groupby(sections)[["baseline", "current"]].sum()
+	totals["ratio"] = totals.current / totals.baseline
+	totals["regressions"] = compared.groupby(sections).regression.sum()
+	return totals
+
+def print_comparison(compared):
+	with pd.option_context("display.float_format", "{:.4f}".format, "display.width", 200):
+		print(summary(compared))
+		regressions = compared.loc[compared.regression].sort_values("ratio", ascending=False)
+		if len(regressions):
+			print(f"\n{len(regressions)} regressions:")
+			print(regressions[["baseline", "current", "ratio"]])
+		else:
+			print("\nNo regressions")
+
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Times the hot paths of the app, stores and compares the results")
+	parser.add_argument("--datasets", nargs="+", help="dataset prefixes (default: every drawable dataset)")
+	parser.add_argument("--sections", nargs="+", default=["init", "change_uf", "units", "rerun", "cold_start"], choices=["init", "change_uf", "units", "rerun", "cold_start"])
+	parser.add_argument("--repeat", type=int, default=3)
+	parser.add_argument("--out", help=f"result file (default: {results_path}/{{commit}}.json)")
+	parser.add_argument("--baseline", help="result file to compare the run with")
+	parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CURRENT"), help="compare two result files, nothing is run")
+	parser.add_argument("--threshold", type=float, default=0.2, help="relative slowdown flagged as a regression (default: 0.2)")
+	parser.add_argument("--min-delta", type=float, default=0.002, help="absolute slowdown (s) below which nothing is flagged")
+	args = parser.parse_args()
+	# the João Pessoa fix of assign_uf would be logged on every build of the unit layers
+	logging.getLogger("spatial_index").setLevel(logging.ERROR)
+
+	if args.compare:
+		with open(args.compare[0], "r", encoding="utf-8") as file:
+			baseline = json.load(file)
+		with open(args.compare[1], "r", encoding="utf-8") as file:
+			current = json.load(file)
+	else:
+		current = run_suite(args.datasets or drawable_datasets(), args.repeat, args.sections)
+		out = args.out or f"{results_path}/{current['environment']['commit'] or 'local'}.json"
+		os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+		with open(out, "w", encoding="utf-8") as file:
+			json.dump(current, file, indent=1)
+		print(f"{len(current['metrics'])} metrics written to {out}")
+
+		baseline = None
+		if args.baseline:
+			with open(args.baseline, "r", encoding="utf-8") as file:
+				baseline = json.load(file)
+
+	if baseline is not None:
+		compared = compare(baseline, current, args.threshold, args.min_delta)
+		print_comparison(compared)
+		if compared.regression.any():
+			raise SystemExit(1)
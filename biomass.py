@@ -1,12 +1,32 @@
 import json
-import io
+import functools
 import numpy as np
 import pandas as pd
 import matplotlib
-import matplotlib.pyplot as plt
+from matplotlib.collections import PolyCollection, LineCollection
 
-from itertools import groupby
-from operator import itemgetter
+from geometry_store import load_geometry, lod_tolerances, intersecting
+from uf_stats import create_uf_stats, get_stat
+from colorbar import render_colorbar
+from dataset_catalog import dataset_catalog
+from perf import timed
+
+
+# dpi of the rendered map (streamlit_app.fig_to_png), used to pick the level of detail
+render_dpi = 200
+# Vertex budget of the whole map, coarser levels of detail are used above it
+max_vertices = 150_000
+# Margin of a view around its regions, as a fraction of their width and height
+bbox_pad = 0.01
+# Views of Brasil and of the ufs, [[x_min, y_min], [x_max, y_max]]
+bbox_path = "map_files/bbox.json"
+
+
+@functools.lru_cache(maxsize=1)
+def read_bbox():
+	# read once per process, callers must not modify it
+	with open(bbox_path, "r", encoding="utf-8") as file:
+		return dict(json.load(file))
 
 class BiomassMap:
 	"""
@@ -27,17 +47,42 @@ class BiomassMap:
 
 		self.biomass_df
 		self.uf_df
-
-		self.baseartist_dict
-		self.baseoutline_dict
-		self.artist_dict
-		self.bbox_dict
+		self.uf_stats: statistics of the values shown (the selected year)
+		self.norm_stats: statistics the color scale is taken from (every year)
+		self.years: sorted list of the years of the dataset, empty when it has none
+		self.year
+		self.year_matrix: (n_regions, n_years) array, None when the dataset has no years
+		self.geometry
+		self.uf_geometry
+
+		self.basemap
+		self.baseoutline
+		self.regionmap
+		self.base_uf
+		self.region_uf
+		self.region_cod
+		self.region_index
+		self.region_values
+		self.base_colors
+		self.outline_colors
+		self.region_colors
+		self.edge_colors
+		self.visible_ufs
+		self.bbox_dict: [[x_min, y_min], [x_max, y_max]] of Brasil and of every uf
+		self.view_bbox: the bbox shown, of Brasil, of a uf or of the region zoomed to
+		self.base_bounds
+		self.region_bounds: (n, 4) bounds of each polygon of the basemap / regionmap
+		self.drawn_base
+		self.drawn_regions: positions (in uf_df / biomass_df) of the polygons the collections hold
+		self.drawn_level: level of detail of the vertices the collections hold
+		self.lod_level
 
 		self.norm
 		self.mappable
 		self.cbar
 	"""
 
+	@timed("BiomassMap.__init__")
 	def __init__(self, fig, file_prefix):
 		self.uf_list = ['RO', 'AC', 'AM', 'RR', 'PA', 'AP', 'TO', 'MA', 'PI', 'CE', 'RN', 'PB', 'PE', 'AL', 'SE', 'BA', 'MG', 'ES', 'RJ', 'SP', 'PR', 'SC', 'RS', 'MS', 'MT', 'GO', 'DF']
 
@@ -54,22 +99,24 @@ class BiomassMap:
 		
 		self.read_json_file(file_prefix)
 		self.create_dfs(file_prefix)
+		self.create_bounds()
+		self.view_bbox = self.bbox_dict["Brasil"]
+		self.lod_level = self.select_lod(self.view_bbox)
 		self.create_basemap()
 		self.create_baseoutline()
-		self.read_bbox()
 		self.create_map()
 		self.create_colorbar("Brasil")
 
 
 
+	@timed("BiomassMap.read_json_file")
 	def read_json_file(self, file_prefix):
 		"""
 		file_prefix: str
 			There should be file_prefix.csv and file_prefix.json inside the biomass folder
+			(read through dataset_catalog)
 		"""
-		biomass_path = "./biomass"
-		with open(f"{biomass_path}/{file_prefix}.json", "r", encoding="utf-8") as file:
-			json_dict = json.load(file)
+		json_dict = dataset_catalog.specs(file_prefix)
 
 		self.biomass_name = json_dict["nome_biomassa"]
 		self.biomass_type = json_dict["tipo_biomassa"]
@@ -79,18 +126,13 @@ class BiomassMap:
 		self.derived_coef = json_dict["conversao_derivado"]
 		self.gas_coef = json_dict["conversao_gas"]
 		self.source = json_dict["fonte"]
-		try:
-			self.norm_type = json_dict["norm"]  # "linear" ou "log"
-		except KeyError:
-			self.norm_type = "linear"
-
-		try:
-			self.obs = json_dict["obs"]
-		except KeyError:
-			self.obs = ""
+		# None when the json does not have them
+		self.norm_type = json_dict.get("norm") or "linear"  # "linear" ou "log"
+		self.obs = json_dict.get("obs") or ""
 
 
 
+	@timed("BiomassMap.create_dfs")
 	def create_dfs(self, file_prefix):
 		"""
 		The self.read_json_file(file_prefix) method must be executed before this one
@@ -99,32 +141,44 @@ class BiomassMap:
 			- uf
 			- qnt_produzida
 		"""
-		biomass_path = "./biomass"
-		map_path = "./map_files/geometry"
-
-		biomass_df = pd.read_csv(f"{biomass_path}/{file_prefix}.csv")
+		biomass_df = dataset_catalog.load(file_prefix)
 		biomass_df = biomass_df.drop("uf", axis=1)
 
-		map_df = pd.read_json(f"{map_path}/{self.region_type}.json")
+		self.years = dataset_catalog.years(file_prefix)
+		if self.years:
+			# one row per region (kept if it has production in any year), the values of every year go to self.year_matrix
+			year_df = biomass_df.pivot_table(index="cod_ibge", columns="ano", values="qnt_produzida", aggfunc="sum", fill_value=0)
+			biomass_df = pd.DataFrame({"cod_ibge": year_df.index, "qnt_produzida": year_df.max(axis=1).to_numpy()})
+
+		self.geometry = load_geometry(self.region_type)
+		map_df = self.geometry.to_frame()
 		map_df = map_df.loc[map_df.cod_ibge.isin(biomass_df.cod_ibge)]
 		map_df = map_df.reset_index(drop=True)
 
 		self.biomass_df = pd.merge(biomass_df, map_df, on="cod_ibge")
-		self.biomass_df = self.biomass_df.loc[self.biomass_df.qnt_produzida > 0]
-		self.uf_df = pd.read_json(f"{map_path}/uf.json")
+		self.biomass_df = self.biomass_df.loc[self.biomass_df.qnt_produzida > 0].reset_index(drop=True)
+		self.uf_geometry = load_geometry("uf")
+		self.uf_df = self.uf_geometry.to_frame()
+
+		self.year_matrix = None
+		self.year = None
+		if self.years:
+			self.create_year_matrix(year_df)
+		# regions without production in self.year are not counted
+		self.uf_stats = create_uf_stats(self.biomass_df.loc[self.biomass_df.qnt_produzida > 0], "qnt_produzida")
+		if not self.years:
+			self.norm_stats = self.uf_stats
 
-		# biomass_df.columns: ['cod_ibge', 'qnt_produzida', 'ano', 'nome', 'uf', 'macro', 'geometry']
-		# uf_df.columns: ['cod_ibge', 'nome', 'uf', 'macro', 'geometry']
+		# biomass_df.columns: ['cod_ibge', 'qnt_produzida', 'nome', 'uf', 'macro', 'geometry_idx']
+		# qnt_produzida is the one of self.year for datasets with an ano column
+		# uf_df.columns: ['cod_ibge', 'nome', 'uf', 'macro', 'geometry_idx']
+		# geometry_idx is the position of the region in self.geometry (or self.uf_geometry)
 
 
 
 	def update_norm(self, uf):
-		if uf == "Brasil":
-			new_vmax = self.biomass_df.qnt_produzida.max()
-			new_vmin = self.biomass_df.qnt_produzida.min()
-		else:
-			new_vmax = self.biomass_df.loc[self.biomass_df["uf"] == uf].qnt_produzida.max()
-			new_vmin = self.biomass_df.loc[self.biomass_df["uf"] == uf].qnt_produzida.min()
+		new_vmax = get_stat(self.norm_stats, uf, "max")
+		new_vmin = get_stat(self.norm_stats, uf, "min")
 
 		if pd.isna(new_vmax):
 			new_vmin = 1
@@ -137,194 +191,254 @@ class BiomassMap:
 
 
 
+	def production_by_uf(self):
+		"""
+		Total production per uf, read from self.uf_stats
+		"""
+		uf_stats = self.uf_stats.drop("Brasil")
+		summary = pd.DataFrame({
+			"UF": uf_stats.index,
+			f"Produção ({self.unit})": uf_stats["sum"].to_numpy(),
+			"Regiões": uf_stats["count"].to_numpy(),
+			"% do Brasil": 100 * uf_stats["sum"].to_numpy() / self.uf_stats.at["Brasil", "sum"],
+		})
+		return summary.sort_values(f"Produção ({self.unit})", ascending=False).reset_index(drop=True)
+
+	@timed("BiomassMap.create_basemap")
 	def create_basemap(self):
-		self.baseartist_dict = dict()
+		"""
+		The whole UF layer is a single PolyCollection, self.base_uf holds the uf of each polygon
+		"""
 		if self.norm_type == "linear":
 			basemap_color = self.cmap(0)
 		elif self.norm_type == "log":
 			basemap_color = "white"
 
-		for index, row in self.uf_df.iterrows():
-			self.baseartist_dict[row.uf] = self.ax.fill(
-				*row.geometry,
-				color=basemap_color
-			)[0]  # fill() method returns a list, so the [0] is needed to get the artist object
-	
+		self.base_uf = self.uf_df.uf.to_numpy()
+		self.visible_ufs = set(self.base_uf)
+		self.base_colors = np.tile(matplotlib.colors.to_rgba(basemap_color), (len(self.base_uf), 1))
+		self.basemap = PolyCollection(
+			self.uf_geometry.rings(self.uf_df.geometry_idx, self.lod_level),
+			facecolors=self.base_colors,
+			edgecolors="none"
+		)
+		self.ax.add_collection(self.basemap)
+		self.drawn_base = np.arange(len(self.base_uf))
+
+	@timed("BiomassMap.create_baseoutline")
 	def create_baseoutline(self):
-		self.baseoutline_dict = dict()
-		for index, row in self.uf_df.iterrows():
-			self.baseoutline_dict[row.uf] = self.ax.plot(
-				*row.geometry,
-				color="black",
-				linewidth=0.5
-			)[0]  # plot() method returns a list, so the [0] is needed to get the artist object
-
+		self.outline_colors = np.tile(matplotlib.colors.to_rgba("black"), (len(self.base_uf), 1))
+		self.baseoutline = LineCollection(
+			self.uf_geometry.rings(self.uf_df.geometry_idx, self.lod_level),
+			colors=self.outline_colors,
+			linewidths=0.5,
+			zorder=2
+		)
+		self.ax.add_collection(self.baseoutline)
+
+	@timed("BiomassMap.create_map")
 	def create_map(self):
 		"""
-		self.artist_dict is a dict with uf's as keys
-		the value for each key is a list that contains artists
-		*There might be some uf's out of the dict*
+		self.regionmap is a PolyCollection with one polygon per row of self.biomass_df
+		self.region_colors holds the RGBA face color of each polygon, in the same order
 		"""
-		self.ax.set_title(f"Produção de {self.biomass_name}")
-		self.artist_dict = dict()  
+		self.ax.set_title(self.map_title())
 		self.update_norm("Brasil")
 
-		for index, row in self.biomass_df.iterrows():
-			artist_color = self.cmap( self.norm(row.qnt_produzida) )
-			artist = self.ax.fill(
-				*row.geometry,
-				url=row.cod_ibge,
-				color=artist_color,
-				edgecolor="grey",
-				linewidth=0.1
-			)[0]  # fill() method returns a list, so the [0] is needed to get the artist object
-			
-			try:
-				self.artist_dict[row.uf].append(artist)
-			except KeyError:
-				self.artist_dict[row.uf] = [artist]
-		self.resize_ax("Brasil")
-
-	def read_bbox(self):
-		# Each value of the dict follows: [[x_min, y_min], [x_max, y_max]]
-		with open(f"map_files/bbox.json", "r", encoding="utf-8") as file:
-			self.bbox_dict = dict( json.load(file) )
+		self.region_uf = self.biomass_df.uf.to_numpy()
+		self.region_cod = self.biomass_df.cod_ibge.to_numpy()
+		self.region_index = pd.Index(self.region_cod)  # cod_ibge -> position in the collection
+		self.region_values = self.biomass_df.qnt_produzida.to_numpy(dtype=float)
+		self.region_colors = self.cmap(self.norm(self.region_values))
+		self.edge_colors = np.tile(matplotlib.colors.to_rgba("grey"), (len(self.region_uf), 1))
+		self.regionmap = PolyCollection(
+			self.geometry.rings(self.biomass_df.geometry_idx, self.lod_level),
+			facecolors=self.region_colors,
+			edgecolors=self.edge_colors,
+			linewidths=0.1
+		)
+		self.ax.add_collection(self.regionmap)
+		self.drawn_regions = np.arange(len(self.region_uf))
+		self.drawn_level = self.lod_level
+		self.resize_ax(self.bbox_dict["Brasil"])
+		self.update_collections()
+
+	def create_year_matrix(self, year_df):
+		"""
+		year_df: DataFrame indexed by cod_ibge with one column per year
+		Starts on the last year, the color scale (self.norm_stats) covers every year so the colors can be compared
+		"""
+		self.year_matrix = year_df.loc[self.biomass_df.cod_ibge].to_numpy(dtype=float)
+		self.year = self.years[-1]
+		self.biomass_df["qnt_produzida"] = self.year_matrix[:, -1]
+
+		all_years_df = pd.DataFrame({
+			"uf": np.repeat(self.biomass_df.uf.to_numpy(), len(self.years)),
+			"qnt_produzida": self.year_matrix.ravel(),
+		})
+		self.norm_stats = create_uf_stats(all_years_df.loc[all_years_df.qnt_produzida > 0], "qnt_produzida")
+
+	def map_title(self):
+		if self.year is None:
+			return f"Produção de {self.biomass_name}"
+		return f"Produção de {self.biomass_name} ({self.year})"
+
+	@timed("BiomassMap.change_year")
+	def change_year(self, year):
+		"""
+		Recolors the existing regions with the values of year from self.year_matrix, the geometry is not touched
+		"""
+		self.year = year
+		self.region_values = self.year_matrix[:, self.years.index(year)]
+		self.biomass_df["qnt_produzida"] = self.region_values
+		self.uf_stats = create_uf_stats(self.biomass_df.loc[self.region_values > 0], "qnt_produzida")
+		self.ax.set_title(self.map_title())
+		self.region_colors = self.cmap(self.norm(self.region_values))
+		self.update_collections()
+
+	@timed("BiomassMap.create_bounds")
+	def create_bounds(self):
+		"""
+		Brasil and the ufs keep the views of map_files/bbox.json, a uf missing from it gets the bounds of its
+		geometry with bbox_pad around them (the bounds of the store differ from the file by up to 0.01 degree)
+		"""
+		uf_idx = self.uf_df.geometry_idx.to_numpy()
+		self.bbox_dict = dict(read_bbox())
+		self.bbox_dict.setdefault("Brasil", self.uf_geometry.extent(uf_idx, pad=bbox_pad))
+		for uf, idx in zip(self.uf_df.uf, uf_idx):
+			self.bbox_dict.setdefault(uf, self.uf_geometry.extent([idx], pad=bbox_pad))
+
+		self.base_bounds = np.asarray(self.uf_geometry.bounds)[uf_idx]
+		self.region_bounds = np.asarray(self.geometry.bounds)[self.biomass_df.geometry_idx.to_numpy()]
+
+	def region_bbox(self, region_type, cod_ibge):
+		"""
+		Bbox of one region of any region type with a geometry store (uf, meso, micro, ...)
+		"""
+		store = load_geometry(region_type)
+		idx = np.flatnonzero(np.asarray(store.cod_ibge) == int(cod_ibge))
+		if len(idx) == 0:
+			raise KeyError(f"No {region_type} region with cod_ibge {cod_ibge}")
+		return store.extent(idx[:1], pad=bbox_pad)
 
 	def change_visibility(self, uf, visible):
 		"""
 		uf: str
 		visible: bool
 		"""
-		self.baseartist_dict[uf].set_visible(visible)
-		self.baseoutline_dict[uf].set_visible(visible)
-		
-		if uf in self.artist_dict.keys():
-			for artist in self.artist_dict[uf]:
-				artist.set_visible(visible)
+		if visible:
+			self.visible_ufs.add(uf)
+		else:
+			self.visible_ufs.discard(uf)
+		self.update_collections()
 
-	def update_color(self, uf):
+	@timed("BiomassMap.update_collections")
+	def update_collections(self):
 		"""
-		artist: str
-		vmin = int or float
-		vmax = int or float
+		Culls the polygons of the ufs not in self.visible_ufs and the ones outside self.view_bbox,
+		the collections only get the vertices (when they changed) and the colors of what is on screen
 		"""
+		drawn_base = np.flatnonzero(
+			np.isin(self.base_uf, list(self.visible_ufs)) & intersecting(self.base_bounds, self.view_bbox)
+		)
+		drawn_regions = np.flatnonzero(
+			np.isin(self.region_uf, list(self.visible_ufs)) & intersecting(self.region_bounds, self.view_bbox)
+		)
+
+		if self.drawn_level != self.lod_level or not np.array_equal(drawn_base, self.drawn_base):
+			uf_rings = self.uf_geometry.rings(self.uf_df.geometry_idx.to_numpy()[drawn_base], self.lod_level)
+			self.basemap.set_verts(uf_rings)
+			self.baseoutline.set_segments(uf_rings)
+		if self.drawn_level != self.lod_level or not np.array_equal(drawn_regions, self.drawn_regions):
+			self.regionmap.set_verts(self.geometry.rings(self.biomass_df.geometry_idx.to_numpy()[drawn_regions], self.lod_level))
+		self.drawn_base = drawn_base
+		self.drawn_regions = drawn_regions
+		self.drawn_level = self.lod_level
+
+		self.basemap.set_facecolor(self.base_colors[drawn_base])
+		self.baseoutline.set_color(self.outline_colors[drawn_base])
+		self.regionmap.set_facecolor(self.region_colors[drawn_regions])
+		self.regionmap.set_edgecolor(self.edge_colors[drawn_regions])
+
+	def update_color(self, uf):
 		self.update_norm(uf)
-		if uf == "Brasil":
-			for artist_list in self.artist_dict.values():
-				for artist in artist_list:
-					cod_ibge = artist.get_url()
-					# If there is more than one cod_ibge in the DataFrame, the line below will cause an error, check your DataFrame
-					artist_value = float (self.biomass_df.loc[self.biomass_df.cod_ibge == cod_ibge].qnt_produzida)
-					new_color = self.cmap(self.norm(artist_value))
-					artist.set(color=new_color, edgecolor="grey", linewidth=0.1)
-
-		elif uf in self.artist_dict.keys():
-			artist_list = self.artist_dict[uf]
-			for artist in artist_list:
-				cod_ibge = artist.get_url()
-				# If there is more than one cod_ibge in the DataFrame, the line below will cause an error, check your DataFrame
-				artist_value = float (self.biomass_df.loc[self.biomass_df.cod_ibge == cod_ibge].qnt_produzida)
-				new_color = self.cmap(self.norm(artist_value))
-				artist.set(color=new_color, edgecolor="grey", linewidth=0.1)
-
-
-	def change_uf(self, uf):
-		self.resize_ax(uf)
+		self.region_colors = self.cmap(self.norm(self.region_values))
+		self.update_collections()
+
+	def get_region_values(self, cod_ibge):
+		"""
+		cod_ibge: int or list of int
+		Returns the qnt_produzida of each cod_ibge, NaN for the ones that are not on the map
+		"""
+		positions = self.region_index.get_indexer(np.atleast_1d(cod_ibge))
+		values = np.where(positions >= 0, self.region_values[positions], np.nan)
+		return values
+
+
+	def select_lod(self, bbox):
+		"""
+		Returns the level of detail (see geometry_store.lod_tolerances) used to draw bbox:
+		the coarsest level whose tolerance is still below one rendered pixel,
+		made coarser while the polygons in bbox have more than max_vertices vertices
+		"""
+		rendered_width = self.ax.bbox.width * render_dpi / self.fig.dpi
+		pixel_size = (bbox[1][0] - bbox[0][0]) / rendered_width
+
+		level = max(lvl for lvl, tolerance in enumerate(lod_tolerances) if tolerance <= pixel_size)
+		while level < len(lod_tolerances) - 1 and self.count_vertices(level, bbox) > max_vertices:
+			level += 1
+		return level
+
+	def count_vertices(self, level, bbox):
+		base_idx = self.uf_df.geometry_idx.to_numpy()[intersecting(self.base_bounds, bbox)]
+		region_idx = self.biomass_df.geometry_idx.to_numpy()[intersecting(self.region_bounds, bbox)]
+		return (
+			self.geometry.n_vertices(region_idx, level)
+			+ 2 * self.uf_geometry.n_vertices(base_idx, level)  # basemap and outline
+		)
+
+	@timed("BiomassMap.change_uf")
+	def change_uf(self, uf, zoom=None):
+		"""
+		uf: str
+			"Brasil" or a uf abbreviation, the other ufs are hidden and the colors are scaled to uf
+		zoom: (region_type, cod_ibge) or None
+			shows the bbox of that region (see region_bbox) instead of the bbox of uf
+		"""
+		self.resize_ax(self.bbox_dict[uf] if zoom is None else self.region_bbox(*zoom))
+		self.lod_level = self.select_lod(self.view_bbox)
 		self.update_colorbar(uf)
-		self.update_color(uf)
-		
+
 		if uf == "Brasil":
 			# Show all
-			for uf_key in self.uf_list:
-				self.change_visibility(uf_key, visible=True)
+			self.visible_ufs = set(self.uf_list)
 
 		# Not "Brasil":
 		else:
-			# Hide all
-			for uf_key in self.uf_list:
-				self.change_visibility(uf_key, visible=False)
-			# Show selected uf
-			self.change_visibility(uf, visible=True)
+			# Show selected uf only
+			self.visible_ufs = {uf}
+		self.update_color(uf)
 
 
 
+	@timed("BiomassMap.create_colorbar")
 	def create_colorbar(self, uf):
 		self.update_norm(uf)
 		self.mappable = matplotlib.cm.ScalarMappable(norm=self.norm, cmap=self.cmap)
 
-		fig, ax = plt.subplots()
-		fig.colorbar(
-    		self.mappable,
-    		orientation='vertical',
-		).set_label(label=f" Produção de {self.biomass_name} ({self.unit})", labelpad=5)
-		ax.remove()
-
-		cbar_array = self.fig_to_array(fig)
-		self.cbar_array = self.remove_white_spaces(cbar_array)
-
-	def fig_to_array(self, fig):
-		io_buf = io.BytesIO()
-		fig.savefig(io_buf, format='raw')
-		io_buf.seek(0)
-		img_arr = np.reshape(np.frombuffer(io_buf.getvalue(), dtype=np.uint8),
-                     newshape=(int(fig.bbox.bounds[3]), int(fig.bbox.bounds[2]), -1))
-		io_buf.close()
-		return np.array(img_arr)
-
-	def fix_list(self,lst):
-		lst = sorted(lst)
-		for i in range(len(lst)):
-			if lst[i] + 1 != lst[i+1]:
-				fim_comeco = i
-				break
-		lst = lst[::-1]
-		for i in range(len(lst)):
-			if lst[i] - 1 != lst[i+1]:
-				comeco_fim = len(lst) - i
-				break
-		lst = lst[::-1]
-		return lst[:fim_comeco+1] + lst[comeco_fim:]
-
-	def remove_white_spaces(self, img_arr):
-		# Remove horizontal white lines
-		hor_indexes = list()
-		for idx, line in enumerate(img_arr):
-			if self.white_line(line):
-				hor_indexes.append(idx)
-		hor_indexes = self.fix_list(hor_indexes)
-		img_arr = np.delete(img_arr, hor_indexes, 0)
-
-		# Remove vertical white lines
-		img_arr = np.transpose( img_arr, (1,0,2) )
-		ver_indexes = list()
-		for idx, line in enumerate(img_arr):
-			if self.white_line(line):
-				ver_indexes.append(idx)
-
-		ver_indexes = self.fix_list(ver_indexes)
-		img_arr = np.delete(img_arr, ver_indexes, 0)
-
-		img_arr = np.transpose( img_arr, (1,0,2) )
-		return img_arr
- 
-
-
-	def white_line(self, line):
-		line = np.array(line)
-		len_line = len(line)
-		if np.array_equal( line , np.array([[255, 255, 255, 255] for _ in range(len(line))]) ):
-			return True
-
-		elif np.array_equal(line[:, 3] , [0 for _ in range(len(line))]):
-			return True
-
-		else:
-			return False
+		self.cbar_array = render_colorbar(
+			self.cmap.name,
+			self.norm_type,
+			float(self.norm.vmin),
+			float(self.norm.vmax),
+			label=f" Produção de {self.biomass_name} ({self.unit})"
+		)
 
 	def update_colorbar(self, uf):
 		self.create_colorbar(uf)		
 
-	def resize_ax(self, uf):
-		bbox = self.bbox_dict[uf]
+	def resize_ax(self, bbox):
+		# bbox: [[x_min, y_min], [x_max, y_max]], also the view the polygons are culled to
+		self.view_bbox = bbox
 		self.ax.set_xlim( [bbox[0][0], bbox[1][0]] )  # [x_min, x_max]
 		self.ax.set_ylim( [bbox[0][1], bbox[1][1]] )  # [y_min, y_max]
\ No newline at end of file
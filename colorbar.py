@@ -0,0 +1,88 @@
+"""
+Colorbar and legend images
+
+Every image is drawn on one off-screen Figure that is never registered with pyplot, so
+plt.get_fignums() does not grow, and is memoized by its arguments: switching back to a
+uf that was already shown costs a dict lookup.
+The returned arrays are read-only and shared, copy them before changing anything.
+"""
+import threading
+from functools import lru_cache
+
+import matplotlib
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+from image_utils import fig_to_array, remove_white_spaces
+from perf import timed
+
+offscreen_fig = Figure()
+FigureCanvasAgg(offscreen_fig)
+offscreen_lock = threading.Lock()
+
+
+def create_norm(norm_type, vmin, vmax, boundaries=None, n_colors=256):
+	"""
+	norm_type: str
+		"linear", "log" or "boundary" (boundaries are required for "boundary")
+	"""
+	if norm_type == "linear":
+		return matplotlib.colors.Normalize(vmin=vmin, vmax=vmax)
+	elif norm_type == "log":
+		return matplotlib.colors.LogNorm(vmin=vmin, vmax=vmax)
+	elif norm_type == "boundary":
+		return matplotlib.colors.BoundaryNorm(list(boundaries), n_colors, extend='neither')
+	raise ValueError(f"Unknown norm_type: {norm_type}")
+
+def render_offscreen(draw):
+	"""
+	Clears the off-screen figure, calls draw(fig) and returns the trimmed RGBA array
+	"""
+	with offscreen_lock:
+		offscreen_fig.clear()
+		draw(offscreen_fig)
+		img_arr = remove_white_spaces(fig_to_array(offscreen_fig))
+		offscreen_fig.clear()
+
+	img_arr.flags.writeable = False
+	return img_arr
+
+@lru_cache(maxsize=512)
+@timed("colorbar.render_colorbar")
+def render_colorbar(cmap_name, norm_type, vmin, vmax, label, boundaries=None):
+	"""
+	cmap_name: str
+	norm_type: str
+		see create_norm
+	vmin, vmax: float or None
+	label: str
+	boundaries: tuple or None
+	"""
+	cmap = matplotlib.colormaps[cmap_name]
+	norm = create_norm(norm_type, vmin, vmax, boundaries, cmap.N)
+
+	def draw(fig):
+		ax = fig.add_subplot(111)
+		fig.colorbar(
+			matplotlib.cm.ScalarMappable(norm=norm, cmap=cmap),
+			ax=ax,
+			orientation='vertical',
+		).set_label(label=label, labelpad=5)
+		ax.remove()
+
+	return render_offscreen(draw)
+
+@lru_cache(maxsize=64)
+@timed("colorbar.render_legend")
+def render_legend(entries):
+	"""
+	entries: tuple of (marker, label, color)
+	"""
+	def draw(fig):
+		ax = fig.add_subplot(111)
+		ax.axis("off")
+		for marker, label, color in entries:
+			ax.scatter(0, 0, marker=marker, label=label, color=color)
+		ax.legend(framealpha=1, loc="center")
+
+	return render_offscreen(draw)
@@ -0,0 +1,291 @@
+"""
+Catalog of the biomass datasets
+
+Every dataset is a pair biomass/{prefix}.csv + biomass/{prefix}.json. The catalog keeps them all in
+map_files/store/biomass/:
+	catalog.json        one row per dataset: the fields of its json, the mtime and size of both files,
+	                    the years it has and the rows [start, stop) of the dataset in the arrays below
+	cod_ibge.npy        int64, the rows of every dataset one after the other
+	qnt_produzida.npy   float64
+	ano.npy             int64, no_year for the datasets whose csv has no ano column
+	uf.npy              unicode
+
+The arrays are loaded with mmap_mode="r", so listing the datasets reads one small json file and
+loading a dataset is a slice of the memory-mapped arrays, no csv is parsed.
+When a csv or json changes (or a dataset is added / removed) only the changed datasets are parsed again,
+the rows of the others are copied from the previous arrays. The biomass folder is scanned for changes at most
+once every scan_interval seconds, the accessors in between read the loaded table.
+
+Usage:
+	python dataset_catalog.py            builds (or updates) the catalog
+	python dataset_catalog.py --check    also compares every dataset with its csv
+"""
+import os
+import json
+import time
+import argparse
+import tempfile
+import threading
+import numpy as np
+import pandas as pd
+
+from perf import timed
+
+biomass_path = "./biomass"
+catalog_path = "./map_files/store/biomass"
+numeric_columns = {"cod_ibge": np.int64, "qnt_produzida": np.float64, "ano": np.int64}
+text_columns = ["uf"]
+stat_columns = ["json_mtime", "json_size", "csv_mtime", "csv_size"]
+# Columns of the table that are not json fields
+catalog_columns = stat_columns + ["anos", "start", "stop"]
+no_year = 0
+# seconds a scan of the biomass folder stays valid, a changed file is seen at most this late
+scan_interval = 2.0
+
+
+def scan_sources():
+	"""
+	DataFrame indexed by prefix with the mtime and size of the json and csv file of every dataset
+	"""
+	prefixes = sorted(f.removesuffix(".json") for f in os.listdir(biomass_path) if f.endswith(".json"))
+	sources = {column: [] for column in stat_columns}
+	found = list()
+	for prefix in prefixes:
+		try:
+			json_stat = os.stat(f"{biomass_path}/{prefix}.json")
+			csv_stat = os.stat(f"{biomass_path}/{prefix}.csv")
+		except FileNotFoundError:
+			continue
+		found.append(prefix)
+		sources["json_mtime"].append(json_stat.st_mtime)
+		sources["json_size"].append(json_stat.st_size)
+		sources["csv_mtime"].append(csv_stat.st_mtime)
+		sources["csv_size"].append(csv_stat.st_size)
+	return pd.DataFrame(sources, index=pd.Index(found, name="prefix"), dtype=float)
+
+def json_fields(row):
+	"""
+	The json fields of a row of the catalog table, every column is kept
+	A field the json of the dataset does not have (or has empty) is None
+	"""
+	return {
+		field: None if isinstance(value, float) and np.isnan(value) else value
+		for field, value in row.drop(catalog_columns).items()
+	}
+
+@timed("dataset_catalog.read_dataset")
+def read_dataset(prefix):
+	"""
+	Parses biomass/{prefix}.csv and .json
+	Returns (specs, arrays): the json dict and {column: array} for numeric_columns and text_columns
+	"""
+	with open(f"{biomass_path}/{prefix}.json", "r", encoding="utf-8") as file:
+		specs = json.load(file)
+
+	wanted_columns = list(numeric_columns) + text_columns
+	dataset_df = pd.read_csv(f"{biomass_path}/{prefix}.csv", usecols=lambda column: column in wanted_columns)
+	if "ano" not in dataset_df.columns:
+		dataset_df["ano"] = no_year
+	arrays = {column: dataset_df[column].to_numpy(dtype=dtype) for column, dtype in numeric_columns.items()}
+	for column in text_columns:
+		arrays[column] = dataset_df[column].fillna("").to_numpy(dtype=str)
+	return specs, arrays
+
+
+class DatasetCatalog:
+	"""
+	Process-wide catalog, the table and the arrays are shared (read-only) by every session
+
+	All attributes:
+		self.loaded: (table, arrays), None before the first refresh, replaced as a whole so a reader never
+			slices the arrays of one build with the rows of another
+			table: DataFrame indexed by prefix, the json fields and catalog_columns of every dataset
+			arrays: {column: memory-mapped array}
+		self.scanned_at: time.monotonic() of the last scan_sources, None before the first
+		self.lock
+	"""
+
+	def __init__(self):
+		self.loaded = None
+		self.scanned_at = None
+		self.lock = threading.Lock()
+
+	def refresh(self, force=False):
+		"""
+		Loads the catalog, updating it first if a source file changed since it was built
+		The sources are only scanned again scan_interval seconds after the last scan, or when force
+		"""
+		now = time.monotonic()
+		loaded = self.loaded
+		if loaded is not None and not force and now - self.scanned_at < scan_interval:
+			return
+		sources = scan_sources()
+		if loaded is not None and self.is_current(loaded[0], sources):
+			self.scanned_at = now
+			return
+
+		with self.lock:
+			if self.loaded is not None and self.is_current(self.loaded[0], sources):
+				return
+
+			stored_table = self.read_stored_table()
+			if stored_table is None or not self.is_current(stored_table, sources):
+				self.build(stored_table, sources)
+				stored_table = self.read_stored_table()
+
+			arrays = {
+				column: np.load(f"{catalog_path}/{column}.npy", mmap_mode="r")
+				for column in list(numeric_columns) + text_columns
+			}
+			self.loaded = (stored_table, arrays)
+			self.scanned_at = now
+
+	def is_current(self, table, sources):
+		return (
+			table.index.equals(sources.index)
+			and np.array_equal(table[stat_columns].to_numpy(dtype=float), sources[stat_columns].to_numpy(dtype=float))
+		)
+
+	def read_stored_table(self):
+		try:
+			with open(f"{catalog_path}/catalog.json", "r", encoding="utf-8") as file:
+				stored = json.load(file)
+		except FileNotFoundError:
+			return None
+
+		# a catalog written with other columns is rebuilt from scratch
+		if not isinstance(stored, dict) or stored.get("columns") != list(numeric_columns) + text_columns:
+			return None
+		return pd.DataFrame(stored["datasets"]).set_index("prefix")
+
+	def build(self, stored_table, sources):
+		"""
+		Parses the datasets that are new or changed, copies the rows of the others from the stored arrays
+		"""
+		if stored_table is not None:
+			stored_arrays = {
+				column: np.load(f"{catalog_path}/{column}.npy", mmap_mode="r")
+				for column in list(numeric_columns) + text_columns
+			}
+
+		rows = list()
+		columns = {column: [] for column in list(numeric_columns) + text_columns}
+		start = 0
+		for prefix, stat in sources.iterrows():
+			unchanged = (
+				stored_table is not None
+				and prefix in stored_table.index
+				and stored_table.loc[prefix, stat_columns].tolist() == stat.tolist()
+			)
+			if unchanged:
+				stored_row = stored_table.loc[prefix]
+				specs = json_fields(stored_row)
+				arrays = {
+					column: np.asarray(stored_arrays[column][stored_row.start:stored_row.stop])
+					for column in columns
+				}
+			else:
+				specs, arrays = read_dataset(prefix)
+
+			n_rows = len(arrays["cod_ibge"])
+			years = sorted(int(year) for year in np.unique(arrays["ano"]) if year != no_year)
+			rows.append(dict(specs, prefix=prefix, **stat.to_dict(), anos=years, start=start, stop=start + n_rows))
+			for column in columns:
+				columns[column].append(arrays[column])
+			start += n_rows
+
+		os.makedirs(catalog_path, exist_ok=True)
+		for column, chunks in columns.items():
+			dtype = numeric_columns.get(column, str)
+			array = np.concatenate(chunks).astype(dtype) if chunks else np.empty(0, dtype=dtype)
+			# a temp file of its own, so processes rebuilding at once never write or rename each other's file
+			descriptor, tmp_path = tempfile.mkstemp(dir=catalog_path, prefix=f"{column}.", suffix=".tmp")
+			with os.fdopen(descriptor, "wb") as file:
+				np.save(file, array)
+			os.replace(tmp_path, f"{catalog_path}/{column}.npy")
+
+		# catalog.json is written last, an interrupted build is redone on the next refresh
+		descriptor, tmp_path = tempfile.mkstemp(dir=catalog_path, prefix="catalog.", suffix=".tmp")
+		with os.fdopen(descriptor, "w", encoding="utf-8") as file:
+			json.dump({"columns": list(columns), "datasets": rows}, file, ensure_ascii=False)
+		os.replace(tmp_path, f"{catalog_path}/catalog.json")
+
+	def get_loaded(self):
+		# (table, arrays) of one build, read it once per call that needs both
+		self.refresh()
+		return self.loaded
+
+	def get_table(self):
+		return self.get_loaded()[0]
+
+	def specs(self, prefix):
+		"""
+		The json dict of the dataset, with every field of the catalog (None for the ones its json does not have)
+		"""
+		return json_fields(self.get_table().loc[prefix])
+
+	def load(self, prefix):
+		"""
+		DataFrame with cod_ibge, uf and qnt_produzida of the dataset, and ano if it has years
+		The numeric columns are views of the memory-mapped arrays
+		"""
+		table, arrays = self.get_loaded()
+		start, stop = table.at[prefix, "start"], table.at[prefix, "stop"]
+		dataset_df = pd.DataFrame({
+			"cod_ibge": arrays["cod_ibge"][start:stop],
+			"uf": arrays["uf"][start:stop].astype(object),
+			"qnt_produzida": arrays["qnt_produzida"][start:stop],
+		})
+		if table.at[prefix, "anos"]:
+			dataset_df["ano"] = arrays["ano"][start:stop]
+		return dataset_df
+
+	def years(self, prefix):
+		# sorted list of the years of the dataset, empty when its csv has no ano column
+		return list(self.get_table().at[prefix, "anos"])
+
+	def source_stat(self, prefix):
+		# changes whenever the csv or json of prefix changes
+		return tuple(self.get_table().loc[prefix, stat_columns])
+
+
+
+dataset_catalog = DatasetCatalog()
+
+def check_catalog():
+	"""
+	Compares every dataset of the catalog with its csv and json
+	Returns a list with the differences found, an empty list means the catalog is exact
+	"""
+	errors = list()
+	for prefix in dataset_catalog.get_table().index:
+		specs, arrays = read_dataset(prefix)
+		catalog_specs = dataset_catalog.specs(prefix)
+		if set(specs) - set(catalog_specs) or {field: specs.get(field) for field in catalog_specs} != catalog_specs:
+			errors.append(f"{prefix}: json differs")
+		loaded = dataset_catalog.load(prefix)
+		if "ano" not in loaded.columns:
+			loaded["ano"] = no_year
+		for column, array in arrays.items():
+			if not np.array_equal(loaded[column].to_numpy(dtype=array.dtype), array):
+				errors.append(f"{prefix}: {column} differs")
+	return errors
+
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Builds the biomass dataset catalog from the biomass folder")
+	parser.add_argument("--check", action="store_true", help="compare the catalog with the csv and json files")
+	args = parser.parse_args()
+
+	dataset_catalog.refresh(force=True)
+	table = dataset_catalog.get_table()
+	print(f"{len(table)} datasets, {table.stop.max() if len(table) else 0} rows in {catalog_path}")
+
+	if args.check:
+		errors = check_catalog()
+		for error in errors:
+			print(error)
+		print("OK" if not errors else "FAILED")
+		if errors:
+			raise SystemExit(1)
@@ -0,0 +1,153 @@
+"""
+Background rendering of the images of a view into render_cache
+
+A job builds its own scene (the map objects on a Figure no session draws), then for every frame calls
+setup(scene, frame), which only changes what the frame needs (the year, the uf, ...), and stores the images
+of the frame in render_cache under their keys. Images already in render_cache are skipped.
+
+The jobs of every session run on render_queue, max_background_renders daemon threads shared by the whole
+process (started by the first job). A worker builds the scene of a job and renders its frames, so at most
+max_background_renders scenes are built or drawn at the same time, and it sleeps after every frame so the job
+uses at most cpu_share of a core, leaving the rest to the foreground reruns.
+A session only keeps FrameRenderer objects, which hold no thread: submitting a different job cancels the
+previous one of the same FrameRenderer, queued or running.
+"""
+import os
+import time
+import queue
+import logging
+import threading
+
+from render_cache import render_cache
+
+logger = logging.getLogger(__name__)
+
+max_background_renders = max(1, (os.cpu_count() or 1) // 2)
+
+
+class RenderQueue:
+	"""
+	Process-wide queue of jobs, run one at a time by each of its workers
+
+	All attributes:
+		self.n_workers
+		self.jobs: queue.Queue of (renderer, frames, build_scene, setup, cancel_event)
+		self.workers: list of threads, empty until the first put
+		self.lock
+	"""
+
+	def __init__(self, n_workers=max_background_renders):
+		self.n_workers = n_workers
+		self.jobs = queue.Queue()
+		self.workers = list()
+		self.lock = threading.Lock()
+
+	def put(self, job):
+		with self.lock:
+			if not self.workers:
+				for _ in range(self.n_workers):
+					worker = threading.Thread(target=self.work, daemon=True)
+					worker.start()
+					self.workers.append(worker)
+		self.jobs.put(job)
+
+	def work(self):
+		while True:
+			renderer, *job = self.jobs.get()
+			renderer.run(*job)
+
+
+
+render_queue = RenderQueue()
+
+
+class FrameRenderer:
+	"""
+	All attributes:
+		self.cpu_share
+		self.job_id
+		self.cancel_event
+		self.done
+		self.total
+		self.lock
+	"""
+
+	def __init__(self, cpu_share=0.5):
+		"""
+		cpu_share: float
+			fraction of the time the renderer may spend rendering, it sleeps the rest
+		"""
+		self.cpu_share = cpu_share
+		self.job_id = None
+		self.cancel_event = threading.Event()
+		self.done = 0
+		self.total = 0
+		self.lock = threading.Lock()
+
+	def submit(self, job_id, frames, build_scene, setup):
+		"""
+		job_id: hashable
+			a job equal to the running (or finished) one is not started again
+		frames: list of (frame, images), rendered in this order
+			images: list of (cache_key, render), render(scene) -> bytes
+		build_scene: callable
+			returns the scene, the objects every frame is rendered from
+		setup: callable
+			setup(scene, frame) sets the scene up for frame
+		"""
+		with self.lock:
+			if job_id == self.job_id:
+				return
+			self.cancel_event.set()
+
+			self.job_id = job_id
+			self.cancel_event = threading.Event()
+			self.done = 0
+			self.total = len(frames)
+			render_queue.put((self, frames, build_scene, setup, self.cancel_event))
+
+	def run(self, frames, build_scene, setup, cancel_event):
+		# on a worker of render_queue, a job cancelled while queued is dropped
+		if cancel_event.is_set():
+			return
+		try:
+			missing = list()
+			for frame, images in frames:
+				images = [(key, render) for key, render in images if not render_cache.contains(key)]
+				if images:
+					missing.append((frame, images))
+			with self.lock:
+				if not cancel_event.is_set():
+					self.done = self.total - len(missing)
+			if not missing:
+				return
+
+			scene = build_scene()
+			for frame, images in missing:
+				if cancel_event.is_set():
+					return
+				start = time.perf_counter()
+				setup(scene, frame)
+				for key, render in images:
+					render_cache.put(key, render(scene))
+				busy = time.perf_counter() - start
+
+				with self.lock:
+					if not cancel_event.is_set():
+						self.done += 1
+				# returns at once when the job is cancelled
+				cancel_event.wait(busy * (1 - self.cpu_share) / self.cpu_share)
+		except Exception:
+			logger.exception("Frame rendering failed")
+
+	def cancel(self):
+		with self.lock:
+			self.cancel_event.set()
+			self.job_id = None
+
+	def progress(self):
+		"""
+		Returns (frames rendered, frames of the job)
+		"""
+		with self.lock:
+			return self.done, self.total
@@ -0,0 +1,363 @@
+"""
+Binary geometry store
+
+map_files/geometry/{region_type}.json is column oriented json where every geometry is [[x0, x1, ...], [y0, y1, ...]].
+The build step converts it to map_files/store/{region_type}/ with one .npy file per array:
+	coords.npy     float64 (n_vertices, 2), the rings of every region one after the other
+	offsets.npy    int64 (n_regions + 1), the ring of region i is coords[offsets[i]:offsets[i+1]]
+	cod_ibge.npy   int64 (n_regions,)
+	bounds.npy     float64 (n_regions, 4), x_min, y_min, x_max, y_max of every region (they hold every level of detail)
+	nome.npy, uf.npy, macro.npy    unicode (n_regions,)
+	coords_{level}.npy, offsets_{level}.npy
+	               the same rings simplified by Douglas-Peucker with lod_tolerances[level], for level >= 1
+	meta.json      mtime and size of the json file the store was built from, and the tolerances used
+
+The arrays are loaded with mmap_mode="r", so loading a store does not parse anything.
+geometry_repository keeps one GeometryStore per region type for the whole process, every
+BiomassMap (and every Streamlit session) gets the same read-only object from load_geometry().
+
+Usage:
+	python geometry_store.py            builds the store for every json in map_files/geometry
+	python geometry_store.py --check    builds and checks it against the json files
+
+Any region type with a json file is supported, e.g. municipalities need map_files/geometry/mun.json
+in the same format as micro.json.
+"""
+import os
+import json
+import argparse
+import tempfile
+import threading
+import numpy as np
+import pandas as pd
+
+from perf import timed
+
+geometry_path = "./map_files/geometry"
+store_path = "./map_files/store"
+text_columns = ["nome", "uf", "macro"]
+
+# Douglas-Peucker tolerance (in degrees) of each level of detail, level 0 is the source geometry
+lod_tolerances = (0.0, 0.015, 0.03, 0.06)
+# Bumped whenever the files of a store change, older stores are rebuilt
+store_format = 2
+
+
+class GeometryStore:
+	"""
+	Read-only view of a built store
+
+	All attributes:
+		self.region_type
+		self.coords
+		self.offsets
+		self.cod_ibge
+		self.bounds
+		self.nome
+		self.uf
+		self.macro
+		self.level_coords: [coords of level 0, coords of level 1, ...]
+		self.level_offsets: [offsets of level 0, offsets of level 1, ...]
+	"""
+
+	def __init__(self, region_type):
+		self.region_type = region_type
+		self.frame = None
+		self.centroid_array = None
+		folder = f"{store_path}/{region_type}"
+
+		self.coords = np.load(f"{folder}/coords.npy", mmap_mode="r")
+		self.offsets = np.load(f"{folder}/offsets.npy", mmap_mode="r")
+		self.cod_ibge = np.load(f"{folder}/cod_ibge.npy", mmap_mode="r")
+		self.bounds = np.load(f"{folder}/bounds.npy", mmap_mode="r")
+		for column in text_columns:
+			setattr(self, column, np.load(f"{folder}/{column}.npy", mmap_mode="r"))
+
+		self.level_coords = [self.coords]
+		self.level_offsets = [self.offsets]
+		for level in range(1, len(lod_tolerances)):
+			self.level_coords.append(np.load(f"{folder}/coords_{level}.npy", mmap_mode="r"))
+			self.level_offsets.append(np.load(f"{folder}/offsets_{level}.npy", mmap_mode="r"))
+
+	def __len__(self):
+		return len(self.cod_ibge)
+
+	def ring(self, idx, level=0):
+		# (n, 2) view of the vertices of the region at position idx
+		offsets = self.level_offsets[level]
+		return self.level_coords[level][offsets[idx]:offsets[idx+1]]
+
+	def rings(self, idx_list=None, level=0):
+		if idx_list is None:
+			idx_list = range(len(self))
+		return [self.ring(idx, level) for idx in idx_list]
+
+	def centroids(self):
+		"""
+		(n_regions, 2) array with the area-weighted centroid (lon, lat) of every region
+		"""
+		if self.centroid_array is None:
+			centroid_array = np.empty((len(self), 2))
+			for idx, ring in enumerate(self.rings()):
+				x, y = np.asarray(ring).T
+				x_next, y_next = np.roll(x, -1), np.roll(y, -1)
+				cross = x * y_next - x_next * y
+				area = cross.sum() / 2
+				if area == 0:
+					centroid_array[idx] = x.mean(), y.mean()
+				else:
+					centroid_array[idx] = np.sum((x + x_next) * cross) / (6 * area), np.sum((y + y_next) * cross) / (6 * area)
+			centroid_array.flags.writeable = False
+			self.centroid_array = centroid_array
+		return self.centroid_array
+
+	def extent(self, idx_list=None, pad=0.0):
+		"""
+		[[x_min, y_min], [x_max, y_max]] around the regions of idx_list (every region when None),
+		widened on each side by pad times its width and height
+		"""
+		bounds = self.bounds if idx_list is None else self.bounds[np.asarray(idx_list, dtype=int)]
+		x_min, y_min = bounds[:, :2].min(axis=0)
+		x_max, y_max = bounds[:, 2:].max(axis=0)
+		x_pad, y_pad = pad * (x_max - x_min), pad * (y_max - y_min)
+		return [[float(x_min - x_pad), float(y_min - y_pad)], [float(x_max + x_pad), float(y_max + y_pad)]]
+
+	def n_vertices(self, idx_list, level=0):
+		idx_list = np.asarray(idx_list, dtype=int)
+		offsets = self.level_offsets[level]
+		return int(np.sum(offsets[idx_list + 1] - offsets[idx_list]))
+
+	def to_frame(self):
+		"""
+		DataFrame with the columns cod_ibge, nome, uf, macro and geometry_idx
+		geometry_idx is the position of the region inside the store, use it with self.ring()
+		The frame is built once, callers get a shallow copy so adding columns does not leak between them
+		"""
+		if self.frame is None:
+			df = pd.DataFrame({"cod_ibge": np.asarray(self.cod_ibge)})
+			for column in text_columns:
+				df[column] = np.asarray(getattr(self, column)).astype(object)
+			df["geometry_idx"] = np.arange(len(self))
+			self.frame = df
+		return self.frame.copy(deep=False)
+
+	def nbytes(self):
+		arrays = self.level_coords + self.level_offsets + [self.cod_ibge, self.bounds] + [getattr(self, column) for column in text_columns]
+		return sum(array.nbytes for array in arrays)
+
+
+
+class GeometryRepository:
+	"""
+	Process-wide cache of GeometryStore objects keyed by region type ("uf", "meso", "micro", "mun", ...)
+	A store is loaded once and reloaded only when the mtime or size of its json file changes
+
+	All attributes:
+		self.stores: {region_type: (source_stat, GeometryStore)}
+		self.lock
+	"""
+
+	def __init__(self):
+		self.stores = dict()
+		self.lock = threading.Lock()
+
+	@timed("GeometryRepository.get")
+	def get(self, region_type):
+		stat = source_stat(region_type)
+		cached = self.stores.get(region_type)
+		if cached is not None and cached[0] == stat:
+			return cached[1]
+
+		with self.lock:
+			# another thread may have loaded it while this one waited
+			cached = self.stores.get(region_type)
+			if cached is None or cached[0] != stat:
+				if not is_up_to_date(region_type):
+					build_store(region_type)
+				self.stores[region_type] = (stat, GeometryStore(region_type))
+			return self.stores[region_type][1]
+
+	def invalidate(self, region_type=None):
+		with self.lock:
+			if region_type is None:
+				self.stores.clear()
+			else:
+				self.stores.pop(region_type, None)
+
+	def memory_report(self):
+		"""
+		DataFrame with the size of every loaded store
+		The arrays are memory-mapped, so the bytes are shared by every session of the process
+		"""
+		report = {"region_type": [], "n_regions": [], "n_vertices": [], "bytes": []}
+		for region_type, (stat, store) in sorted(self.stores.items()):
+			report["region_type"].append(region_type)
+			report["n_regions"].append(len(store))
+			report["n_vertices"].append(len(store.coords))
+			report["bytes"].append(store.nbytes())
+		return pd.DataFrame(report)
+
+
+
+def source_stat(region_type):
+	stat = os.stat(f"{geometry_path}/{region_type}.json")
+	return {"mtime": stat.st_mtime, "size": stat.st_size}
+
+def store_meta(region_type):
+	return dict(source_stat(region_type), lod_tolerances=list(lod_tolerances), store_format=store_format)
+
+def is_up_to_date(region_type):
+	try:
+		with open(f"{store_path}/{region_type}/meta.json", "r", encoding="utf-8") as file:
+			meta = json.load(file)
+	except FileNotFoundError:
+		return False
+	return meta == store_meta(region_type)
+
+def read_source(region_type):
+	with open(f"{geometry_path}/{region_type}.json", "r", encoding="utf-8") as file:
+		json_dict = json.load(file)
+
+	# the json is column oriented: {column: {row_label: value}}
+	row_labels = list(json_dict["cod_ibge"].keys())
+	return {column: [json_dict[column][label] for label in row_labels] for column in json_dict}
+
+def douglas_peucker(ring, tolerance):
+	"""
+	ring: array of shape (n, 2)
+	Returns the vertices of ring kept by the Douglas-Peucker algorithm, the first and last ones are always kept
+	"""
+	n = len(ring)
+	if tolerance <= 0 or n <= 4:
+		return ring
+
+	keep = np.zeros(n, dtype=bool)
+	keep[0] = keep[-1] = True
+	stack = [(0, n - 1)]
+	while stack:
+		start, end = stack.pop()
+		if end - start < 2:
+			continue
+
+		segment = ring[end] - ring[start]
+		points = ring[start+1:end] - ring[start]
+		length = np.hypot(*segment)
+		if length == 0:
+			# closed ring: distance to the start point
+			dist = np.hypot(points[:, 0], points[:, 1])
+		else:
+			dist = np.abs(segment[0] * points[:, 1] - segment[1] * points[:, 0]) / length
+
+		farthest = np.argmax(dist)
+		if dist[farthest] > tolerance:
+			split = start + 1 + farthest
+			keep[split] = True
+			stack.append((start, split))
+			stack.append((split, end))
+
+	return ring[keep]
+
+def intersecting(bounds, bbox):
+	"""
+	bounds: (n, 4) array with x_min, y_min, x_max, y_max
+	bbox: [[x_min, y_min], [x_max, y_max]]
+	Returns a bool array, True for the rows of bounds that intersect bbox
+	"""
+	(x_min, y_min), (x_max, y_max) = bbox
+	return (bounds[:, 0] <= x_max) & (bounds[:, 2] >= x_min) & (bounds[:, 1] <= y_max) & (bounds[:, 3] >= y_min)
+
+def pack_rings(rings):
+	coords = np.concatenate(rings) if rings else np.empty((0, 2))
+	offsets = np.concatenate([[0], np.cumsum([len(ring) for ring in rings])]).astype(np.int64)
+	return coords, offsets
+
+@timed("geometry_store.build_store")
+def build_store(region_type):
+	source = read_source(region_type)
+	rings = [np.column_stack(geometry).astype(np.float64) for geometry in source["geometry"]]
+
+	arrays = dict()
+	arrays["coords"], arrays["offsets"] = pack_rings(rings)
+	for level in range(1, len(lod_tolerances)):
+		simplified = [douglas_peucker(ring, lod_tolerances[level]) for ring in rings]
+		arrays[f"coords_{level}"], arrays[f"offsets_{level}"] = pack_rings(simplified)
+	arrays["cod_ibge"] = np.array(source["cod_ibge"], dtype=np.int64)
+	arrays["bounds"] = np.array([[*ring.min(axis=0), *ring.max(axis=0)] for ring in rings]).reshape(-1, 4)
+	for column in text_columns:
+		arrays[column] = np.array(source[column], dtype=str)
+
+	folder = f"{store_path}/{region_type}"
+	os.makedirs(folder, exist_ok=True)
+	for name, array in arrays.items():
+		# a temp file of its own, so processes building the same store never write or rename each other's file
+		descriptor, tmp_path = tempfile.mkstemp(dir=folder, prefix=f"{name}.", suffix=".tmp")
+		with os.fdopen(descriptor, "wb") as file:
+			np.save(file, array)
+		os.replace(tmp_path, f"{folder}/{name}.npy")
+
+	# meta.json is written last, an interrupted build is rebuilt on the next load
+	descriptor, tmp_path = tempfile.mkstemp(dir=folder, prefix="meta.", suffix=".tmp")
+	with os.fdopen(descriptor, "w", encoding="utf-8") as file:
+		json.dump(store_meta(region_type), file)
+	os.replace(tmp_path, f"{folder}/meta.json")
+
+geometry_repository = GeometryRepository()
+
+def load_geometry(region_type):
+	"""
+	Returns the shared GeometryStore of region_type
+	The store is built if it is missing or older than the json file
+	"""
+	return geometry_repository.get(region_type)
+
+def check_store(region_type):
+	"""
+	Compares the store with what pd.read_json reads from the json file
+	precise_float=True is needed, the default float parser of pandas is off by up to 1e-14
+	Returns a list with the differences found, an empty list means the store is exact
+	"""
+	store = GeometryStore(region_type)
+	json_df = pd.read_json(f"{geometry_path}/{region_type}.json", precise_float=True)
+	errors = list()
+
+	if len(json_df) != len(store):
+		return [f"{region_type}: {len(json_df)} rows in the json, {len(store)} in the store"]
+
+	if not np.array_equal(json_df.cod_ibge.to_numpy(), store.cod_ibge):
+		errors.append(f"{region_type}: cod_ibge differs")
+
+	for column in text_columns:
+		if not np.array_equal(json_df[column].to_numpy(dtype=str), getattr(store, column)):
+			errors.append(f"{region_type}: {column} differs")
+
+	for idx, geometry in enumerate(json_df.geometry):
+		ring = np.column_stack(geometry).astype(np.float64)
+		if not np.array_equal(ring, store.ring(idx)):
+			errors.append(f"{region_type}: geometry of cod_ibge {json_df.cod_ibge[idx]} differs")
+		if not np.array_equal([*ring.min(axis=0), *ring.max(axis=0)], store.bounds[idx]):
+			errors.append(f"{region_type}: bounds of cod_ibge {json_df.cod_ibge[idx]} differ")
+
+	return errors
+
+def available_region_types():
+	return sorted(f.split(".")[0] for f in os.listdir(geometry_path) if f.endswith(".json"))
+
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Builds the binary geometry store from map_files/geometry")
+	parser.add_argument("region_types", nargs="*", help="uf, meso, micro, ... (default: every json file)")
+	parser.add_argument("--check", action="store_true", help="compare the store with the json files")
+	args = parser.parse_args()
+
+	for region_type in args.region_types or available_region_types():
+		build_store(region_type)
+		print(f"{region_type}: built {store_path}/{region_type}")
+
+		if args.check:
+			errors = check_store(region_type)
+			for error in errors:
+				print(error)
+			print(f"{region_type}: {'OK' if not errors else 'FAILED'}")
+			if errors:
+				raise SystemExit(1)
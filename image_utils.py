@@ -0,0 +1,41 @@
+import io
+import numpy as np
+
+
+def fig_to_array(fig):
+	"""
+	Renders fig and returns its RGBA pixels as an array of shape (height, width, 4)
+	"""
+	io_buf = io.BytesIO()
+	fig.savefig(io_buf, format='raw')
+	io_buf.seek(0)
+	img_arr = np.reshape(np.frombuffer(io_buf.getvalue(), dtype=np.uint8),
+                     newshape=(int(fig.bbox.bounds[3]), int(fig.bbox.bounds[2]), -1))
+	io_buf.close()
+	return np.array(img_arr)
+
+def content_bbox(img_arr):
+	"""
+	Returns (top, bottom, left, right) of the smallest box holding every pixel that is not
+	white or fully transparent, or None if the whole image is blank
+	"""
+	blank = np.all(img_arr == 255, axis=2)
+	if img_arr.shape[2] == 4:
+		blank |= img_arr[:, :, 3] == 0
+
+	rows = np.flatnonzero(~blank.all(axis=1))
+	if len(rows) == 0:
+		return None
+	cols = np.flatnonzero(~blank.all(axis=0))
+	return rows[0], rows[-1] + 1, cols[0], cols[-1] + 1
+
+def remove_white_spaces(img_arr):
+	"""
+	Crops the white (or fully transparent) border of an RGB or RGBA image
+	Returns a view of img_arr, a blank image is returned unchanged
+	"""
+	bbox = content_bbox(img_arr)
+	if bbox is None:
+		return img_arr
+	top, bottom, left, right = bbox
+	return img_arr[top:bottom, left:right]
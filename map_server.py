@@ -0,0 +1,195 @@
+"""
+Small local HTTP endpoint with the TopoJSON payloads of topojson_export, for maps drawn by the browser
+
+	GET /topology/{region_type}/{level}.json    the gzipped TopoJSON (Content-Encoding: gzip)
+	GET /js/{name}                              the vendored copy of a script of client_scripts, when there is one
+	GET /health                                 "ok"
+
+The payloads are built once per (region type, level) and sent as they are, the server never compresses.
+start_map_server() runs the server in a daemon thread, once per process (every Streamlit session shares it).
+client_map_html() is the page given to st.iframe: it fetches the topologies and colors
+the regions with the values of topojson_export.values_payload, with d3 and topojson-client.
+
+The server listens on 127.0.0.1 only. Another interface (a container, another machine of the network) must be
+asked for: --host on the command line, MAP_SERVER_HOST for the server the app starts.
+Only the origins of allowed_origins may read the payloads from a page (CORS): the app adds its own origin
+(allow_origin), others come from MAP_SERVER_ORIGINS (comma separated).
+
+The page needs d3 and topojson-client (client_scripts). Without network access to cdn.jsdelivr.net, download the
+two files of client_scripts into map_files/js/ (same names), the server then sends those and the page asks it for them.
+
+Usage:
+	python map_server.py [--port 8765] [--host 127.0.0.1]
+"""
+import os
+import re
+import json
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from topojson_export import topology_payload
+from geometry_store import available_region_types, lod_tolerances
+
+default_port = int(os.environ.get("MAP_SERVER_PORT", 8765))
+default_host = os.environ.get("MAP_SERVER_HOST", "127.0.0.1")
+topology_route = re.compile(r"^/topology/(\w+)/(\d+)\.json$")
+
+# origins a page may fetch the payloads from, see allow_origin
+allowed_origins = {origin.strip() for origin in os.environ.get("MAP_SERVER_ORIGINS", "").split(",") if origin.strip()}
+
+# {file name: pinned CDN address} of the scripts of client_map_html, vendored copies go in vendor_folder
+client_scripts = {
+	"d3.min.js": "https://cdn.jsdelivr.net/npm/d3@7.9.0/dist/d3.min.js",
+	"topojson-client.min.js": "https://cdn.jsdelivr.net/npm/topojson-client@3.1.0/dist/topojson-client.min.js",
+}
+vendor_folder = "map_files/js"
+
+# (server, thread) of the process, see start_map_server
+running_server = dict()
+server_lock = threading.Lock()
+
+
+class TopologyHandler(BaseHTTPRequestHandler):
+
+	def do_GET(self):
+		if self.path == "/health":
+			self.send_payload(b"ok", "text/plain")
+			return
+
+		if self.path.startswith("/js/"):
+			name = self.path[len("/js/"):]
+			if name not in client_scripts or not os.path.isfile(f"{vendor_folder}/{name}"):
+				self.send_error(404)
+				return
+			with open(f"{vendor_folder}/{name}", "rb") as file:
+				self.send_payload(file.read(), "text/javascript")
+			return
+
+		match = topology_route.match(self.path.split("?")[0])
+		if match is None:
+			self.send_error(404)
+			return
+		region_type, level = match.group(1), int(match.group(2))
+		if region_type not in available_region_types() or level >= len(lod_tolerances):
+			self.send_error(404)
+			return
+		self.send_payload(topology_payload(region_type, level), "application/json", encoding="gzip")
+
+	def send_payload(self, payload, content_type, encoding=None):
+		self.send_response(200)
+		self.send_header("Content-Type", content_type)
+		if encoding is not None:
+			self.send_header("Content-Encoding", encoding)
+		self.send_header("Content-Length", str(len(payload)))
+		self.send_header("Cache-Control", "public, max-age=86400")
+		origin = self.headers.get("Origin")
+		if origin in allowed_origins:
+			self.send_header("Access-Control-Allow-Origin", origin)
+		self.send_header("Vary", "Origin")
+		self.end_headers()
+		self.wfile.write(payload)
+
+	def log_message(self, format, *args):
+		# one line per request would flood the Streamlit log
+		pass
+
+
+def allow_origin(origin):
+	# lets the pages of origin ("http://localhost:8501") read the payloads
+	if origin:
+		allowed_origins.add(origin)
+
+def start_map_server(port=default_port, host=default_host):
+	"""
+	Starts the server in a daemon thread if this process has none yet
+	Returns the port it listens on, None if it could not start (the port is taken by another process)
+	"""
+	with server_lock:
+		if "server" not in running_server:
+			try:
+				server = ThreadingHTTPServer((host, port), TopologyHandler)
+			except OSError:
+				return None
+			thread = threading.Thread(target=server.serve_forever, daemon=True)
+			thread.start()
+			running_server["server"] = server
+			running_server["thread"] = thread
+		return running_server["server"].server_address[1]
+
+def map_server_url(port):
+	# MAP_SERVER_URL when the browser reaches the server through another address (proxy, container)
+	return os.environ.get("MAP_SERVER_URL", f"http://localhost:{port}")
+
+def script_url(name, server_url):
+	# the vendored copy when there is one, the CDN otherwise
+	if os.path.isfile(f"{vendor_folder}/{name}"):
+		return f"{server_url}/js/{name}"
+	return client_scripts[name]
+
+
+def client_map_html(values, server_url, height=600):
+	"""
+	values: dict
+		topojson_export.values_payload of the map
+	server_url: str
+		address of the map server as seen by the browser
+	"""
+	return f"""
+<div id="map" style="width:100%;height:{height}px;font-family:sans-serif"></div>
+<script src="{script_url("d3.min.js", server_url)}"></script>
+<script src="{script_url("topojson-client.min.js", server_url)}"></script>
+<script>
+const values = {json.dumps(values, ensure_ascii=False)};
+const server = {json.dumps(server_url)};
+
+Promise.all([
+	d3.json(`${{server}}/topology/${{values.region_type}}/${{values.level}}.json`),
+	d3.json(`${{server}}/topology/uf/${{values.level}}.json`),
+]).then(([regions, ufs]) => {{
+	const visible = new Set(values.visible_ufs);
+	const value_of = new Map(values.cod_ibge.map((cod, idx) => [cod, values.values[idx]]));
+	const uf_features = topojson.feature(ufs, ufs.objects.uf).features.filter(f => visible.has(f.properties.uf));
+	const region_features = topojson.feature(regions, regions.objects[values.region_type]).features
+		.filter(f => visible.has(f.properties.uf) && value_of.has(f.id));
+
+	const norm = values.norm === "log"
+		? d3.scaleLog().domain([values.vmin, values.vmax]).clamp(true)
+		: d3.scaleLinear().domain([values.vmin, values.vmax]).clamp(true);
+	const color = value => values.colors[Math.round(norm(value) * (values.colors.length - 1))];
+
+	const container = document.getElementById("map");
+	const width = container.clientWidth;
+	const [x_min, y_min, x_max, y_max] = values.bbox;
+	const projection = d3.geoIdentity().reflectY(true).fitSize([width, {height}], {{
+		type: "Feature", geometry: {{type: "Polygon", coordinates: [[[x_min, y_min], [x_max, y_min], [x_max, y_max], [x_min, y_max], [x_min, y_min]]]}}
+	}});
+	const path = d3.geoPath(projection);
+
+	const svg = d3.select(container).append("svg").attr("width", width).attr("height", {height});
+	svg.append("text").attr("x", width / 2).attr("y", 16).attr("text-anchor", "middle").text(values.title);
+	svg.append("g").selectAll("path").data(uf_features).join("path")
+		.attr("d", path).attr("fill", values.base_color).attr("stroke", "black").attr("stroke-width", 0.5);
+	svg.append("g").selectAll("path").data(region_features).join("path")
+		.attr("d", path).attr("fill", f => color(value_of.get(f.id))).attr("stroke", "grey").attr("stroke-width", 0.2)
+		.append("title").text(f => `${{f.properties.nome}} (${{f.properties.uf}}): ${{value_of.get(f.id).toLocaleString("pt-BR")}}`);
+}}).catch(error => {{
+	document.getElementById("map").textContent = `Não foi possível carregar o mapa de ${{server}}: ${{error}}`;
+}});
+</script>
+"""
+
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Serves the TopoJSON payloads of the geometry stores")
+	parser.add_argument("--port", type=int, default=default_port)
+	parser.add_argument("--host", default=default_host, help="interface to listen on, 0.0.0.0 for all of them")
+	parser.add_argument("--origin", action="append", default=[], help="origin allowed to read the payloads, repeatable")
+	args = parser.parse_args()
+
+	for origin in args.origin:
+		allow_origin(origin)
+	server = ThreadingHTTPServer((args.host, args.port), TopologyHandler)
+	print(f"Serving on {map_server_url(args.port)}/topology/{{region_type}}/{{level}}.json")
+	server.serve_forever()
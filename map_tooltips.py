@@ -0,0 +1,247 @@
+"""
+Hover and click information of the map image
+
+TooltipTable holds what a tooltip shows as one array per column (region name, uf, layer, value, unit and
+share of the uf total), one row per region of the choropleth followed by one row per unit drawn, in the
+order of their collections. It is built once per view with NumPy operations, never scanned per event.
+
+The lookup from a pixel of the map to a row is a picking image: the same figure rendered again with every
+region and unit filled with its row number as an RGB color (no antialiasing, everything else transparent),
+so the browser finds the row under the mouse by reading one pixel. tooltip_map_html() is the page with
+both images and the table (as json) that st.iframe shows.
+TooltipTable.region_rows() answers the same question from (lon, lat) with spatial_index, on the server.
+"""
+import json
+import base64
+import numpy as np
+import pandas as pd
+import matplotlib
+
+from spatial_index import get_spatial_index
+
+# RGB of the background of the picking image, no row has it
+no_row = 0xFFFFFF
+
+
+def row_colors(first_row, n_rows):
+	"""
+	RGBA array encoding the row numbers first_row, ..., first_row + n_rows - 1 in the RGB channels
+	"""
+	rows = np.arange(first_row, first_row + n_rows)
+	rgb = np.column_stack([(rows >> 16) & 255, (rows >> 8) & 255, rows & 255]) / 255
+	return np.column_stack([rgb, np.ones(n_rows)])
+
+def uf_share(values, ufs):
+	# value / total of its uf, NaN where the uf total is 0
+	codes, uniques = pd.factorize(ufs)
+	totals = np.bincount(codes, weights=values, minlength=len(uniques))
+	with np.errstate(divide="ignore", invalid="ignore"):
+		return values / totals[codes]
+
+
+class TooltipTable:
+	"""
+	All attributes:
+		self.nome
+		self.uf
+		self.camada
+		self.valor
+		self.unidade
+		self.participacao: share of the uf total of the layer, NaN when it does not apply
+		self.n_regions: the first n_regions rows are the regions of the choropleth, in biomass_df order
+		self.region_row: {position in the GeometryStore: row}, -1 for regions not on the map
+		self.unit_collections: list of (scatter collection, first row) of the units drawn
+		self.region_type
+	"""
+
+	def __init__(self, biomass_obj, unit_objs, uf="Brasil"):
+		"""
+		biomass_obj: biomass.BiomassMap
+		unit_objs: list of StaticUnits and DynamicUnits, the hidden ones are left out
+		uf: str
+			uf shown, the units of the other ufs are not drawn
+		"""
+		biomass_df = biomass_obj.biomass_df
+		self.region_type = biomass_obj.region_type
+		self.n_regions = len(biomass_df)
+		self.region_row = np.full(len(biomass_obj.geometry), -1)
+		self.region_row[biomass_df.geometry_idx.to_numpy()] = np.arange(self.n_regions)
+
+		values = biomass_obj.region_values
+		columns = {
+			"nome": [biomass_df.nome.to_numpy(dtype=object)],
+			"uf": [biomass_obj.region_uf.astype(object)],
+			"camada": [np.full(self.n_regions, biomass_obj.biomass_name, dtype=object)],
+			"valor": [values],
+			"unidade": [np.full(self.n_regions, biomass_obj.unit, dtype=object)],
+			"participacao": [uf_share(values, biomass_obj.region_uf)],
+		}
+
+		self.unit_collections = list()
+		first_row = self.n_regions
+		for unit_obj in unit_objs:
+			collection, unit_df = self.drawn_units(unit_obj, uf)
+			if not collection.get_visible():
+				continue
+			n_units = len(unit_df)
+			unit_ufs = unit_df.uf.to_numpy(dtype=object)
+			if "coef" in unit_df.columns:
+				unit_values = unit_df.coef.to_numpy(dtype=float)
+				unit_unit = unit_obj.specs_dict.get("unidade", "")
+				share = uf_share(unit_values, unit_ufs)
+			else:
+				unit_values = np.full(n_units, np.nan)
+				unit_unit = ""
+				share = np.full(n_units, np.nan)
+
+			columns["nome"].append(unit_df.nome.to_numpy(dtype=object))
+			columns["uf"].append(unit_ufs)
+			columns["camada"].append(np.full(n_units, unit_obj.unit_type, dtype=object))
+			columns["valor"].append(unit_values)
+			columns["unidade"].append(np.full(n_units, unit_unit, dtype=object))
+			columns["participacao"].append(share)
+			self.unit_collections.append((collection, first_row))
+			first_row += n_units
+
+		for column, arrays in columns.items():
+			setattr(self, column, np.concatenate(arrays))
+
+	def drawn_units(self, unit_obj, uf):
+		"""
+		Returns (scatter collection, DataFrame of the units it draws, in the order of its offsets)
+		"""
+		collection = unit_obj.units if hasattr(unit_obj, "units") else unit_obj.points
+		unit_ufs = unit_obj.unit_uf if hasattr(unit_obj, "unit_uf") else unit_obj.point_uf
+		if uf == "Brasil":
+			return collection, unit_obj.df
+		return collection, unit_obj.df.loc[unit_ufs == uf]
+
+	def __len__(self):
+		return len(self.nome)
+
+	def to_columns(self):
+		# JSON-ready dict of lists, NaN as None
+		return {
+			column: [None if isinstance(item, float) and np.isnan(item) else item for item in getattr(self, column).tolist()]
+			for column in ["nome", "uf", "camada", "valor", "unidade", "participacao"]
+		}
+
+	def to_json(self):
+		# UTF-8 bytes, what tooltip_map_html embeds (render_cache keeps it next to the images of the view)
+		# "</" is escaped so no name can close the <script> it goes into
+		return json.dumps(self.to_columns(), ensure_ascii=False).replace("</", "<\\/").encode("utf-8")
+
+	def region_rows(self, lon, lat):
+		"""
+		lon, lat: float or array
+		Returns the row of the region under each point, -1 where there is none on the map
+		"""
+		positions = get_spatial_index(self.region_type).query(lon, lat)
+		return np.where(positions >= 0, self.region_row[positions], -1)
+
+	def row_dict(self, row):
+		return {column: getattr(self, column)[row] for column in ["nome", "uf", "camada", "valor", "unidade", "participacao"]}
+
+	def render_picking(self, biomass_obj, render):
+		"""
+		render: callable
+			fig -> PNG bytes, the same one used for the map so both images have the same size
+		Returns the PNG of the picking image, the colors of biomass_obj.fig are restored afterwards
+		"""
+		transparent = (1, 1, 1, 0)
+		# the regionmap only holds the regions on screen (BiomassMap.drawn_regions)
+		region_colors = row_colors(0, self.n_regions)[biomass_obj.drawn_regions]
+
+		saved_units = [
+			(collection, collection.get_facecolors().copy(), collection.get_edgecolors().copy())
+			for collection, first_row in self.unit_collections
+		]
+		title_color = biomass_obj.ax.title.get_color()
+		collections = [biomass_obj.basemap, biomass_obj.baseoutline, biomass_obj.regionmap] + [c for c, _ in self.unit_collections]
+		try:
+			# the artists stay visible (transparent), so the tight bbox of the image does not change
+			biomass_obj.basemap.set_facecolor(transparent)
+			biomass_obj.baseoutline.set_color(transparent)
+			biomass_obj.regionmap.set_facecolor(region_colors)
+			biomass_obj.regionmap.set_edgecolor(region_colors)
+			for collection, first_row in self.unit_collections:
+				colors = row_colors(first_row, len(collection.get_offsets()))
+				collection.set_facecolor(colors)
+				collection.set_edgecolor(colors)
+			biomass_obj.ax.title.set_color(transparent)
+			for collection in collections:
+				collection.set_antialiased(False)
+			return render(biomass_obj.fig)
+		finally:
+			for collection in collections:
+				collection.set_antialiased(True)
+			biomass_obj.ax.title.set_color(title_color)
+			for collection, facecolors, edgecolors in saved_units:
+				collection.set_facecolor(facecolors)
+				collection.set_edgecolor(edgecolors)
+			biomass_obj.update_collections()
+
+
+
+def tooltip_map_html(map_png, picking_png, table_json):
+	"""
+	Page with the map image, the tooltip follows the mouse and a click pins it
+	table_json: bytes from TooltipTable.to_json()
+	"""
+	map_src = "data:image/png;base64," + base64.b64encode(map_png).decode("ascii")
+	picking_src = "data:image/png;base64," + base64.b64encode(picking_png).decode("ascii")
+	return f"""
+<div id="box" style="position:relative;font-family:sans-serif;font-size:13px">
+	<img id="map" src="{map_src}" style="width:100%;display:block">
+	<div id="tip" style="position:absolute;display:none;pointer-events:none;background:rgba(255,255,255,0.95);
+		border:1px solid #999;border-radius:4px;padding:4px 8px;white-space:nowrap"></div>
+</div>
+<script>
+const table = {table_json.decode("utf-8")};
+const no_row = {no_row};
+const image = document.getElementById("map");
+const tip = document.getElementById("tip");
+const picking = new Image();
+let pixels = null, pinned = false;
+
+picking.onload = () => {{
+	const canvas = document.createElement("canvas");
+	canvas.width = picking.naturalWidth;
+	canvas.height = picking.naturalHeight;
+	const context = canvas.getContext("2d", {{willReadFrequently: true}});
+	context.drawImage(picking, 0, 0);
+	pixels = context.getImageData(0, 0, canvas.width, canvas.height).data;
+}};
+picking.src = "{picking_src}";
+
+function row_at(event) {{
+	if (pixels === null) return -1;
+	const x = Math.floor(event.offsetX * picking.naturalWidth / image.clientWidth);
+	const y = Math.floor(event.offsetY * picking.naturalHeight / image.clientHeight);
+	const idx = 4 * (y * picking.naturalWidth + x);
+	if (pixels[idx + 3] < 255) return -1;
+	const row = (pixels[idx] << 16) | (pixels[idx + 1] << 8) | pixels[idx + 2];
+	return row === no_row || row >= table.nome.length ? -1 : row;
+}}
+
+function show(event, row) {{
+	if (row < 0) {{ tip.style.display = "none"; return; }}
+	const number = value => value.toLocaleString("pt-BR", {{maximumFractionDigits: 2}});
+	let html = `<b>${{table.nome[row]}}</b> (${{table.uf[row]}})<br>${{table.camada[row]}}`;
+	if (table.valor[row] !== null) html += `<br>${{number(table.valor[row])}} ${{table.unidade[row]}}`;
+	if (table.participacao[row] !== null) html += `<br>${{number(100 * table.participacao[row])}}% do total da UF`;
+	tip.innerHTML = html;
+	tip.style.left = `${{event.offsetX + 12}}px`;
+	tip.style.top = `${{event.offsetY + 12}}px`;
+	tip.style.display = "block";
+}}
+
+image.addEventListener("mousemove", event => {{ if (!pinned) show(event, row_at(event)); }});
+image.addEventListener("mouseleave", () => {{ if (!pinned) tip.style.display = "none"; }});
+image.addEventListener("click", event => {{
+	const row = row_at(event);
+	pinned = row >= 0 && !pinned;
+	show(event, row);
+}});
+</script>
+"""
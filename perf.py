@@ -0,0 +1,179 @@
+"""
+Timers and counters of the hot paths
+
+Functions decorated with @timed(name) add their time to the record of the calling thread, when it has one.
+streamlit_app opens a record for each rerun (record_rerun()), so a record holds the time of every instrumented
+function the rerun called: loading the csv files, the geometry, building the artists, the colorbars, the PNGs.
+The times of nested functions overlap (BiomassMap.__init__ includes BiomassMap.create_map).
+count(name) adds to a counter of the record in the same way.
+
+Without a record (instrumentation off, or a FrameRenderer thread) the wrapper only reads a thread-local
+attribute before calling the function.
+
+The instrumentation is on for every rerun when the PERF_LOG environment variable is set, each rerun is then
+logged as one json line on the "perf" logger, and for the sessions that open the app with ?perf=1, which shows
+the performance panel in the sidebar.
+"""
+import os
+import gc
+import sys
+import json
+import time
+import logging
+import functools
+import threading
+import types
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger("perf")
+log_enabled = os.environ.get("PERF_LOG", "") not in ("", "0")
+local = threading.local()
+
+
+class PerfRecord:
+	"""
+	All attributes:
+		self.label
+		self.started: time.time() of the start
+		self.start: time.perf_counter() of the start
+		self.total: seconds, None while the record is open
+		self.timers: {name: seconds}
+		self.calls: {name: number of calls}
+		self.counters: {name: int}
+	"""
+
+	def __init__(self, label=""):
+		self.label = label
+		self.started = time.time()
+		self.start = time.perf_counter()
+		self.total = None
+		self.timers = dict()
+		self.calls = dict()
+		self.counters = dict()
+
+	def add_time(self, name, seconds):
+		self.timers[name] = self.timers.get(name, 0.0) + seconds
+		self.calls[name] = self.calls.get(name, 0) + 1
+
+	def close(self):
+		self.total = time.perf_counter() - self.start
+
+	def timers_df(self):
+		# one row per timer, the slowest first
+		timers_df = pd.DataFrame({
+			"nome": list(self.timers.keys()),
+			"chamadas": list(self.calls.values()),
+			"tempo (s)": list(self.timers.values()),
+		})
+		return timers_df.sort_values("tempo (s)", ascending=False, ignore_index=True)
+
+	def to_dict(self):
+		return {
+			"label": self.label,
+			"started": self.started,
+			"total": self.total,
+			"timers": self.timers,
+			"calls": self.calls,
+			"counters": self.counters,
+		}
+
+
+def current_record():
+	return getattr(local, "record", None)
+
+def timed(name):
+	"""
+	Decorator, adds the time of every call to current_record().timers[name]
+	"""
+	def decorator(func):
+		@functools.wraps(func)
+		def wrapper(*args, **kwargs):
+			record = getattr(local, "record", None)
+			if record is None:
+				return func(*args, **kwargs)
+			start = time.perf_counter()
+			try:
+				return func(*args, **kwargs)
+			finally:
+				record.add_time(name, time.perf_counter() - start)
+		return wrapper
+	return decorator
+
+def count(name, n=1):
+	record = getattr(local, "record", None)
+	if record is not None:
+		record.counters[name] = record.counters.get(name, 0) + n
+
+@contextmanager
+def record_rerun(label="", enabled=False):
+	"""
+	Opens a record in the calling thread, yields it (None when neither enabled nor PERF_LOG)
+	The record is closed and logged when the block ends, even on an exception (st.rerun() and st.stop() raise)
+	"""
+	if not (enabled or log_enabled):
+		yield None
+		return
+
+	record = PerfRecord(label)
+	local.record = record
+	try:
+		yield record
+	finally:
+		local.record = None
+		record.close()
+		if log_enabled:
+			logger.info(json.dumps(record.to_dict()))
+
+
+not_followed = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType, types.MethodType, threading.Thread)
+
+def deep_size(obj, seen=None, max_objects=200000):
+	"""
+	Approximate bytes held by obj and everything it references, each object counted once
+	seen: set of ids or None
+		objects already counted, shared by the calls that measure parts of the same whole
+	Arrays and DataFrames count their buffers (memory-mapped arrays count nothing, the pages belong to the
+	files), modules, classes, functions and threads are not followed
+	"""
+	if seen is None:
+		seen = set()
+	stack = [obj]
+	n_bytes = 0
+	n_objects = 0
+	while stack and n_objects < max_objects:
+		item = stack.pop()
+		if id(item) in seen:
+			continue
+		seen.add(id(item))
+		n_objects += 1
+
+		if isinstance(item, not_followed):
+			continue
+		if isinstance(item, np.ndarray):
+			root = item
+			while isinstance(root.base, np.ndarray):
+				root = root.base
+			if root.base is None:
+				n_bytes += item.nbytes
+			continue
+		if isinstance(item, (pd.DataFrame, pd.Series, pd.Index)):
+			n_bytes += int(np.sum(item.memory_usage(deep=True)))
+			continue
+
+		n_bytes += sys.getsizeof(item, 0)
+		if isinstance(item, dict):
+			stack.extend(item.keys())
+			stack.extend(item.values())
+		elif isinstance(item, (list, tuple, set, frozenset)):
+			stack.extend(item)
+		elif isinstance(getattr(item, "__dict__", None), dict):
+			stack.append(item.__dict__)
+	return n_bytes
+
+def live_figures():
+	# matplotlib figures alive in the process, pyplot managed or not
+	from matplotlib.figure import Figure
+	return sum(1 for obj in gc.get_objects() if isinstance(obj, Figure))
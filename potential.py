@@ -0,0 +1,201 @@
+"""
+Aggregated layers: several biomass datasets of the same region type combined into one value per region
+
+ValueMatrix keeps, per region type, the qnt_produzida of every dataset loaded so far as one column of a
+matrix aligned with the regions of the GeometryStore (rows in store order, 0 where a dataset has no row).
+A dataset with years joins the values of its last year, the year a BiomassMap of it opens on.
+Adding a dataset only loads its arrays from dataset_catalog and joins its column, removing one just
+leaves the column out of the product, so any combination is a single matrix @ coefficients.
+
+The coefficients come from the json of each dataset:
+	"bruto": 1, the datasets must share the same unit
+	"gas": conversao_gas, m³ of biogas per unit of biomass
+	"derivado": conversao_derivado, derived product per unit of biomass
+"""
+import threading
+import numpy as np
+import pandas as pd
+
+from biomass import BiomassMap
+from geometry_store import load_geometry
+from uf_stats import create_uf_stats
+from perf import timed
+from dataset_catalog import dataset_catalog
+
+gas_unit = "m³/ano"
+
+# {potential: (json field with the coefficient, None for 1)}
+potential_fields = {
+	"bruto": None,
+	"gas": "conversao_gas",
+	"derivado": "conversao_derivado",
+}
+
+
+def read_specs(prefix):
+	return dataset_catalog.specs(prefix)
+
+def conversion_coef(specs, potential):
+	"""
+	Returns the coefficient of potential for the dataset described by specs, NaN when the json does not have one
+	"""
+	field = potential_fields[potential]
+	if field is None:
+		return 1.0
+	try:
+		return float(str(specs[field]).replace(",", "."))
+	except (KeyError, ValueError):
+		return float("nan")
+
+def usable_prefixes(prefixes, potential):
+	# The prefixes whose json has the coefficient of potential
+	return [prefix for prefix in prefixes if not np.isnan(conversion_coef(read_specs(prefix), potential))]
+
+
+class ValueMatrix:
+	"""
+	All attributes:
+		self.region_type
+		self.store
+		self.matrix: DataFrame indexed by the cod_ibge of self.store (in store order), one column per loaded prefix
+		self.sources: {prefix: dataset_catalog.source_stat(prefix) when it was loaded}
+		self.lock
+	"""
+
+	def __init__(self, store):
+		"""
+		store: geometry_store.GeometryStore
+		"""
+		self.region_type = store.region_type
+		self.store = store
+		self.matrix = pd.DataFrame(index=pd.Index(np.asarray(store.cod_ibge), name="cod_ibge"))
+		self.sources = dict()
+		self.lock = threading.Lock()
+
+	@timed("ValueMatrix.load")
+	def load(self, prefixes):
+		"""
+		Reads the datasets of prefixes that are not in the matrix yet (or whose csv changed) and joins them at once
+		Only the last year of a dataset with years is kept
+		"""
+		with self.lock:
+			missing = [prefix for prefix in prefixes if self.sources.get(prefix) != dataset_catalog.source_stat(prefix)]
+			if not missing:
+				return
+
+			columns = list()
+			for prefix in missing:
+				biomass_df = dataset_catalog.load(prefix)
+				years = dataset_catalog.years(prefix)
+				if years:
+					biomass_df = biomass_df.loc[biomass_df.ano == years[-1]]
+				columns.append(biomass_df.groupby("cod_ibge")["qnt_produzida"].sum())
+
+			new_columns = pd.concat(columns, axis=1, keys=missing).reindex(self.matrix.index).fillna(0)
+			self.matrix = pd.concat([self.matrix.drop(columns=missing, errors="ignore"), new_columns], axis=1)
+			for prefix in missing:
+				self.sources[prefix] = dataset_catalog.source_stat(prefix)
+
+	def values(self, prefixes, coefs):
+		"""
+		Returns an array (store order) with sum(coef * qnt_produzida) over the datasets of prefixes
+		"""
+		self.load(prefixes)
+		with self.lock:
+			matrix = self.matrix[list(prefixes)].to_numpy(dtype=float)
+		return matrix @ np.asarray(coefs, dtype=float)
+
+
+
+# {region_type: ValueMatrix}, rebuilt when the repository hands out a new store
+value_matrices = dict()
+
+def get_value_matrix(region_type):
+	store = load_geometry(region_type)
+	value_matrix = value_matrices.get(region_type)
+	if value_matrix is None or value_matrix.store is not store:
+		value_matrix = ValueMatrix(store)
+		value_matrices[region_type] = value_matrix
+	return value_matrix
+
+
+class PotentialMap(BiomassMap):
+	"""
+	BiomassMap of the combined potential of several datasets, qnt_produzida holds the potential of each region
+
+	All attributes (besides the BiomassMap ones):
+		self.prefixes
+		self.potential
+		self.coefs
+	"""
+
+	def __init__(self, fig, prefixes, potential="gas"):
+		"""
+		prefixes: list of str
+			datasets of the same region type, every one with the coefficient of potential
+		potential: str
+			"bruto", "gas" or "derivado"
+		"""
+		self.prefixes = list(prefixes)
+		self.potential = potential
+		super().__init__(fig, tuple(self.prefixes))
+
+	@timed("PotentialMap.read_json_file")
+	def read_json_file(self, file_prefix):
+		specs_list = [read_specs(prefix) for prefix in self.prefixes]
+		if not specs_list:
+			raise ValueError("PotentialMap needs at least one dataset")
+
+		region_types = {specs["tipo_regiao"] for specs in specs_list}
+		if len(region_types) > 1:
+			raise ValueError(f"Datasets of different region types can not be combined: {sorted(region_types)}")
+
+		self.coefs = np.array([conversion_coef(specs, self.potential) for specs in specs_list])
+		if np.isnan(self.coefs).any():
+			missing = [prefix for prefix, coef in zip(self.prefixes, self.coefs) if np.isnan(coef)]
+			raise ValueError(f"No {potential_fields[self.potential]} for {missing}")
+
+		units = {specs["unidade"] for specs in specs_list}
+		biomass_types = {specs["tipo_biomassa"] for specs in specs_list}
+		derived_products = {specs["produto_derivado"] for specs in specs_list}
+		group_name = biomass_types.pop() if len(biomass_types) == 1 else "biomassas selecionadas"
+
+		if self.potential == "bruto":
+			if len(units) > 1:
+				raise ValueError(f"Datasets with different units can not be added: {sorted(units)}")
+			self.biomass_name = group_name
+			self.unit = units.pop()
+		elif self.potential == "gas":
+			self.biomass_name = f"biogás ({group_name})"
+			self.unit = gas_unit
+		else:
+			product = derived_products.pop() if len(derived_products) == 1 else "derivados"
+			self.biomass_name = f"{product} ({group_name})"
+			self.unit = units.pop() if len(units) == 1 else ""
+
+		self.biomass_type = group_name
+		self.region_type = region_types.pop()
+		self.derived_product = ", ".join(sorted(p for p in derived_products if p))
+		self.derived_coef = ""
+		self.gas_coef = ""
+		self.source = ", ".join(sorted({specs["fonte"] for specs in specs_list}))
+		self.norm_type = "log" if all(specs.get("norm") == "log" for specs in specs_list) else "linear"
+		self.obs = "; ".join(
+			f"{specs['nome_biomassa']} x {coef:g}" for specs, coef in zip(specs_list, self.coefs)
+		)
+
+	@timed("PotentialMap.create_dfs")
+	def create_dfs(self, file_prefix):
+		self.geometry = load_geometry(self.region_type)
+		values = get_value_matrix(self.region_type).values(self.prefixes, self.coefs)
+
+		map_df = self.geometry.to_frame()
+		map_df["qnt_produzida"] = values
+		self.biomass_df = map_df.loc[map_df.qnt_produzida > 0].reset_index(drop=True)
+		self.uf_geometry = load_geometry("uf")
+		self.uf_df = self.uf_geometry.to_frame()
+		self.uf_stats = create_uf_stats(self.biomass_df, "qnt_produzida")
+		self.norm_stats = self.uf_stats
+		self.years = list()
+		self.year = None
+		self.year_matrix = None
@@ -0,0 +1,179 @@
+"""
+LRU cache of rendered images (PNG bytes)
+
+The map only has a few distinct views: ~30 biomass datasets x 28 ufs x a few layer toggles.
+streamlit_app keys every rendered map and colorbar by its view, so a repeated view is sent
+to st.image straight from here and matplotlib is not touched.
+
+render_cache is shared by every session of the process. Set the RENDER_CACHE_DIR environment
+variable to also keep the images on disk, so they survive a restart.
+
+table_cache does the same for the tables below the map (DataFrames, in memory only), which are
+keyed by every input they are computed from.
+"""
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+class RenderCache:
+	"""
+	All attributes:
+		self.max_bytes
+		self.disk_path
+		self.entries: OrderedDict {key: bytes}, least recently used first
+		self.n_bytes
+		self.hits
+		self.misses
+		self.lock
+	"""
+
+	def __init__(self, max_bytes=128 * 2**20, disk_path=None):
+		"""
+		max_bytes: int
+			entries are evicted (least recently used first) when the total size goes over it
+		disk_path: str or None
+			folder where every entry is also written as a .png file
+		"""
+		self.max_bytes = max_bytes
+		self.disk_path = disk_path
+		self.entries = OrderedDict()
+		self.n_bytes = 0
+		self.hits = 0
+		self.misses = 0
+		self.lock = threading.Lock()
+
+		if self.disk_path is not None:
+			os.makedirs(self.disk_path, exist_ok=True)
+
+	def file_path(self, key):
+		key_hash = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+		return f"{self.disk_path}/{key_hash}.png"
+
+	def get(self, key):
+		"""
+		key: hashable tuple
+		Returns the cached bytes or None
+		"""
+		with self.lock:
+			if key in self.entries:
+				self.entries.move_to_end(key)
+				self.hits += 1
+				return self.entries[key]
+
+		data = self.read_disk(key)
+		with self.lock:
+			if data is None:
+				self.misses += 1
+				return None
+			self.hits += 1
+			self.store(key, data)
+			return data
+
+	def contains(self, key):
+		# Does not count as a hit or miss, nor change the order of the entries
+		with self.lock:
+			if key in self.entries:
+				return True
+		return self.disk_path is not None and os.path.exists(self.file_path(key))
+
+	def put(self, key, data):
+		with self.lock:
+			self.store(key, data)
+		self.write_disk(key, data)
+
+	def store(self, key, data):
+		# self.lock must be held
+		if key in self.entries:
+			self.n_bytes -= len(self.entries.pop(key))
+		if len(data) > self.max_bytes:
+			return
+
+		self.entries[key] = data
+		self.n_bytes += len(data)
+		while self.n_bytes > self.max_bytes:
+			evicted_key, evicted_data = self.entries.popitem(last=False)
+			self.n_bytes -= len(evicted_data)
+
+	def read_disk(self, key):
+		if self.disk_path is None:
+			return None
+		try:
+			with open(self.file_path(key), "rb") as file:
+				return file.read()
+		except FileNotFoundError:
+			return None
+
+	def write_disk(self, key, data):
+		if self.disk_path is None:
+			return
+		path = self.file_path(key)
+		with open(f"{path}.tmp", "wb") as file:
+			file.write(data)
+		os.replace(f"{path}.tmp", path)
+
+	def clear(self):
+		with self.lock:
+			self.entries.clear()
+			self.n_bytes = 0
+
+	def stats(self):
+		with self.lock:
+			return {
+				"entries": len(self.entries),
+				"bytes": self.n_bytes,
+				"max_bytes": self.max_bytes,
+				"hits": self.hits,
+				"misses": self.misses,
+			}
+
+
+
+class TableCache:
+	"""
+	LRU cache of computed results, by number of entries
+	The results are shared by every session and must not be changed
+
+	All attributes:
+		self.max_entries
+		self.entries: OrderedDict {key: result}, least recently used first
+		self.hits
+		self.misses
+		self.lock
+	"""
+
+	def __init__(self, max_entries=64):
+		self.max_entries = max_entries
+		self.entries = OrderedDict()
+		self.hits = 0
+		self.misses = 0
+		self.lock = threading.Lock()
+
+	def get_or_compute(self, key, compute):
+		"""
+		key: hashable tuple with every input of compute()
+		Returns the cached result of key, calling compute() on a miss (outside the lock)
+		"""
+		with self.lock:
+			if key in self.entries:
+				self.entries.move_to_end(key)
+				self.hits += 1
+				return self.entries[key]
+			self.misses += 1
+
+		result = compute()
+		with self.lock:
+			self.entries[key] = result
+			while len(self.entries) > self.max_entries:
+				self.entries.popitem(last=False)
+		return result
+
+	def clear(self):
+		with self.lock:
+			self.entries.clear()
+
+
+
+render_cache = RenderCache(disk_path=os.environ.get("RENDER_CACHE_DIR"))
+table_cache = TableCache()
@@ -0,0 +1,178 @@
+"""
+Allocation of the biomass of each region to the units around it
+
+Every region (its centroid) may supply every unit within radius_km of it. The candidate edges are
+built from the haversine matrix in chunks of units and only the ones inside the radius are kept, so
+the problem stays sparse. It is solved as a transportation LP with HiGHS (scipy.optimize.linprog):
+
+	minimize    sum(distance_e * flow_e) + shortage_penalty * sum(unmet_u)
+	subject to  sum of the flows leaving region r <= supply_r
+	            sum of the flows reaching unit u + unmet_u == demand_u
+	            flow_e, unmet_u >= 0
+
+shortage_penalty is larger than any edge distance, so the solver first serves as much demand as the
+supply inside the radius allows and only then minimizes the distance travelled.
+The demand is converted to the unit of the biomass first ("ton/mês" to "ton/ano"), a layer whose unit has
+another quantity can not be sourced.
+"""
+import numpy as np
+import pandas as pd
+import scipy.sparse
+from scipy.optimize import linprog
+from matplotlib.collections import LineCollection
+
+from aggregation import haversine_matrix, max_cells
+
+# periods of a unit "quantity/period", as periods per year
+periods_per_year = {"ano": 1, "mês": 12, "mes": 12, "semana": 52, "dia": 365}
+
+
+def region_centroids(biomass_obj):
+	# (n_regions, 2) lon/lat of the regions of biomass_obj.biomass_df, in its order
+	return biomass_obj.geometry.centroids()[biomass_obj.biomass_df.geometry_idx.to_numpy()]
+
+def candidate_edges(unit_lon, unit_lat, region_lon, region_lat, radius_km):
+	"""
+	Returns (unit, region, distance) arrays for every (unit, region) pair closer than radius_km
+	The distance matrix is computed in chunks of units and only the pairs inside the radius are kept
+	"""
+	chunk_size = max(1, max_cells // max(1, len(region_lon)))
+
+	units, regions, distances = [np.zeros(0, dtype=int)], [np.zeros(0, dtype=int)], [np.zeros(0)]
+	for start in range(0, len(unit_lon), chunk_size):
+		distance = haversine_matrix(unit_lat[start:start + chunk_size], unit_lon[start:start + chunk_size], region_lat, region_lon)
+		rows, cols = np.nonzero(distance <= radius_km)
+		units.append(rows + start)
+		regions.append(cols)
+		distances.append(distance[rows, cols])
+	return np.concatenate(units), np.concatenate(regions), np.concatenate(distances)
+
+def solve_transport(unit_lon, unit_lat, demand, region_lon, region_lat, supply, radius_km):
+	"""
+	Solves the LP of the module docstring
+	Returns (unit, region, distance, flow, unmet): the candidate edges with the flow of each one and the unmet demand of every unit
+	"""
+	demand = np.asarray(demand, dtype=float)
+	supply = np.asarray(supply, dtype=float)
+
+	# regions without supply can not send anything
+	has_supply = np.flatnonzero(supply > 0)
+	unit, region, distance = candidate_edges(unit_lon, unit_lat, region_lon[has_supply], region_lat[has_supply], radius_km)
+	region = has_supply[region]
+
+	n_edges = len(unit)
+	n_units = len(demand)
+	shortage_penalty = 2 * radius_km + 1
+	cost = np.concatenate([distance, np.full(n_units, shortage_penalty)])
+
+	# the variables are the flows of every edge followed by the unmet demand of every unit
+	supply_matrix = scipy.sparse.csr_matrix(
+		(np.ones(n_edges), (region, np.arange(n_edges))),
+		shape=(len(supply), n_edges + n_units)
+	)
+	demand_matrix = scipy.sparse.csr_matrix(
+		(np.ones(n_edges + n_units), (np.concatenate([unit, np.arange(n_units)]), np.arange(n_edges + n_units))),
+		shape=(n_units, n_edges + n_units)
+	)
+
+	solution = linprog(
+		cost,
+		A_ub=supply_matrix, b_ub=supply,
+		A_eq=demand_matrix, b_eq=demand,
+		bounds=(0, None),
+		method="highs"
+	)
+	if solution.status != 0:
+		raise RuntimeError(f"Sourcing LP failed: {solution.message}")
+
+	return unit, region, distance, solution.x[:n_edges], solution.x[n_edges:]
+
+def split_unit(unit):
+	# "ton/mês" -> ("ton", "mês")
+	quantity, _, period = str(unit).strip().lower().partition("/")
+	return quantity.strip(), period.strip()
+
+def unit_factor(from_unit, to_unit):
+	"""
+	Factor that converts a value in from_unit to to_unit ("ton/mês" to "ton/ano": 12)
+	None when they can not be converted: another quantity, or a period not in periods_per_year
+	"""
+	from_quantity, from_period = split_unit(from_unit)
+	to_quantity, to_period = split_unit(to_unit)
+	if (from_quantity, from_period) == (to_quantity, to_period):
+		return 1.0
+	if from_quantity != to_quantity or from_period not in periods_per_year or to_period not in periods_per_year:
+		return None
+	return periods_per_year[from_period] / periods_per_year[to_period]
+
+def solve_sourcing(units_df, biomass_obj, radius_km, demand_column="coef", demand_unit=None):
+	"""
+	units_df: DataFrame with nome, uf, lat, lon and demand_column (DynamicUnits.df, for instance)
+	biomass_obj: biomass.BiomassMap
+	radius_km: float
+		largest distance a region may send its biomass
+	demand_column: str
+		demand (or capacity) of each unit
+	demand_unit: str or None
+		unit of demand_column (the "unidade" of the layer), the demand is converted to biomass_obj.unit
+		(ValueError when it can not be, see unit_factor), None when it is in biomass_obj.unit already
+
+	Returns (flows_df, units_summary_df):
+		flows_df: one row per edge with flow: unit_idx, unidade, region_idx, cod_ibge, nome, uf, distancia_km and fluxo
+		units_summary_df: nome, uf, demanda, atendido, nao_atendido and distancia_media_km of every unit
+	Every quantity is in biomass_obj.unit
+	"""
+	demand = pd.to_numeric(units_df[demand_column]).to_numpy(dtype=float)
+	if demand_unit is not None:
+		factor = unit_factor(demand_unit, biomass_obj.unit)
+		if factor is None:
+			raise ValueError(f"A demand in {demand_unit} can not be met with a biomass in {biomass_obj.unit}")
+		demand = demand * factor
+	centroids = region_centroids(biomass_obj)
+	unit, region, distance, flow, unmet = solve_transport(
+		pd.to_numeric(units_df["lon"]).to_numpy(), pd.to_numeric(units_df["lat"]).to_numpy(), demand,
+		centroids[:, 0], centroids[:, 1], biomass_obj.region_values,
+		radius_km
+	)
+
+	used = flow > 1e-9 * max(1, demand.max(initial=0))
+	unit, region, distance, flow = unit[used], region[used], distance[used], flow[used]
+
+	regions_df = biomass_obj.biomass_df.iloc[region]
+	flows_df = pd.DataFrame({
+		"unit_idx": unit,
+		"unidade": units_df["nome"].to_numpy()[unit],
+		"region_idx": region,
+		"cod_ibge": regions_df["cod_ibge"].to_numpy(),
+		"nome": regions_df["nome"].to_numpy(),
+		"uf": regions_df["uf"].to_numpy(),
+		"distancia_km": distance,
+		"fluxo": flow,
+	})
+
+	served = np.bincount(unit, weights=flow, minlength=len(units_df))
+	flow_km = np.bincount(unit, weights=flow * distance, minlength=len(units_df))
+	units_summary_df = units_df[["nome", "uf"]].copy()
+	units_summary_df["demanda"] = demand
+	units_summary_df["atendido"] = served
+	units_summary_df["nao_atendido"] = unmet
+	with np.errstate(divide="ignore", invalid="ignore"):
+		units_summary_df["distancia_media_km"] = np.where(served > 0, flow_km / served, np.nan)
+
+	return flows_df, units_summary_df
+
+def draw_flows(ax, flows_df, units_df, biomass_obj, color="tab:red", max_linewidth=3, zorder=4):
+	"""
+	Draws a line from the centroid of every supplying region to its unit as a single LineCollection,
+	the width is proportional to the flow. Returns the collection
+	"""
+	centroids = region_centroids(biomass_obj)[flows_df.region_idx]
+	unit_lon = pd.to_numeric(units_df["lon"]).to_numpy()[flows_df.unit_idx]
+	unit_lat = pd.to_numeric(units_df["lat"]).to_numpy()[flows_df.unit_idx]
+	segments = np.stack([centroids, np.column_stack([unit_lon, unit_lat])], axis=1)
+
+	fluxo = flows_df.fluxo.to_numpy()
+	widths = max_linewidth * fluxo / fluxo.max() if len(fluxo) else []
+	lines = LineCollection(segments, linewidths=widths, colors=color, alpha=0.6, zorder=zorder)
+	ax.add_collection(lines)
+	return lines
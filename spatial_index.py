@@ -0,0 +1,241 @@
+"""
+Point in region lookup over a GeometryStore
+
+SpatialIndex answers (lon, lat) -> region for whole arrays of points at once:
+	1. a uniform grid over Brazil lists the regions whose bbox touches each cell
+	2. the edges of every region are bucketed into horizontal strips of its bbox
+	3. a point is inside a region when a ray cast to +x crosses an odd number of the edges in its strip
+Every step is a NumPy operation over all the (point, candidate) pairs, there is no loop per point.
+"""
+import logging
+import threading
+import numpy as np
+import pandas as pd
+
+from geometry_store import load_geometry
+
+logger = logging.getLogger(__name__)
+
+# (name, nome, declared uf, located uf) of the fixes already warned about, the same layer is built again for
+# every session and background scene, its fixes are logged at debug level after the first time
+reported_fixes = set()
+reported_lock = threading.Lock()
+
+
+def expand_ranges(starts, counts):
+	"""
+	Concatenation of np.arange(start, start + count) for every (start, count)
+	Returns (owner, values): owner[i] is the position in starts that values[i] came from
+	"""
+	counts = np.asarray(counts)
+	owner = np.repeat(np.arange(len(counts)), counts)
+	first = np.cumsum(counts) - counts
+	values = np.repeat(starts, counts) + np.arange(counts.sum()) - np.repeat(first, counts)
+	return owner, values
+
+def bucket_csr(bucket_ids, n_buckets):
+	"""
+	Sorts items by bucket, returns (order, starts, counts) so that bucket b holds order[starts[b]:starts[b]+counts[b]]
+	"""
+	order = np.argsort(bucket_ids, kind="stable")
+	counts = np.bincount(bucket_ids, minlength=n_buckets)
+	starts = np.cumsum(counts) - counts
+	return order, starts, counts
+
+
+class SpatialIndex:
+	"""
+	All attributes:
+		self.store
+		self.level
+		self.bounds: (n_regions, 4) array with x_min, y_min, x_max, y_max of each region
+		self.edges: (n_edges, 4) array with x0, y0, x1, y1
+		self.n_strips
+		self.strip_height
+		self.strip_edges, self.strip_starts, self.strip_counts: edges of strip s of region r are bucket r * n_strips + s
+		self.grid_bounds
+		self.grid_size
+		self.cell_regions, self.cell_starts, self.cell_counts
+	"""
+
+	def __init__(self, store, level=0, grid_size=64, n_strips=32):
+		"""
+		store: geometry_store.GeometryStore
+		level: int
+			level of detail of the rings used, 0 is the exact geometry
+		"""
+		self.store = store
+		self.level = level
+		self.grid_size = grid_size
+		self.n_strips = n_strips
+
+		rings = store.rings(level=level)
+		if level == 0:
+			self.bounds = np.asarray(store.bounds)
+		else:
+			self.bounds = np.array([[*ring.min(axis=0), *ring.max(axis=0)] for ring in rings])
+		self.create_edges(rings)
+		self.create_strips()
+		self.create_grid()
+
+	def create_edges(self, rings):
+		edges = list()
+		edge_region = list()
+		for idx, ring in enumerate(rings):
+			ring = np.asarray(ring)
+			# the closing edge is zero-length (and never crossed) when the ring is already closed
+			edges.append(np.hstack([ring, np.roll(ring, -1, axis=0)]))
+			edge_region.append(np.full(len(ring), idx))
+		self.edges = np.concatenate(edges)
+		self.edge_region = np.concatenate(edge_region)
+
+	def create_strips(self):
+		region_y_min = self.bounds[self.edge_region, 1]
+		self.strip_height = (self.bounds[:, 3] - self.bounds[:, 1]) / self.n_strips
+		self.strip_height[self.strip_height == 0] = 1
+		height = self.strip_height[self.edge_region]
+
+		edge_y_min = np.minimum(self.edges[:, 1], self.edges[:, 3])
+		edge_y_max = np.maximum(self.edges[:, 1], self.edges[:, 3])
+		first = np.clip(((edge_y_min - region_y_min) // height).astype(int), 0, self.n_strips - 1)
+		last = np.clip(((edge_y_max - region_y_min) // height).astype(int), 0, self.n_strips - 1)
+
+		# an edge goes into every strip it spans
+		edge_idx, strip = expand_ranges(first, last - first + 1)
+		bucket = self.edge_region[edge_idx] * self.n_strips + strip
+		order, self.strip_starts, self.strip_counts = bucket_csr(bucket, len(self.bounds) * self.n_strips)
+		self.strip_edges = edge_idx[order]
+
+	def create_grid(self):
+		x_min, y_min = self.bounds[:, :2].min(axis=0)
+		x_max, y_max = self.bounds[:, 2:].max(axis=0)
+		self.grid_bounds = np.array([x_min, y_min, x_max, y_max])
+
+		col_first, row_first = self.cell_of(self.bounds[:, 0], self.bounds[:, 1])
+		col_last, row_last = self.cell_of(self.bounds[:, 2], self.bounds[:, 3])
+
+		cells = list()
+		regions = list()
+		for idx in range(len(self.bounds)):
+			cols, rows = np.meshgrid(
+				np.arange(col_first[idx], col_last[idx] + 1),
+				np.arange(row_first[idx], row_last[idx] + 1)
+			)
+			cells.append((rows * self.grid_size + cols).ravel())
+			regions.append(np.full(cols.size, idx))
+		cells = np.concatenate(cells)
+		regions = np.concatenate(regions)
+
+		order, self.cell_starts, self.cell_counts = bucket_csr(cells, self.grid_size ** 2)
+		self.cell_regions = regions[order]
+
+	def cell_of(self, x, y):
+		x_min, y_min, x_max, y_max = self.grid_bounds
+		col = ((np.asarray(x) - x_min) / (x_max - x_min) * self.grid_size).astype(int)
+		row = ((np.asarray(y) - y_min) / (y_max - y_min) * self.grid_size).astype(int)
+		return np.clip(col, 0, self.grid_size - 1), np.clip(row, 0, self.grid_size - 1)
+
+	def query(self, lon, lat):
+		"""
+		lon, lat: float or array
+		Returns an int array with the position in the store of the region holding each point, -1 if none does
+		"""
+		lon = np.atleast_1d(np.asarray(lon, dtype=float))
+		lat = np.atleast_1d(np.asarray(lat, dtype=float))
+		result = np.full(len(lon), -1)
+
+		x_min, y_min, x_max, y_max = self.grid_bounds
+		in_grid = np.flatnonzero((lon >= x_min) & (lon <= x_max) & (lat >= y_min) & (lat <= y_max))
+		if len(in_grid) == 0:
+			return result
+
+		# (point, candidate region) pairs from the grid, then from the region bbox
+		col, row = self.cell_of(lon[in_grid], lat[in_grid])
+		cell = row * self.grid_size + col
+		pair_point, pair_pos = expand_ranges(self.cell_starts[cell], self.cell_counts[cell])
+		pair_point = in_grid[pair_point]
+		pair_region = self.cell_regions[pair_pos]
+
+		px = lon[pair_point]
+		py = lat[pair_point]
+		bounds = self.bounds[pair_region]
+		in_bbox = (px >= bounds[:, 0]) & (px <= bounds[:, 2]) & (py >= bounds[:, 1]) & (py <= bounds[:, 3])
+		pair_point, pair_region, px, py = pair_point[in_bbox], pair_region[in_bbox], px[in_bbox], py[in_bbox]
+
+		# ray casting against the edges in the strip of each pair
+		strip = np.clip(((py - self.bounds[pair_region, 1]) // self.strip_height[pair_region]).astype(int), 0, self.n_strips - 1)
+		bucket = pair_region * self.n_strips + strip
+		combo_pair, combo_pos = expand_ranges(self.strip_starts[bucket], self.strip_counts[bucket])
+		x0, y0, x1, y1 = self.edges[self.strip_edges[combo_pos]].T
+		cy = py[combo_pair]
+		spans = (y0 > cy) != (y1 > cy)
+		with np.errstate(divide="ignore", invalid="ignore"):
+			x_cross = x0 + (cy - y0) * (x1 - x0) / (y1 - y0)
+		crossed = spans & (px[combo_pair] < x_cross)
+
+		inside = np.bincount(combo_pair, weights=crossed, minlength=len(pair_point)).astype(int) % 2 == 1
+		# a point on the border of two regions keeps the first one found
+		inside_points = pair_point[inside][::-1]
+		result[inside_points] = pair_region[inside][::-1]
+		return result
+
+	def lookup(self, lon, lat):
+		"""
+		DataFrame with cod_ibge, nome and uf of the region holding each point (NaN / None outside every region)
+		"""
+		positions = self.query(lon, lat)
+		found = positions >= 0
+		lookup_df = pd.DataFrame({
+			"cod_ibge": pd.array(np.where(found, np.asarray(self.store.cod_ibge)[positions], 0), dtype="Int64"),
+			"nome": np.where(found, np.asarray(self.store.nome)[positions], None),
+			"uf": np.where(found, np.asarray(self.store.uf)[positions], None),
+		})
+		lookup_df.loc[~found, "cod_ibge"] = pd.NA
+		return lookup_df
+
+
+
+# {region_type: SpatialIndex}, rebuilt when the repository hands out a new store
+spatial_indexes = dict()
+
+def get_spatial_index(region_type="uf"):
+	store = load_geometry(region_type)
+	index = spatial_indexes.get(region_type)
+	if index is None or index.store is not store:
+		index = SpatialIndex(store)
+		spatial_indexes[region_type] = index
+	return index
+
+def locate_uf(df):
+	"""
+	df: DataFrame with lat and lon columns
+	Returns a Series with the uf each row lies in (None for points outside every uf)
+	"""
+	uf_index = get_spatial_index("uf")
+	located = uf_index.lookup(pd.to_numeric(df["lon"]), pd.to_numeric(df["lat"]))
+	return pd.Series(located.uf.to_numpy(), index=df.index)
+
+def assign_uf(df, name=""):
+	"""
+	Fills the uf of the rows that do not have one and fixes the ones that disagree with their coordinates
+	(e.g. João Pessoa tagged as "PA"), every fix is logged (a warning the first time in the process, see reported_fixes)
+	Rows whose point falls outside every uf (at sea, for instance) keep the uf they had
+	"""
+	df = df.copy()
+	if "uf" not in df.columns:
+		df["uf"] = None
+
+	located = locate_uf(df)
+	declared = df["uf"].where(df["uf"].notna() & (df["uf"] != ""))
+	wrong = located.notna() & (declared != located)
+
+	for idx in df.index[wrong & declared.notna()]:
+		fix = (name, df.at[idx, "nome"], declared[idx], located[idx])
+		with reported_lock:
+			first_time = fix not in reported_fixes
+			reported_fixes.add(fix)
+		level = logging.WARNING if first_time else logging.DEBUG
+		logger.log(level, f"{name}: {fix[1]} is tagged as {fix[2]} but lies in {fix[3]}")
+
+	df.loc[wrong, "uf"] = located[wrong]
+	return df
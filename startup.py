@@ -0,0 +1,114 @@
+"""
+Cold start of the app
+
+The first session of a process pays for importing matplotlib, pandas, numpy, scipy and streamlit, for the
+dataset catalog, the geometry stores and for drawing the default map. start_warmup() does all of that in a
+daemon thread, once per process: it imports the modules (timing each one), loads the catalog and every
+geometry store, and renders the images of the view a new session opens on into render_cache
+(streamlit_app.warm_default_view), so the first visitor reads them instead of drawing them.
+
+The times are kept in startup_times and shown in the performance panel of the app (?perf=1), with the
+time of the imports of the first run of streamlit_app and the first paint of the first session.
+
+Usage:
+	python startup.py [streamlit flags]    starts the warm-up, then the server (streamlit run streamlit_app.py),
+	                                       the server does not wait for the warm-up
+	python startup.py --warmup-only        runs the warm-up in the foreground and prints the times
+st.secrets must hold the unit layers (.streamlit/secrets.toml), without them the default view is not warmed.
+"""
+import sys
+import time
+import logging
+import importlib
+import threading
+
+logger = logging.getLogger(__name__)
+
+# in the order the first session needs them, the lazy ones of streamlit_app (sourcing) last
+warm_modules = ["numpy", "pandas", "matplotlib.figure", "streamlit", "streamlit_app", "sourcing"]
+
+startup_times = dict()  # {step: seconds}
+startup_lock = threading.Lock()
+warmup_thread = None
+
+
+def record_first(step, seconds):
+	# keeps the first time of step, the one of the cold process
+	with startup_lock:
+		startup_times.setdefault(step, seconds)
+
+def startup_report():
+	with startup_lock:
+		return dict(startup_times)
+
+def timed_step(step, func, *args):
+	start = time.perf_counter()
+	result = func(*args)
+	record_first(step, time.perf_counter() - start)
+	return result
+
+def warm_up(secrets=None):
+	"""
+	secrets: dict or None
+		the static_units and dynamic_units sections, st.secrets when None
+	"""
+	start = time.perf_counter()
+	for name in warm_modules:
+		timed_step(f"import {name}", importlib.import_module, name)
+
+	from dataset_catalog import dataset_catalog
+	from geometry_store import load_geometry, available_region_types
+	from spatial_index import get_spatial_index
+	timed_step("dataset catalog", dataset_catalog.get_table)
+	for region_type in available_region_types():
+		timed_step(f"geometry {region_type}", load_geometry, region_type)
+	# assign_uf of the unit layers
+	timed_step("uf spatial index", get_spatial_index, "uf")
+
+	if secrets is None:
+		import streamlit as st
+		try:
+			secrets = {section: st.secrets[section] for section in ["static_units", "dynamic_units"]}
+		except (FileNotFoundError, KeyError) as error:
+			logger.warning(f"The default view is not warmed, st.secrets has no unit layers ({error})")
+	if secrets is not None:
+		from streamlit_app import warm_default_view
+		timed_step("default view", warm_default_view, secrets)
+
+	record_first("warm-up", time.perf_counter() - start)
+	logger.info(f"Warm-up done in {time.perf_counter() - start:.2f} s")
+
+def run_warmup(secrets):
+	try:
+		warm_up(secrets)
+	except Exception:
+		logger.exception("Warm-up failed")
+
+def start_warmup(secrets=None):
+	"""
+	Starts warm_up(secrets) in a daemon thread, only the first call of the process does
+	Returns the thread
+	"""
+	global warmup_thread
+	with startup_lock:
+		if warmup_thread is None:
+			warmup_thread = threading.Thread(target=run_warmup, args=(secrets,), daemon=True)
+			warmup_thread.start()
+		return warmup_thread
+
+
+
+if __name__ == "__main__":
+	logging.basicConfig(level=logging.INFO)
+	# the state must live in the module streamlit_app imports, not in __main__
+	import startup
+	if sys.argv[1:] == ["--warmup-only"]:
+		startup.warm_up()
+		for step, seconds in startup.startup_report().items():
+			print(f"{step:<30}{seconds:>8.3f} s")
+		raise SystemExit(0)
+
+	startup.start_warmup()
+	from streamlit.web import cli
+	sys.argv = ["streamlit", "run", "streamlit_app.py"] + sys.argv[1:]
+	raise SystemExit(cli.main())
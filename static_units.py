@@ -12,8 +12,10 @@ import pandas as pd
 import matplotlib
 import matplotlib.pyplot as plt
 import json
+from perf import timed
 
 class StaticUnits:
+	@timed("StaticUnits.__init__")
 	def __init__(self, fig, ax, df, specs_dict):
 		"""
 		fig: matplotlib.figure.Figure
@@ -53,28 +55,31 @@ class StaticUnits:
 		self.df["lat"] = pd.to_numeric(self.df["lat"])
 		self.df["lon"] = pd.to_numeric(self.df["lon"])
 
-		self.create_point_dict()
+		self.create_points()
 
 
 
-	def create_point_dict(self):
-		self.point_dict = dict()
-		for uf in self.df.uf.unique():
-			self.point_dict[uf] = list()
-
-		for index, row in self.df.iterrows():
-			self.point_dict[row.uf].append(
-				self.ax.scatter(row.lon, row.lat, color=self.color, marker=self.marker, zorder=2)
-			)
+	@timed("StaticUnits.create_points")
+	def create_points(self):
+		"""
+		Every unit is drawn by a single scatter collection, self.points
+		change_visibility only swaps its offsets for the ones of the selected uf
+		"""
+		self.offsets = self.df[["lon", "lat"]].to_numpy(dtype=float)
+		self.point_uf = self.df.uf.to_numpy()
+		self.points = self.ax.scatter(
+			self.offsets[:, 0],
+			self.offsets[:, 1],
+			color=self.color,
+			marker=self.marker,
+			zorder=2
+		)
 
 
+	@timed("StaticUnits.change_visibility")
 	def change_visibility(self, visible, uf="Brasil"):
-		for uf_name, point_list in self.point_dict.items():
-			if uf_name == uf or uf == "Brasil":
-				for point in point_list:
-					# point is a matplotlib collection
-					point.set(visible=visible)
-			else:
-				for point in point_list:
-					# point is a matplotlib collection
-					point.set(visible = False)
\ No newline at end of file
+		if uf == "Brasil":
+			self.points.set_offsets(self.offsets)
+		else:
+			self.points.set_offsets(self.offsets[self.point_uf == uf])
+		self.points.set_visible(visible)
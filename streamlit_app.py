@@ -1,3 +1,7 @@
+import time
+# start of this run of the script, the imports below are only slow on the first run of the process
+script_start = time.perf_counter()
+
 import streamlit as st
 from streamlit import session_state as sst
 
@@ -5,11 +9,44 @@ from biomass import BiomassMap
 from static_units import StaticUnits 
 from dynamic_units import DynamicUnits
 from support_sst import *
+from render_cache import render_cache, table_cache
+from colorbar import render_legend
+from spatial_index import assign_uf
+from aggregation import biomass_within_radius, draw_radius_overlay
+from potential import PotentialMap, read_specs, usable_prefixes
+from frame_renderer import FrameRenderer
+from map_tooltips import TooltipTable, tooltip_map_html
+from perf import timed, count, record_rerun, deep_size, live_figures
 
 import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 import pandas as pd
+import numpy as np
 import io
-
+import json
+import hashlib
+import urllib.parse
+import logging
+
+from startup import startup_report, record_first
+record_first("imports of streamlit_app", time.perf_counter() - script_start)
+
+logger = logging.getLogger(__name__)
+
+# reruns shown in the performance panel
+perf_history_size = 20
+
+# the view a new session opens on
+default_selection = {
+	"selected_biomass_type": "Oleaginosas",
+	"selected_biomass_name": "Algodão herbáceo",
+	"selected_uf": "Brasil",
+	"selected_zoom": "",
+	"selected_layer": "producao",
+	"selected_year": None,
+}
+
+@timed("streamlit_app.init_sst")
 def init_sst():
 	# Support variables
 	if "biomass_prefixes_list" not in sst:
@@ -21,19 +58,29 @@ def init_sst():
 
 
 	# Real session state variables
-	if "selected_biomass_type" not in sst:
-		sst["selected_biomass_type"] = "Oleaginosas"
-
-	if "selected_biomass_name" not in sst:
-		sst["selected_biomass_name"] = "Algodão herbáceo"
+	for key, value in default_selection.items():
+		if key not in sst:
+			sst[key] = value
 
-	if "selected_biomass_name" in sst and sst["selected_biomass_name"] is None:
+	if sst["selected_biomass_name"] is None:
 		sst["selected_biomass_name"] = sorted(sst["biomass_types_dict"][sst["selected_biomass_type"]])[0]
 
+	if "frame_renderer" not in sst:
+		# pre-renders the year frames of the current view
+		sst["frame_renderer"] = FrameRenderer()
 
+	if "uf_renderer" not in sst:
+		# pre-renders the other ufs of the current biomass
+		sst["uf_renderer"] = FrameRenderer()
 
-	if "selected_uf" not in sst:
-		sst["selected_uf"] = "Brasil"
+	if "session_start" not in sst:
+		# the first paint of the session is measured from here
+		sst["session_start"] = script_start
+
+	if "stage_deps" not in sst:
+		# {stage name: dependencies used on its last run}
+		sst["stage_deps"] = dict()
+	sst["stage_log"] = list()
 
 
 	for k in st.secrets["static_units"].keys():
@@ -47,6 +94,222 @@ def init_sst():
 			sst[f"du#{k}"] = True
 
 
+def run_stage(name, deps, func):
+	"""
+	Runs func only if deps changed since the last time the stage ran in this session
+	Every call is recorded in sst["stage_log"] as (name, ran, seconds)
+	"""
+	if sst["stage_deps"].get(name) == deps:
+		sst["stage_log"].append((name, False, 0.0))
+		return
+
+	start = time.perf_counter()
+	func()
+	count("stages_run")
+	sst["stage_deps"][name] = deps
+	sst["stage_log"].append((name, True, time.perf_counter() - start))
+
+def secrets_digest(units_secrets):
+	# Changes whenever the data of a section of st.secrets changes
+	dumped = json.dumps(units_secrets, sort_keys=True, default=dict)
+	return hashlib.sha1(dumped.encode("utf-8")).hexdigest()
+
+def secrets_dict(units_secrets):
+	# Plain dict copy of a section of st.secrets, safe to hand to another thread
+	return json.loads(json.dumps(units_secrets, default=dict))
+
+def pipeline_deps(state, secrets):
+	"""
+	state: sst, or a dict with the same selected_* and su#k / du#k keys (see default_state)
+	secrets: st.secrets, or a dict with the same sections
+	"""
+	biomass_deps = (state["selected_biomass_prefix"], state["selected_layer"], tuple(state["selected_potential_prefixes"]))
+	return {
+		"biomass_obj": biomass_deps,
+		"static_units": (biomass_deps, secrets_digest(secrets["static_units"])),
+		"dynamic_units": (biomass_deps, secrets_digest(secrets["dynamic_units"])),
+		"uf": state["selected_uf"],
+		"zoom": state["selected_zoom"],
+		"static_visible": tuple(state[f"su#{k}"] for k in secrets["static_units"].keys()),
+		"dynamic_visible": tuple(state[f"du#{k}"] for k in secrets["dynamic_units"].keys()),
+		"dynamic_keys": tuple(secrets["dynamic_units"].keys()),
+	}
+
+@timed("streamlit_app.update_pipeline_deps")
+def update_pipeline_deps():
+	"""
+	Everything the pipeline stages and the cached images depend on, computed once per rerun
+	"""
+	# the uf selector resets the zoom (reset_zoom), this drops a zoom that is not an option of the uf otherwise
+	if sst["selected_zoom"] not in create_zoom_options(uf_dict[sst["selected_uf"]]):  # support_sst
+		sst["selected_zoom"] = ""
+	sst["pipeline_deps"] = pipeline_deps(sst, st.secrets)
+
+@timed("streamlit_app.run_build_stages")
+def run_build_stages():
+	"""
+	The map is rebuilt only when the biomass changes, the unit layers when the biomass or their secrets change
+	"""
+	deps = sst["pipeline_deps"]
+	run_stage("biomass_obj", deps["biomass_obj"], create_biomass_obj)
+	run_stage("static_units", deps["static_units"], create_static_unit_objs)
+	run_stage("dynamic_units", deps["dynamic_units"], create_dynamic_units_objs)
+
+@timed("streamlit_app.update_year")
+def update_year():
+	"""
+	Keeps sst["selected_year"] valid for the built biomass_obj (its last year, None without years)
+	"""
+	years = sst["biomass_obj"].years
+	if not years:
+		sst["selected_year"] = None
+	elif sst["selected_year"] not in years:
+		sst["selected_year"] = years[-1]
+	sst["pipeline_deps"]["year"] = sst["selected_year"]
+
+@timed("streamlit_app.run_view_stages")
+def run_view_stages():
+	"""
+	A new uf, year or checkbox value only calls change_uf / change_year / change_visibility on the existing objects
+	Runs on every rerun, even when the images of the view are in render_cache: the tables below the map read
+	the values of the objects (production_by_uf, region_values), only the draw is cached
+	"""
+	deps = sst["pipeline_deps"]
+	run_stage("biomass_uf", (deps["biomass_obj"], deps["uf"], deps["zoom"]), update_biomass_obj_uf)
+	run_stage("biomass_year", (deps["biomass_obj"], deps["uf"], deps["year"]), update_biomass_obj_year)
+	run_stage("static_visibility", (deps["static_units"], deps["uf"], deps["static_visible"]), update_static_unit_objs)
+	run_stage("dynamic_visibility", (deps["dynamic_units"], deps["uf"], deps["dynamic_visible"]), update_dynamic_unit_objs)
+
+def cached_image(key, render):
+	"""
+	Returns the PNG bytes of key from render_cache, calling render() on a miss
+	The view stages ran before (main), so the objects match the selected view
+	"""
+	data = render_cache.get(key)
+	count("render_cache_hits" if data is not None else "render_cache_misses")
+	if data is None:
+		data = render()
+		render_cache.put(key, data)
+	return data
+
+def cached_table(key, compute):
+	# compute() on a table_cache miss, the key must hold every input of compute()
+	def counted():
+		count("table_cache_misses")
+		return compute()
+	return table_cache.get_or_compute(key, counted)
+
+@timed("streamlit_app.fig_to_png")
+def fig_to_png(fig):
+	# Same savefig arguments st.pyplot uses
+	io_buf = io.BytesIO()
+	fig.savefig(io_buf, format="png", bbox_inches="tight", dpi=200)
+	return io_buf.getvalue()
+
+@timed("streamlit_app.array_to_png")
+def array_to_png(img_arr):
+	io_buf = io.BytesIO()
+	plt.imsave(io_buf, np.ascontiguousarray(img_arr), format="png")
+	return io_buf.getvalue()
+
+def map_key(year=None, uf=None, deps=None):
+	"""
+	year: int or None
+		key of the same view in another year, the selected year when None
+	uf: str or None
+		key of the same view of the whole uf (no zoom), the selected uf and zoom when None
+	deps: dict or None
+		pipeline deps of the view, sst["pipeline_deps"] when None
+	"""
+	if deps is None:
+		deps = sst["pipeline_deps"]
+	if year is None:
+		year = deps["year"]
+	zoom = deps["zoom"] if uf is None else ""
+	if uf is None:
+		uf = deps["uf"]
+	return ("map", deps["biomass_obj"], uf, year, deps["static_units"], deps["static_visible"], deps["dynamic_units"], deps["dynamic_visible"], zoom)
+
+def colorbar_key(unit, uf=None, deps=None):
+	if deps is None:
+		deps = sst["pipeline_deps"]
+	if uf is None:
+		uf = deps["uf"]
+	if unit == "biomass_obj":
+		return ("colorbar", deps["biomass_obj"], uf)
+	return ("colorbar", unit, deps["dynamic_units"], uf)
+
+def colorbar_units(deps):
+	# the objects with a colorbar next to the map
+	return ["biomass_obj"] + [f"dynamic_unit_obj#{k}" for k in deps["dynamic_keys"]]
+
+def view_images(year=None, uf=None, colorbars=True, deps=None):
+	"""
+	(cache_key, render) of every image of the current view, or of the same view in another year or uf (see map_key)
+	render(scene) reads the objects of scene, sst or a scene of build_view_scene already set up for that view
+	"""
+	if deps is None:
+		deps = sst["pipeline_deps"]
+	uf_abbr = uf_dict[uf or deps["uf"]]  # support_sst
+	key = map_key(year, uf, deps)
+	images = [
+		(key, lambda scene: fig_to_png(scene["biomass_obj"].fig)),
+		(("picking",) + key[1:], lambda scene: scene_tooltip_table(scene, uf_abbr).render_picking(scene["biomass_obj"], fig_to_png)),
+		(("tooltips",) + key[1:], lambda scene: scene_tooltip_table(scene, uf_abbr).to_json()),
+	]
+	if colorbars:
+		for unit in colorbar_units(deps):
+			images.append((colorbar_key(unit, uf, deps), lambda scene, unit=unit: array_to_png(scene[unit].cbar_array)))
+	return images
+
+@timed("streamlit_app.show_stage_log")
+def show_stage_log():
+	with st.sidebar.expander("Etapas da última execução"):
+		stage_df = pd.DataFrame(sst["stage_log"], columns=["etapa", "executada", "tempo (s)"])
+		st.dataframe(stage_df, hide_index=True)
+		st.write("Cache de imagens:", render_cache.stats())
+		done, total = sst["uf_renderer"].progress()
+		st.write("Estados pré-renderizados:", f"{done}/{total}")
+		if "first_paint" in sst:
+			st.write("Primeiro mapa da sessão:", f"{sst['first_paint']:.2f} s")
+
+def perf_panel_requested():
+	# the performance panel is hidden, it is shown when the app is opened with ?perf=1
+	return st.query_params.get("perf") == "1"
+
+def add_perf_record(record):
+	# keeps the records of the last perf_history_size reruns of the session
+	history = sst.get("perf_history", list()) + [record]
+	sst["perf_history"] = history[-perf_history_size:]
+
+def show_perf_panel():
+	with st.sidebar.expander("Desempenho", expanded=True):
+		history = sst["perf_history"]
+		history_df = pd.DataFrame({
+			"início": [time.strftime("%H:%M:%S", time.localtime(record.started)) for record in history],
+			"total (s)": [record.total for record in history],
+			"etapas executadas": [record.label for record in history],
+			"imagens do cache": [record.counters.get("render_cache_hits", 0) for record in history],
+			"imagens desenhadas": [record.counters.get("render_cache_misses", 0) for record in history],
+		})
+		st.write(f"Últimas {len(history)} execuções:")
+		st.dataframe(history_df.iloc[::-1], hide_index=True)
+		st.write("Funções da última execução:")
+		st.dataframe(history[-1].timers_df(), hide_index=True)
+
+		# objects shared by several keys are counted in the first one
+		seen = set()
+		memory_df = pd.DataFrame({"chave": sorted(sst.keys())})
+		memory_df["MB"] = [deep_size(sst[key], seen) / 2**20 for key in memory_df.chave]
+		st.write("Memória do session_state:", f"{memory_df.MB.sum():.1f} MB")
+		st.dataframe(memory_df.sort_values("MB", ascending=False).head(10), hide_index=True)
+		st.write("Figuras do matplotlib vivas:", live_figures(), f"({len(plt.get_fignums())} no pyplot)")
+
+		st.write("Início do processo:")
+		startup_df = pd.Series(startup_report(), name="tempo (s)", dtype=float).rename_axis("etapa").reset_index()
+		st.dataframe(startup_df, hide_index=True)
+
+@timed("streamlit_app.make_biomass_selectors")
 def make_biomass_selectors():
 	st.sidebar.selectbox(
 		label="Selecione o tipo de biomassa:",
@@ -66,23 +329,121 @@ def get_biomass_prefix():
 	for tup in sst["biomass_prefixes_list"]:
 		if tup[1:] == ( sst["selected_biomass_type"], sst["selected_biomass_name"] ):
 			sst["selected_biomass_prefix"] = tup[0]
-			
-def create_biomass_obj():
-	sst["biomass_obj"] = BiomassMap(
-		fig=plt.figure(),
-		file_prefix=sst["selected_biomass_prefix"]
+
+@timed("streamlit_app.make_layer_selectors")
+def make_layer_selectors():
+	"""
+	The aggregated layers combine the datasets of the selected type that share the region type of the selected biomass
+	"""
+	layers_dict = {
+		"producao": "Produção da biomassa",
+		"bruto": "Produção total do tipo",
+		"gas": "Potencial de biogás",
+		"derivado": "Potencial de derivados",
+	}
+	st.sidebar.selectbox(
+		label="Camada:",
+		options=layers_dict.keys(),
+		format_func=lambda layer: layers_dict[layer],
+		key="selected_layer"
+	)
+	st.sidebar.checkbox(
+		label="Mapa no navegador (experimental)",
+		key="browser_map",
+		help="Desenha as regiões no navegador a partir do TopoJSON do servidor local, as unidades não são mostradas"
+	)
+	sst["selected_potential_prefixes"] = list()
+	if sst["selected_layer"] == "producao":
+		return
+
+	# only datasets of the same unit can be added without a conversion
+	selected_specs = read_specs(sst["selected_biomass_prefix"])
+	compared_fields = ["tipo_regiao", "unidade"] if sst["selected_layer"] == "bruto" else ["tipo_regiao"]
+	same_type = [
+		tup for tup in sst["biomass_prefixes_list"]
+		if tup[1] == sst["selected_biomass_type"]
+		and all(read_specs(tup[0])[field] == selected_specs[field] for field in compared_fields)
+	]
+	names_dict = {tup[0]: tup[2] for tup in same_type}
+	options = usable_prefixes(sorted(names_dict.keys(), key=lambda prefix: names_dict[prefix]), sst["selected_layer"])
+	if not options:
+		st.sidebar.info("Nenhuma biomassa deste tipo tem o coeficiente de conversão desta camada.")
+		return
+
+	sst["selected_potential_prefixes"] = st.sidebar.multiselect(
+		label="Biomassas agregadas:",
+		options=options,
+		default=options,
+		format_func=lambda prefix: names_dict[prefix]
+	)
+
+def make_biomass_obj(biomass_deps):
+	"""
+	biomass_deps: sst["pipeline_deps"]["biomass_obj"], (prefix, layer, potential prefixes)
+	"""
+	prefix, layer, potential_prefixes = biomass_deps
+	if potential_prefixes:
+		return PotentialMap(
+			fig=Figure(),
+			prefixes=list(potential_prefixes),
+			potential=layer
+		)
+
+	return BiomassMap(
+		fig=Figure(),
+		file_prefix=prefix
 	)
 
+@timed("streamlit_app.create_biomass_obj")
+def create_biomass_obj():
+	sst["biomass_obj"] = make_biomass_obj(sst["pipeline_deps"]["biomass_obj"])
+
+def reset_zoom():
+	# a new uf, Brasil included, always opens on the whole uf (the options of Brasil hold every region)
+	sst["selected_zoom"] = ""
+
 def create_uf_selector():
 	st.selectbox(
 		label="Selecione o estado:",
 		options=uf_dict.keys(),  # support_sst
-		key="selected_uf"
+		key="selected_uf",
+		on_change=reset_zoom
+	)
+
+def create_zoom_selector():
+	zoom_options = create_zoom_options(uf_dict[sst["selected_uf"]])  # support_sst
+	st.selectbox(
+		label="Aproximar em:",
+		options=zoom_options.keys(),
+		format_func=lambda zoom: zoom_options[zoom],
+		key="selected_zoom"
 	)
 
+@timed("streamlit_app.update_biomass_obj_uf")
 def update_biomass_obj_uf():
 	selected_uf_abbr = uf_dict[sst["selected_uf"]]  # support_sst
-	sst["biomass_obj"].change_uf(selected_uf_abbr)
+	sst["biomass_obj"].change_uf(selected_uf_abbr, zoom=parse_zoom(sst["selected_zoom"]))  # support_sst
+
+@timed("streamlit_app.update_biomass_obj_year")
+def update_biomass_obj_year():
+	if sst["selected_year"] is not None:
+		sst["biomass_obj"].change_year(sst["selected_year"])
+
+@timed("streamlit_app.create_year_selector")
+def create_year_selector():
+	years = sst["biomass_obj"].years
+	if len(years) < 2:
+		return False
+
+	st.select_slider(
+		label="Ano:",
+		options=years,
+		key="selected_year"
+	)
+	done, total = sst["frame_renderer"].progress()
+	if done < total:
+		st.caption(f"Preparando a animação: {done}/{total} anos")
+	return st.button("Reproduzir anos")
 
 def create_static_unit_checkboxes():
 	for k in st.secrets["static_units"].keys():
@@ -94,21 +455,32 @@ def create_static_unit_checkboxes():
 
 
 
-def create_static_unit_objs():
-	for k in st.secrets["static_units"].keys():
-		fixed_df = st.secrets["static_units"][k]["df"]
-		fixed_df = pd.DataFrame(fixed_df)
-		fixed_df.columns = fixed_df.iloc[0]
-		fixed_df = fixed_df.iloc[1:].reset_index(drop=True)
-
+@timed("streamlit_app.units_df")
+def units_df(units_secrets, k):
+	fixed_df = units_secrets[k]["df"]
+	fixed_df = pd.DataFrame(fixed_df)
+	fixed_df.columns = fixed_df.iloc[0]
+	fixed_df = fixed_df.iloc[1:].reset_index(drop=True)
+	return assign_uf(fixed_df, name=k)  # fills / fixes the uf column from lat and lon
 
-		sst[f"static_unit_obj#{k}"] = StaticUnits(
-			fig=sst["biomass_obj"].fig,
-			ax=sst["biomass_obj"].ax,
-			df=fixed_df,
-			specs_dict=st.secrets["static_units"][k]["specs_dict"]
+def make_static_unit_objs(biomass_obj, units_secrets):
+	# {k: StaticUnits drawn on the axes of biomass_obj}
+	return {
+		k: StaticUnits(
+			fig=biomass_obj.fig,
+			ax=biomass_obj.ax,
+			df=units_df(units_secrets, k),
+			specs_dict=units_secrets[k]["specs_dict"]
 		)
+		for k in units_secrets.keys()
+	}
 
+@timed("streamlit_app.create_static_unit_objs")
+def create_static_unit_objs():
+	for k, unit_obj in make_static_unit_objs(sst["biomass_obj"], st.secrets["static_units"]).items():
+		sst[f"static_unit_obj#{k}"] = unit_obj
+
+@timed("streamlit_app.update_static_unit_objs")
 def update_static_unit_objs():
 	for k in st.secrets["static_units"].keys():
 		sst[f"static_unit_obj#{k}"].change_visibility(
@@ -125,23 +497,27 @@ def create_dynamic_units_checkboxes():
 			key=f"du#{k}"
 		)
 
-def create_dynamic_units_objs():
-	for k in st.secrets["dynamic_units"].keys():
-		fixed_df = st.secrets["dynamic_units"][k]["df"]
-		fixed_df = pd.DataFrame(fixed_df)
-		fixed_df.columns = fixed_df.iloc[0]
-		fixed_df = fixed_df.iloc[1:].reset_index(drop=True)
-
-		fig, ax = plt.subplots()
-		sst[f"dynamic_unit_obj#{k}"] = DynamicUnits(
-			fig=sst["biomass_obj"].fig,
-			ax=sst["biomass_obj"].ax,
-			legend_fig=fig,
-			legend_ax=ax,
-			df=fixed_df,
-			specs_dict=st.secrets["dynamic_units"][k]["specs_dict"]
+def make_dynamic_unit_objs(biomass_obj, units_secrets):
+	# {k: DynamicUnits drawn on the axes of biomass_obj}
+	unit_objs = dict()
+	for k in units_secrets.keys():
+		legend_fig = Figure()
+		unit_objs[k] = DynamicUnits(
+			fig=biomass_obj.fig,
+			ax=biomass_obj.ax,
+			legend_fig=legend_fig,
+			legend_ax=legend_fig.add_subplot(111),
+			df=units_df(units_secrets, k),
+			specs_dict=units_secrets[k]["specs_dict"]
 		)
+	return unit_objs
 
+@timed("streamlit_app.create_dynamic_units_objs")
+def create_dynamic_units_objs():
+	for k, unit_obj in make_dynamic_unit_objs(sst["biomass_obj"], st.secrets["dynamic_units"]).items():
+		sst[f"dynamic_unit_obj#{k}"] = unit_obj
+
+@timed("streamlit_app.update_dynamic_unit_objs")
 def update_dynamic_unit_objs():
 	for k in st.secrets["dynamic_units"].keys():
 		sst[f"dynamic_unit_obj#{k}"].change_visibility(
@@ -150,13 +526,239 @@ def update_dynamic_unit_objs():
 		)
 
 
+def app_origin():
+	# "scheme://host:port" of the page of the session, None outside of a browser session
+	origin = st.context.headers.get("Origin")
+	if origin is None and st.context.url:
+		url = urllib.parse.urlsplit(st.context.url)
+		origin = f"{url.scheme}://{url.netloc}"
+	return origin
+
+@timed("streamlit_app.create_fig")
 def create_fig():
-	st.pyplot(sst["biomass_obj"].fig)
+	if sst.get("browser_map"):
+		# imported on first use, most sessions never open the browser map
+		from topojson_export import values_payload
+		from map_server import start_map_server, map_server_url, client_map_html, allow_origin
+		port = start_map_server()
+		if port is not None:
+			# the page of st.iframe fetches the topologies from the origin of the app
+			allow_origin(app_origin())
+			return st.iframe(client_map_html(values_payload(sst["biomass_obj"]), map_server_url(port)), height=620)
+		st.warning("O servidor do mapa não pôde ser iniciado, o mapa é mostrado como imagem.")
+
+	images = view_images(colorbars=False)
+	overlays = map_overlays()
+	if overlays:
+		# only the map image has the overlays, the picking image and the tooltips are the ones of the view
+		key, render = images[0]
+		images[0] = (key + tuple(overlay_key for overlay_key, draw in overlays), lambda scene: render_with_overlays(scene["biomass_obj"], overlays))
+	map_png, picking_png, table_json = [
+		cached_image(key, lambda render=render: render(sst))
+		for key, render in images
+	]
+	return st.iframe(tooltip_map_html(map_png, picking_png, table_json), height="content")
+
+def map_overlays():
+	"""
+	(key, draw) of the overlays selected in the tables below the map, draw(ax) adds one artist to ax and returns it
+	The widgets are read from sst, they keep the values of the previous rerun until the tables are drawn again
+	"""
+	overlays = list()
+	units_dict = units_by_type()
+	if sst.get("radius_overlay") and sst.get("radius_units") in units_dict:
+		unit_key = units_dict[sst["radius_units"]]
+		radius_km = sst["radius_km"]
+		overlays.append((
+			("radius", unit_layer_deps(unit_key), unit_key, radius_km),
+			lambda ax: draw_radius_overlay(ax, sst[unit_key].df, radius_km)
+		))
+
+	dynamic_dict = units_by_type(dynamic_only=True)
+	if (
+		sst.get("sourcing_overlay") and sst.get("sourcing_units") in dynamic_dict
+		and sourcing_unit_factor(dynamic_dict[sst["sourcing_units"]]) is not None
+	):
+		from sourcing import draw_flows
+		flow_key = dynamic_dict[sst["sourcing_units"]]
+		flow_radius_km = sst["sourcing_radius"]
+		overlays.append((
+			("flows", unit_layer_deps(flow_key), flow_key, flow_radius_km),
+			lambda ax: draw_flows(ax, sourcing_result(flow_key, flow_radius_km)[0], sst[flow_key].df, sst["biomass_obj"])
+		))
+	return overlays
+
+def render_with_overlays(biomass_obj, overlays):
+	artists = [draw(biomass_obj.ax) for key, draw in overlays]
+	try:
+		return fig_to_png(biomass_obj.fig)
+	finally:
+		for artist in artists:
+			artist.remove()
+
+def scene_tooltip_table(scene, uf):
+	unit_keys = sorted(k for k in scene.keys() if k.startswith("static_unit_obj#") or k.startswith("dynamic_unit_obj#"))
+	return TooltipTable(scene["biomass_obj"], [scene[k] for k in unit_keys], uf)
+
+def build_view_scene(biomass_deps, static_secrets, dynamic_secrets):
+	"""
+	The map objects of the current biomass on a figure of their own, for FrameRenderer
+	(runs outside the script thread, so it does not touch sst)
+	Returns a dict with the keys sst uses: biomass_obj, static_unit_obj#k and dynamic_unit_obj#k
+	"""
+	biomass_obj = make_biomass_obj(biomass_deps)
+	scene = {"biomass_obj": biomass_obj}
+	for k, unit_obj in make_static_unit_objs(biomass_obj, static_secrets).items():
+		scene[f"static_unit_obj#{k}"] = unit_obj
+	for k, unit_obj in make_dynamic_unit_objs(biomass_obj, dynamic_secrets).items():
+		scene[f"dynamic_unit_obj#{k}"] = unit_obj
+	return scene
+
+def setup_scene_view(scene, uf, zoom, static_visible, dynamic_visible):
+	# what the view stages do to the sst objects, uf is an abbreviation
+	scene["biomass_obj"].change_uf(uf, zoom=zoom)
+	static_keys = [k for k in scene.keys() if k.startswith("static_unit_obj#")]
+	for k, visible in zip(static_keys, static_visible):
+		scene[k].change_visibility(visible=visible, uf=uf)
+	dynamic_keys = [k for k in scene.keys() if k.startswith("dynamic_unit_obj#")]
+	for k, visible in zip(dynamic_keys, dynamic_visible):
+		scene[k].change_visibility(visible=visible, uf=uf)
+
+def scene_args():
+	deps = sst["pipeline_deps"]
+	return (deps["biomass_obj"], secrets_dict(st.secrets["static_units"]), secrets_dict(st.secrets["dynamic_units"]))
+
+@timed("streamlit_app.prerender_years")
+def prerender_years():
+	"""
+	Renders the map of every year of the current view in the background, so the playback only reads render_cache
+	"""
+	years = sst["biomass_obj"].years
+	if len(years) < 2:
+		sst["frame_renderer"].cancel()
+		return
+
+	deps = sst["pipeline_deps"]
+	view = (
+		uf_dict[sst["selected_uf"]],  # support_sst
+		parse_zoom(sst["selected_zoom"]),  # support_sst
+		deps["static_visible"],
+		deps["dynamic_visible"],
+	)
+	args = scene_args()
+
+	def build_scene():
+		scene = build_view_scene(*args)
+		setup_scene_view(scene, *view)
+		return scene
+
+	view_key = map_key()
+	sst["frame_renderer"].submit(
+		job_id=view_key[:3] + view_key[4:],  # the map key without the year
+		frames=[(year, view_images(year=year, colorbars=False)) for year in years],
+		build_scene=build_scene,
+		setup=lambda scene, year: scene["biomass_obj"].change_year(year)
+	)
+
+@timed("streamlit_app.prerender_ufs")
+def prerender_ufs():
+	"""
+	Renders the images of every uf of the current biomass, year and unit layers in the background (the whole uf,
+	without zoom), so the next uf selected is read from render_cache
+	The ufs with most production come first, the job is cancelled when the biomass, year or layers change
+	"""
+	deps = sst["pipeline_deps"]
+	uf_names = {abbr: name for name, abbr in uf_dict.items()}  # support_sst
+	production_df = sst["biomass_obj"].production_by_uf()
+	priority = ["Brasil"] + [uf_names[uf] for uf in production_df["UF"] if uf in uf_names]
+	priority += [name for name in uf_dict.keys() if name not in priority]
+	# the selected uf is rendered by this rerun
+	priority.remove(sst["selected_uf"])
+
+	visible = (deps["static_visible"], deps["dynamic_visible"])
+	year = deps["year"]
+	args = scene_args()
+
+	def build_scene():
+		scene = build_view_scene(*args)
+		if year is not None:
+			scene["biomass_obj"].change_year(year)
+		return scene
+
+	sst["uf_renderer"].submit(
+		job_id=("ufs", deps["biomass_obj"], year, deps["static_units"], deps["static_visible"], deps["dynamic_units"], deps["dynamic_visible"]),
+		frames=[(name, view_images(uf=name)) for name in priority],
+		build_scene=build_scene,
+		setup=lambda scene, name: setup_scene_view(scene, uf_dict[name], None, *visible)  # support_sst
+	)
+
+def default_state(secrets):
+	"""
+	What init_sst, get_biomass_prefix and make_layer_selectors set for a new session, as a dict
+	"""
+	state = dict(default_selection)
+	for prefix, biomass_type, biomass_name in create_biomass_prefixes_list():  # support_sst
+		if (biomass_type, biomass_name) == (state["selected_biomass_type"], state["selected_biomass_name"]):
+			state["selected_biomass_prefix"] = prefix
+	state["selected_potential_prefixes"] = list()
+	for k in secrets["static_units"].keys():
+		state[f"su#{k}"] = True
+	for k in secrets["dynamic_units"].keys():
+		state[f"du#{k}"] = True
+	return state
+
+def warm_default_view(secrets):
+	"""
+	Renders the images of the view a new session opens on into render_cache, outside any session
+	(startup.start_warmup calls it when the server starts, so the first visitor does not draw them)
+	secrets: st.secrets, or a dict with the same sections
+	"""
+	deps = pipeline_deps(default_state(secrets), secrets)
+	scene = build_view_scene(deps["biomass_obj"], secrets_dict(secrets["static_units"]), secrets_dict(secrets["dynamic_units"]))
+	years = scene["biomass_obj"].years
+	deps["year"] = years[-1] if years else None  # update_year
+	if deps["year"] is not None:
+		scene["biomass_obj"].change_year(deps["year"])
+	setup_scene_view(scene, uf_dict[deps["uf"]], parse_zoom(deps["zoom"]), deps["static_visible"], deps["dynamic_visible"])  # support_sst
+	for key, render in view_images(deps=deps):
+		if not render_cache.contains(key):
+			render_cache.put(key, render(scene))
+
+@timed("streamlit_app.play_years")
+def play_years(map_placeholder, interval=0.6):
+	"""
+	Shows the map of every year in map_placeholder, frames missing from render_cache are rendered here
+	"""
+	biomass_obj = sst["biomass_obj"]
+	for year in biomass_obj.years:
+		def render():
+			biomass_obj.change_year(year)
+			return fig_to_png(biomass_obj.fig)
+
+		map_png = cached_image(map_key(year), render)
+		map_placeholder.image(map_png, width="stretch", caption=str(year))
+		time.sleep(interval)
+
+	# back to the selected year
+	biomass_obj.change_year(sst["selected_year"])
+	with map_placeholder:
+		create_fig()
 
+def mark_first_paint():
+	"""
+	Seconds from the start of the first run of the session to the first map sent to the browser
+	(the imports included, for the first session of the process)
+	"""
+	if "first_paint" in sst:
+		return
+	sst["first_paint"] = time.perf_counter() - sst["session_start"]
+	record_first("first paint", sst["first_paint"])
+	logger.info(f"First paint of the session in {sst['first_paint']:.2f} s")
+
+@timed("streamlit_app.create_legend")
 def create_legend():
 	units_list = [k for k in sst.keys() if k.startswith("static_unit_obj#") or k.startswith("dynamic_unit_obj#")]
-	fig, ax = plt.subplots()
-	ax.axis("off")
+	entries = list()
 
 	for unit in units_list:
 		marker = sst[unit].marker
@@ -166,15 +768,91 @@ def create_legend():
 		except:
 			color = "black"
 
-		ax.scatter(0,0, marker=marker, label=unit_type, color=color)
+		entries.append( (marker, unit_type, color) )
 
-	ax.legend(framealpha=1, loc="center")
+	legend_array = render_legend(tuple(entries))
 
-	legend_array = sst["biomass_obj"].fig_to_array(fig)
-	legend_array = sst["biomass_obj"].remove_white_spaces(legend_array)
+	st.image(np.ascontiguousarray(legend_array))
 
-	st.image(legend_array)
+def units_by_type(dynamic_only=False):
+	# {unit_type: sst key} of the unit layers
+	prefixes = ("dynamic_unit_obj#",) if dynamic_only else ("static_unit_obj#", "dynamic_unit_obj#")
+	return {sst[k].unit_type: k for k in sorted(sst.keys()) if k.startswith(prefixes)}
 
+def unit_layer_deps(unit_key):
+	# what the data of the unit layer of unit_key depends on (see update_pipeline_deps)
+	deps = sst["pipeline_deps"]
+	return deps["dynamic_units"] if unit_key.startswith("dynamic_unit_obj#") else deps["static_units"]
+
+@timed("streamlit_app.create_radius_table")
+def create_radius_table():
+	units_dict = units_by_type()
+	if not units_dict:
+		return
+
+	unit_type = st.selectbox(label="Unidades:", options=list(units_dict.keys()), key="radius_units")
+	radius_km = st.number_input(label="Raio (km):", min_value=1, value=100, step=10, key="radius_km")
+	mode = st.radio(
+		label="Cálculo:",
+		options=["centroid", "area"],
+		format_func=lambda m: {"centroid": "Centroide das regiões", "area": "Área das regiões dentro do raio"}[m],
+		horizontal=True,
+		key="radius_mode"
+	)
+	st.checkbox(label="Mostrar os raios no mapa", key="radius_overlay")
+
+	# the values of the regions change with the biomass and the year, the units with their layer
+	unit_key = units_dict[unit_type]
+	deps = sst["pipeline_deps"]
+	radius_df = cached_table(
+		("radius", deps["biomass_obj"], deps["year"], unit_layer_deps(unit_key), unit_key, radius_km, mode),
+		lambda: biomass_within_radius(sst[unit_key].df, sst["biomass_obj"], radius_km, mode=mode)
+	)
+	st.dataframe(radius_df, hide_index=True)
+
+def sourcing_result(unit_key, radius_km):
+	"""
+	(flows_df, units_summary_df) of solve_sourcing, solved once per biomass, year, unit layer and radius
+	The units of the layer must be convertible to the unit of the biomass (sourcing_unit_factor)
+	"""
+	# scipy is imported here on first use, after the map is sent (startup.start_warmup imports it earlier)
+	from sourcing import solve_sourcing
+	deps = sst["pipeline_deps"]
+	return cached_table(
+		("sourcing", deps["biomass_obj"], deps["year"], unit_layer_deps(unit_key), unit_key, radius_km),
+		lambda: solve_sourcing(sst[unit_key].df, sst["biomass_obj"], radius_km, demand_unit=sst[unit_key].specs_dict["unidade"])
+	)
+
+def sourcing_unit_factor(unit_key):
+	# factor from the unit of the demand of the layer to the unit of the biomass, None when there is none
+	from sourcing import unit_factor
+	return unit_factor(sst[unit_key].specs_dict["unidade"], sst["biomass_obj"].unit)
+
+@timed("streamlit_app.create_sourcing_tables")
+def create_sourcing_tables():
+	# the coef of the dynamic units is their demand
+	units_dict = units_by_type(dynamic_only=True)
+	if not units_dict:
+		return
+
+	unit_type = st.selectbox(label="Unidades:", options=list(units_dict.keys()), key="sourcing_units")
+	radius_km = st.number_input(label="Distância máxima (km):", min_value=1, value=200, step=10, key="sourcing_radius")
+	st.checkbox(label="Mostrar os fluxos no mapa", key="sourcing_overlay")
+
+	demand_unit = sst[units_dict[unit_type]].specs_dict["unidade"]
+	if sourcing_unit_factor(units_dict[unit_type]) is None:
+		st.warning(
+			f"A demanda de {unit_type} está em {demand_unit} e a biomassa em {sst['biomass_obj'].unit}, "
+			"as unidades não podem ser convertidas."
+		)
+		return
+	st.caption(f"Demanda ({demand_unit}) convertida para {sst['biomass_obj'].unit}, a unidade da biomassa.")
+
+	flows_df, units_summary_df = sourcing_result(units_dict[unit_type], radius_km)
+	st.dataframe(units_summary_df, hide_index=True)
+	st.dataframe(flows_df.drop(columns=["unit_idx", "region_idx"]), hide_index=True)
+
+@timed("streamlit_app.create_columns")
 def create_columns():
 	units_list = [k for k in sst.keys() if k.startswith("dynamic_unit_obj#") or k == "biomass_obj"]
 	col_list = [1,2] + [1/len(units_list) for _ in range(len(units_list))]
@@ -183,7 +861,8 @@ def create_columns():
 	# widgets column
 	with col_list[0]:
 		create_uf_selector()
-		update_biomass_obj_uf()
+		create_zoom_selector()
+		play = create_year_selector()
 
 		st.write("Selecione as unidades desejadas:")
 		create_static_unit_checkboxes()
@@ -193,13 +872,19 @@ def create_columns():
 
 	# map (fig) column
 	with col_list[1]:
-		create_fig()
+		map_placeholder = st.empty()
+		with map_placeholder:
+			create_fig()
+		mark_first_paint()
+		if play:
+			play_years(map_placeholder)
 
 	# All cbar legends
 	for unit_idx, unit in enumerate(units_list):
 		col_idx = unit_idx + 2  # 2 columns already created
 		with col_list[col_idx]:
-			st.image(sst[unit].cbar_array)
+			cbar_png = cached_image(colorbar_key(unit), lambda: array_to_png(sst[unit].cbar_array))
+			st.image(cbar_png)
 
 def main():
 	st.set_page_config(
@@ -208,33 +893,50 @@ def main():
 		page_icon="copaenergialogo.ico"
 	)
 
-	init_sst()
+	with record_rerun(enabled=perf_panel_requested()) as record:
+		init_sst()
+
+		make_biomass_selectors()
+		get_biomass_prefix()
+		make_layer_selectors()
+		update_pipeline_deps()
+		run_build_stages()
+		update_year()
+		run_view_stages()
+		prerender_years()
+		prerender_ufs()
 
-	make_biomass_selectors()
-	get_biomass_prefix()
-	create_biomass_obj()
+		logos, title_c = st.columns((1, 2))
+		with logos:
+			st.image("logos.png")
+		with title_c:
+			st.title("Distribuição de biomassa no Brasil")
 
-	logos, title_c = st.columns((1, 2))
-	with logos:
-		st.image("logos.png")
-	with title_c:
-		st.title("Distribuição de biomassa no Brasil")
+		st.markdown("---")
 
-	st.markdown("---")
 
+		create_columns()
 
 
-	create_static_unit_objs()
-	update_static_unit_objs()
-	create_dynamic_units_objs()
-	update_dynamic_unit_objs()
+		with st.expander("Produção por estado"):
+			st.dataframe(sst["biomass_obj"].production_by_uf(), hide_index=True)
 
+		with st.expander("Biomassa no raio das unidades"):
+			create_radius_table()
 
-	create_columns()
+		with st.expander("Abastecimento das unidades"):
+			create_sourcing_tables()
 
+		st.write("Fonte:", sst["biomass_obj"].source)
+		st.write("Observações:", sst["biomass_obj"].obs)
+		st.write("App criado por Roger Sampaio Bif")
+		show_stage_log()
+		if record is not None:
+			record.label = ", ".join(name for name, ran, seconds in sst["stage_log"] if ran)
 
-	st.write("Fonte:", sst["biomass_obj"].source)
-	st.write("Observações:", sst["biomass_obj"].obs)
-	st.write("App criado por Roger Sampaio Bif")
+	if record is not None:
+		add_perf_record(record)
+		if perf_panel_requested():
+			show_perf_panel()
 if __name__ == "__main__":
 	main()
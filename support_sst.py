@@ -1,8 +1,8 @@
-from os import listdir
-from os.path import isfile, join
-import json
 import streamlit as st
 
+from geometry_store import available_region_types, load_geometry
+from dataset_catalog import dataset_catalog
+
 uf_dict =  {
 	'Brasil': 'Brasil',
 	'Acre': 'AC',
@@ -36,23 +36,12 @@ uf_dict =  {
 
 def create_biomass_prefixes_list():
 	# biomass_prefixes_list = [(prefix1, biomass_type1, biomass_name1), ... ]
-	biomass_path = "./biomass"
-	onlyfiles = [f for f in listdir(biomass_path) if isfile(join(biomass_path, f))]
-	onlyfiles = [f for f in onlyfiles if f.endswith(".json")]
-
-	biomass_prefixes_list = list()
-	for file in onlyfiles:
-		prefix = file.split(".")[0]
-
-		with open(f"{biomass_path}/{file}", "r", encoding="utf-8") as f:
-			json_dict = json.load(f)
-
-		biomass_type = json_dict["tipo_biomassa"]
-		biomass_name = json_dict["nome_biomassa"]
+	table = dataset_catalog.get_table()
 
-		biomass_prefixes_list.append( (prefix, biomass_type, biomass_name) )
+	# Datasets whose region type has no geometry file (e.g. "mun" without map_files/geometry/mun.json) can not be drawn
+	table = table.loc[table.tipo_regiao.isin(available_region_types())]
 
-	return biomass_prefixes_list
+	return list(zip(table.index, table.tipo_biomassa, table.nome_biomassa))
 
 
 
@@ -67,4 +56,30 @@ def create_biomass_types_dict():
 		except KeyError:
 			biomass_types_dict[biomass_type] = [biomass_name]
 
-	return biomass_types_dict
\ No newline at end of file
+	return biomass_types_dict
+
+
+zoom_labels = {"meso": "Mesorregião", "micro": "Microrregião"}
+
+def create_zoom_options(uf):
+	"""
+	uf: "Brasil" or a uf abbreviation
+	Returns {zoom: label} with "" (the whole uf) and the meso / microregions of uf, zoom is "{region_type}:{cod_ibge}"
+	"""
+	zoom_options = {"": "Todo o Brasil" if uf == "Brasil" else "Todo o estado"}
+	for region_type, label in zoom_labels.items():
+		if region_type not in available_region_types():
+			continue
+		region_df = load_geometry(region_type).to_frame()
+		if uf != "Brasil":
+			region_df = region_df.loc[region_df.uf == uf]
+		for cod_ibge, nome in sorted(zip(region_df.cod_ibge, region_df.nome), key=lambda tup: tup[1]):
+			zoom_options[f"{region_type}:{cod_ibge}"] = f"{label}: {nome}"
+	return zoom_options
+
+def parse_zoom(zoom):
+	# "{region_type}:{cod_ibge}" -> (region_type, cod_ibge), "" -> None
+	if not zoom:
+		return None
+	region_type, cod_ibge = zoom.split(":")
+	return region_type, int(cod_ibge)
@@ -0,0 +1,301 @@
+"""
+TopoJSON export of the geometry stores, for maps drawn by the browser
+
+Neighbouring regions share their borders vertex by vertex, so every border is written once as an arc
+used by both regions (reversed by one of them, "~idx" in TopoJSON). The arcs are found on quantized
+coordinates:
+	1. a vertex is a junction when the rings that go through it do not all have the same neighbours there
+	   (snap_borders first makes the two sides of a border identical, the source regions were simplified one by one)
+	2. every ring is cut at its junctions, equal (or reversed) pieces become the same arc
+	3. each arc is simplified with Douglas-Peucker keeping its ends, so shared borders stay shared at every level
+
+The payload of each (region type, level of detail) is built once, gzipped and kept in
+map_files/store/topojson/ (rebuilt when the geometry json changes) and in memory.
+values_payload() is what changes with the view: the values, colors and visible ufs of a BiomassMap.
+
+Usage:
+	python topojson_export.py            builds the payloads of every region type and level, prints their sizes
+"""
+import os
+import gzip
+import json
+import argparse
+import tempfile
+import threading
+import numpy as np
+import pandas as pd
+import matplotlib
+
+from geometry_store import load_geometry, store_path, store_meta, lod_tolerances, douglas_peucker, available_region_types
+
+topojson_path = f"{store_path}/topojson"
+quantization = 100_000
+# Largest difference (in degrees) between the two versions of a border merged by snap_borders
+snap_tolerance = 0.02
+
+# {(region_type, level): gzipped payload}
+payloads = dict()
+# {(region_type, level): lock held while that payload is read or built}, payloads_lock guards both dicts
+payload_locks = dict()
+payloads_lock = threading.Lock()
+
+
+def quantize_rings(store):
+	"""
+	Returns (rings, translate, scale): the rings of store in integer coordinates, without the closing vertex
+	and without consecutive repeated vertices
+	"""
+	x_min, y_min = store.coords.min(axis=0)
+	x_max, y_max = store.coords.max(axis=0)
+	translate = np.array([x_min, y_min])
+	scale = np.array([x_max - x_min, y_max - y_min]) / (quantization - 1)
+
+	rings = list()
+	for ring in store.rings():
+		ring = np.round((np.asarray(ring) - translate) / scale).astype(np.int64)
+		if len(ring) > 1 and np.array_equal(ring[0], ring[-1]):
+			ring = ring[:-1]
+		repeated = np.all(ring == np.roll(ring, 1, axis=0), axis=1)
+		if len(ring) > 1:
+			ring = ring[~repeated]
+		rings.append(ring)
+	return rings, translate, scale
+
+def snap_borders(rings, tolerance):
+	"""
+	The source regions were simplified one by one, so two neighbours share only part of the vertices of
+	their border. Between two consecutive vertices used by more than one ring, the pieces of different rings
+	with the same ends (and bounding boxes within tolerance) are the same border: every ring gets the
+	piece of the first ring that had it, so the border becomes a single arc
+	"""
+	keys = [ring[:, 0] * quantization + ring[:, 1] for ring in rings]
+	ring_keys = pd.DataFrame({
+		"key": np.concatenate(keys),
+		"ring": np.repeat(np.arange(len(rings)), [len(ring) for ring in rings]),
+	}).drop_duplicates()
+	n_rings = ring_keys.groupby("key").size()
+	shared_keys = n_rings.index[n_rings > 1].to_numpy()
+
+	def same_border(piece, other):
+		bounds = np.concatenate([piece.min(axis=0), piece.max(axis=0)])
+		other_bounds = np.concatenate([other.min(axis=0), other.max(axis=0)])
+		return np.all(np.abs(bounds - other_bounds) <= tolerance)
+
+	# {(start key, end key): (ring, piece)}
+	pieces = dict()
+	snapped = list()
+	for idx, (ring, ring_key) in enumerate(zip(rings, keys)):
+		cuts = np.flatnonzero(np.isin(ring_key, shared_keys))
+		if len(cuts) < 2:
+			snapped.append(ring)
+			continue
+
+		ring = np.vstack([np.roll(ring, -cuts[0], axis=0), ring[cuts[:1]]])
+		ring_key = np.append(np.roll(ring_key, -cuts[0]), ring_key[cuts[0]])
+		cuts = np.append(cuts - cuts[0], len(ring) - 1)
+
+		new_ring = list()
+		for start, end in zip(cuts[:-1], cuts[1:]):
+			piece = ring[start:end + 1]
+			ends = (ring_key[start], ring_key[end])
+			if ends[0] != ends[1]:
+				forward = pieces.get(ends)
+				backward = pieces.get(ends[::-1])
+				if forward is not None and forward[0] != idx and same_border(piece, forward[1]):
+					piece = forward[1]
+				elif backward is not None and backward[0] != idx and same_border(piece, backward[1]):
+					piece = backward[1][::-1]
+				elif forward is None:
+					pieces[ends] = (idx, piece)
+			new_ring.append(piece[:-1])
+		snapped.append(np.vstack(new_ring))
+	return snapped
+
+def find_junctions(rings):
+	"""
+	Returns one boolean array per ring, True on the vertices where arcs must start or end
+	"""
+	keys = [ring[:, 0] * quantization + ring[:, 1] for ring in rings]
+	key = np.concatenate(keys)
+	prev_key = np.concatenate([np.roll(ring_keys, 1) for ring_keys in keys])
+	next_key = np.concatenate([np.roll(ring_keys, -1) for ring_keys in keys])
+
+	# the neighbours of a vertex, in any order
+	neighbours = pd.DataFrame({
+		"key": key,
+		"low": np.minimum(prev_key, next_key),
+		"high": np.maximum(prev_key, next_key),
+	}).drop_duplicates()
+	n_neighbours = neighbours.groupby("key").size()
+	junction_keys = n_neighbours.index[n_neighbours > 1].to_numpy()
+
+	is_junction = np.isin(key, junction_keys)
+	offsets = np.cumsum([0] + [len(ring_keys) for ring_keys in keys])
+	return [is_junction[offsets[idx]:offsets[idx + 1]] for idx in range(len(rings))], keys
+
+def cut_rings(rings):
+	"""
+	Returns (arcs, ring_arcs): the distinct arcs (integer coordinates) and the list of arc indexes of every ring,
+	~idx when the ring goes through arc idx backwards
+	"""
+	junctions, keys = find_junctions(rings)
+	arcs = list()
+	arc_index = dict()
+
+	def add_arc(points, point_keys):
+		forward = tuple(point_keys)
+		if forward in arc_index:
+			return arc_index[forward]
+		backward = forward[::-1]
+		if backward in arc_index:
+			return ~arc_index[backward]
+		arc_index[forward] = len(arcs)
+		arcs.append(points)
+		return arc_index[forward]
+
+	ring_arcs = list()
+	for ring, ring_keys, is_junction in zip(rings, keys, junctions):
+		cuts = np.flatnonzero(is_junction)
+		if len(cuts) == 0:
+			# a ring that touches no other one is a single closed arc starting at its smallest vertex
+			start = int(np.argmin(ring_keys))
+			cuts = np.array([start])
+
+		ring = np.roll(ring, -cuts[0], axis=0)
+		ring_keys = np.roll(ring_keys, -cuts[0])
+		cuts = np.append(cuts - cuts[0], len(ring))
+		ring = np.vstack([ring, ring[:1]])
+		ring_keys = np.append(ring_keys, ring_keys[0])
+
+		ring_arcs.append([add_arc(ring[start:end + 1], ring_keys[start:end + 1]) for start, end in zip(cuts[:-1], cuts[1:])])
+	return arcs, ring_arcs
+
+def build_topology(region_type, level=0):
+	"""
+	TopoJSON dict of the regions of region_type, one Polygon per region with id cod_ibge and properties nome and uf
+	"""
+	store = load_geometry(region_type)
+	rings, translate, scale = quantize_rings(store)
+	rings = snap_borders(rings, snap_tolerance / scale.min())
+	arcs, ring_arcs = cut_rings(rings)
+
+	tolerance = lod_tolerances[level] / scale.min()
+	encoded_arcs = list()
+	for arc in arcs:
+		arc = douglas_peucker(arc, tolerance)
+		# delta encoding: first point absolute, the others relative to the previous one
+		encoded_arcs.append(np.vstack([arc[:1], np.diff(arc, axis=0)]).tolist())
+
+	geometries = [
+		{
+			"type": "Polygon",
+			"arcs": [arc_list],
+			"id": int(cod_ibge),
+			"properties": {"nome": str(nome), "uf": str(uf)},
+		}
+		for arc_list, cod_ibge, nome, uf in zip(ring_arcs, store.cod_ibge, store.nome, store.uf)
+	]
+	return {
+		"type": "Topology",
+		"transform": {"scale": scale.tolist(), "translate": translate.tolist()},
+		"objects": {region_type: {"type": "GeometryCollection", "geometries": geometries}},
+		"arcs": encoded_arcs,
+	}
+
+def payload_meta(region_type, level):
+	return dict(store_meta(region_type), level=level, quantization=quantization)
+
+def topology_payload(region_type, level=0):
+	"""
+	Gzipped TopoJSON of (region_type, level), built once and kept on disk and in memory
+	A build only holds the lock of its own (region_type, level), the other payloads are served meanwhile
+	"""
+	key = (region_type, level)
+	with payloads_lock:
+		if key in payloads:
+			return payloads[key]
+		key_lock = payload_locks.setdefault(key, threading.Lock())
+
+	with key_lock:
+		if key in payloads:
+			return payloads[key]
+
+		folder = f"{topojson_path}/{region_type}_{level}"
+		try:
+			with open(f"{folder}/meta.json", "r", encoding="utf-8") as file:
+				up_to_date = json.load(file) == payload_meta(region_type, level)
+		except FileNotFoundError:
+			up_to_date = False
+
+		if up_to_date:
+			with open(f"{folder}/topology.json.gz", "rb") as file:
+				payload = file.read()
+		else:
+			topology = build_topology(region_type, level)
+			payload = gzip.compress(json.dumps(topology, separators=(",", ":")).encode("utf-8"))
+			os.makedirs(folder, exist_ok=True)
+			# temp files of their own, so processes building the same payload never write each other's file
+			descriptor, tmp_path = tempfile.mkstemp(dir=folder, prefix="topology.", suffix=".tmp")
+			with os.fdopen(descriptor, "wb") as file:
+				file.write(payload)
+			os.replace(tmp_path, f"{folder}/topology.json.gz")
+			# meta.json is written last, an interrupted build is redone
+			descriptor, tmp_path = tempfile.mkstemp(dir=folder, prefix="meta.", suffix=".tmp")
+			with os.fdopen(descriptor, "w", encoding="utf-8") as file:
+				json.dump(payload_meta(region_type, level), file)
+			os.replace(tmp_path, f"{folder}/meta.json")
+
+		with payloads_lock:
+			payloads[key] = payload
+		return payload
+
+def values_payload(biomass_obj, n_colors=256):
+	"""
+	What the browser needs to color the topology of biomass_obj.region_type for the current view:
+	the value of every region, the colormap as a list of n_colors hex colors and the normalization
+	"""
+	lut = [matplotlib.colors.to_hex(color) for color in biomass_obj.cmap(np.linspace(0, 1, n_colors))]
+	return {
+		"region_type": biomass_obj.region_type,
+		"level": int(biomass_obj.lod_level),
+		"title": biomass_obj.ax.get_title(),
+		"label": f"Produção de {biomass_obj.biomass_name} ({biomass_obj.unit})",
+		"cod_ibge": [int(cod) for cod in biomass_obj.region_cod],
+		"values": [float(value) for value in biomass_obj.region_values],
+		"norm": biomass_obj.norm_type,
+		"vmin": float(biomass_obj.norm.vmin),
+		"vmax": float(biomass_obj.norm.vmax),
+		"colors": lut,
+		"base_color": matplotlib.colors.to_hex(biomass_obj.base_colors[0]),
+		"visible_ufs": sorted(biomass_obj.visible_ufs),
+		"bbox": [coord for corner in biomass_obj.view_bbox for coord in corner],
+	}
+
+def geojson_size(region_type, level=0):
+	# Size of the same regions as plain GeoJSON (5 decimals), for comparison
+	store = load_geometry(region_type)
+	features = [
+		{"type": "Feature", "id": int(cod_ibge), "geometry": {"type": "Polygon", "coordinates": [np.round(np.asarray(ring), 5).tolist()]}}
+		for cod_ibge, ring in zip(store.cod_ibge, store.rings(level=level))
+	]
+	dumped = json.dumps({"type": "FeatureCollection", "features": features}, separators=(",", ":")).encode("utf-8")
+	return len(dumped), len(gzip.compress(dumped))
+
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Builds the gzipped TopoJSON payloads of the geometry stores")
+	parser.add_argument("region_types", nargs="*", help="uf, meso, micro, ... (default: every json file)")
+	args = parser.parse_args()
+
+	for region_type in args.region_types or available_region_types():
+		for level in range(len(lod_tolerances)):
+			payload = topology_payload(region_type, level)
+			topology = json.loads(gzip.decompress(payload))
+			n_vertices = sum(len(arc) for arc in topology["arcs"])
+			geojson_bytes, geojson_gz = geojson_size(region_type, level)
+			print(
+				f"{region_type} level {level}: {len(topology['arcs'])} arcs, {n_vertices} vertices, "
+				f"{len(gzip.decompress(payload)) / 1e3:.0f} kB ({len(payload) / 1e3:.0f} kB gzipped), "
+				f"GeoJSON {geojson_bytes / 1e3:.0f} kB ({geojson_gz / 1e3:.0f} kB gzipped)"
+			)
@@ -0,0 +1,35 @@
+import pandas as pd
+
+
+def create_uf_stats(df, value_column, uf_column="uf", quantiles=(0.25, 0.5, 0.75)):
+	"""
+	df: pandas.DataFrame
+	value_column: str
+		"qnt_produzida" for BiomassMap, "coef" for DynamicUnits
+
+	Returns a DataFrame indexed by uf with the columns min, max, sum, count, q25, q50, q75 (one per quantile)
+	The "Brasil" row has the same statistics for the whole df
+	Every uf is computed from a single groupby, later lookups are just .loc / .at
+	"""
+	quantile_columns = [f"q{round(q * 100)}" for q in quantiles]
+	grouped = df.groupby(uf_column)[value_column]
+
+	uf_stats = grouped.agg(["min", "max", "sum", "count"])
+	if len(df) > 0:
+		uf_quantiles = grouped.quantile(list(quantiles)).unstack()
+		uf_quantiles.columns = quantile_columns
+		uf_stats = uf_stats.join(uf_quantiles)
+	else:
+		uf_stats[quantile_columns] = float("nan")
+
+	values = df[value_column]
+	brasil_row = [values.min(), values.max(), values.sum(), values.count()] + list(values.quantile(list(quantiles)))
+	uf_stats.loc["Brasil"] = brasil_row
+	uf_stats["count"] = uf_stats["count"].astype(int)
+	return uf_stats
+
+def get_stat(uf_stats, uf, stat):
+	# NaN when there is no data for uf
+	if uf in uf_stats.index:
+		return uf_stats.at[uf, stat]
+	return float("nan")